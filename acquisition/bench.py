@@ -0,0 +1,143 @@
+# T. Atkins, 2024
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from pathlib import Path
+from typing import List
+
+# Repository root (for the shared 'acquisition' package)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from acquisition.emulator import HX711Emulator, tx_script
+from acquisition.protocol import FRAME_SIZE
+from acquisition.reader import Stats, acquire
+from acquisition.stream import Session, load_raw
+
+BAUDS = [9600, 115200, 250000, 500000, 1000000, 2000000]
+# Approximate length [bytes] of a load line (e.g. '0.12345\r\n') and of a frame, to size the tests
+LINE_BYTES = {"text": 9, "binary": FRAME_SIZE}
+
+
+def bench_receiver(
+    baud: int | None,
+    duration: float = 2.0,
+    sample_rate: float | None = None,
+    raw: str = "npy",
+    protocol: str = "text",
+) -> dict:
+    """
+    FUNCTION
+    > Run the receiver pipeline (acquisition.reader.acquire() into a Session, as tsf_rx() does) against an HX711Emulator for about 'duration' seconds
+    > 'baud' None (and 'sample_rate' None) sends as fast as the receiver can read, i.e. measures its maximum throughput
+    > 'protocol' is that of the emulated sketch: 'text' or 'binary' (see acquisition/protocol.py)
+    > Returns the sustained rate [samples/s], the parse latency (time from a chunk being read off the port to its readings being stored) [ms] and the data loss
+    """
+    if baud is None:
+        n_samples = 500000
+    else:
+        rate = baud / (10 * LINE_BYTES[protocol])
+        if sample_rate is not None:
+            rate = min(rate, sample_rate)
+        n_samples = max(int(duration * rate), 100)
+    readings = tx_script(n_samples)
+    emulator = HX711Emulator(
+        readings, baud=baud, sample_rate=sample_rate, protocol=protocol
+    )
+
+    with tempfile.TemporaryDirectory() as folder:
+        raw_file = os.path.join(folder, f"bench_raw.{raw}")
+        session = Session(
+            os.path.join(folder, "bench.csv"), lambda load, idx: [load], raw_file
+        )
+        latencies = []
+        stats = Stats()
+
+        def feed_many(t: np.ndarray, values: np.ndarray) -> bool:
+            running = session.feed_many(t, values)
+            # NB: from the time the chunk was read off the port (rather than the timestamps of the readings, which are those of the Arduino with the binary protocol)
+            latencies.append(time.monotonic() - stats.t_chunk)
+            return running
+
+        # NB: the status line is disabled, so that the timings are not those of the terminal (and the line does not interleave with the table of bench())
+        t_start = time.monotonic()
+        acquire(
+            emulator, feed_many, status_interval=None, protocol=protocol, stats=stats
+        )
+        elapsed = time.monotonic() - t_start
+        session.close()
+        if raw == "npy":
+            stored = load_raw(raw_file).shape[0]
+        else:
+            stored = np.loadtxt(raw_file, delimiter=",", ndmin=2).shape[0]
+
+    latencies = np.array(latencies) * 1e3
+    return {
+        "baud": baud,
+        "sent": n_samples,
+        "stored": stored,
+        "lost": n_samples - stored,
+        "dropped_lines": stats.dropped_lines,
+        "dropped_bytes": stats.dropped_bytes,
+        "gaps": stats.gaps,
+        "rate": stats.samples / elapsed,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p99": float(np.percentile(latencies, 99)),
+        "latency_max": float(latencies.max()),
+    }
+
+
+def bench(
+    bauds: List[int | None] = BAUDS + [None],
+    duration: float = 2.0,
+    raw: str = "npy",
+    protocol: str = "text",
+) -> List[dict]:
+    """
+    FUNCTION
+    > Run bench_receiver() at every baud rate of 'bauds' (None: unlimited) and print the results as a table
+    """
+    results = []
+    print(
+        f"{'baud':>10} {'sent':>8} {'lost':>6} {'samples/s':>11} {'p50 [ms]':>9} {'p99 [ms]':>9} {'max [ms]':>9}"
+    )
+    for baud in bauds:
+        res = bench_receiver(baud, duration, raw=raw, protocol=protocol)
+        results.append(res)
+        print(
+            f"{str(baud or 'unlimited'):>10} {res['sent']:>8} {res['lost']:>6} {res['rate']:>11.0f} {res['latency_p50']:>9.2f} {res['latency_p99']:>9.2f} {res['latency_max']:>9.2f}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    # Usage examples (from the repository root):
+    # python acquisition/bench.py
+    # python acquisition/bench.py --baud 9600 115200 --duration 5 --max-loss 0
+    parser = argparse.ArgumentParser(
+        description="Benchmark the serial receivers against an emulated HX711 sketch."
+    )
+    parser.add_argument(
+        "--baud",
+        nargs="+",
+        type=int,
+        default=BAUDS,
+        help="baud rates to test (0: unlimited)",
+    )
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--raw", choices=["npy", "csv"], default="npy")
+    parser.add_argument("--protocol", choices=["text", "binary"], default="text")
+    parser.add_argument(
+        "--max-loss",
+        type=int,
+        default=None,
+        help="exit with an error if more samples are lost at any baud rate (e.g. 0 on CI)",
+    )
+    args = parser.parse_args()
+
+    results = bench(
+        [b or None for b in args.baud], args.duration, args.raw, args.protocol
+    )
+    if args.max_loss is not None and any(r["lost"] > args.max_loss for r in results):
+        sys.exit(1)
@@ -0,0 +1,344 @@
+# T. Atkins, 2024
+import argparse
+import datetime
+import json
+import os
+import sys
+import numpy as np
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+# Repository root (for the shared 'acquisition' package)
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+from acquisition.dsp import AutoCapture, MovingMedian, Pipeline, PlateauDetector
+from acquisition.reader import acquire
+from acquisition.stream import RECORD_CODE, STOP_CODE, Session, load_raw
+
+# Host-side calibration of the load cells: the load [kg] is a polynomial of the (tared) HX711 count, fitted by least squares to readings of known weights
+# > The profiles of every load cell are kept in PROFILE_DIR as '[cell].json', one version per calibration (the latest is used by default), so that recalibrating or switching cells does not require reflashing the sketches
+# > The sketches still send loads scaled by their own calibration factor: the count is recovered by multiplying by that factor (sent by the sketch with the binary protocol, or 'firmware_factor' of the profile with the text protocol)
+PROFILE_DIR = ROOT / "lc_calibration" / "profiles"
+# Degree of the polynomial: 'linear' (scale and offset) or 'quadratic' (plus a nonlinearity term)
+MODELS = {"linear": 1, "quadratic": 2}
+# Calibration factors flashed in tsf_tx.ino / ttf_tx.ino (the default 'firmware_factor' of the profiles), and that of lc_calibration.ino
+FIRMWARE_FACTORS = {"LC-A": -212100.0, "LC-B": 210000.0}
+SKETCH_FACTOR = 210000.0
+# lc_calibration.ino sends e.g. "Reading: 1.2345 kg calibration_factor: -7050.00"
+LC_PATTERN = rb"Reading:\s*(-?[0-9]+\.?[0-9]*)"
+# Plateaus of the calibration weights (see acquisition.dsp.AutoCapture): settled for HOLD_TIME [s], and at least MIN_STEP [kg] apart
+HOLD_TIME = 2.0
+MIN_STEP = 0.01
+
+
+class Calibration:
+    """
+    CLASS
+    > Calibration of a load cell: load [kg] = coeffs[0] + coeffs[1] * count (+ coeffs[2] * count^2), with 'count' the tared HX711 count
+    > 'firmware_factor' is the calibration factor of the sketch, used to recover the counts from the loads sent with the text protocol
+    > 'info' holds the details of the fit (see fit_calibration()), as stored in the profile
+    """
+
+    def __init__(
+        self,
+        coeffs: Sequence[float],
+        firmware_factor: float,
+        cell: str = "",
+        version: int | None = None,
+        info: dict | None = None,
+    ) -> None:
+        self.coeffs = np.asarray(coeffs, dtype=float)
+        self.firmware_factor = firmware_factor
+        self.cell = cell
+        self.version = version
+        self.info = info or {}
+
+    def to_kg(self, counts: np.ndarray) -> np.ndarray:
+        return np.polynomial.polynomial.polyval(counts, self.coeffs)
+
+    def apply(
+        self, values: np.ndarray, firmware_factor: float | None = None
+    ) -> np.ndarray:
+        """
+        FUNCTION
+        > Calibrate the loads [kg] sent by a sketch with calibration factor 'firmware_factor' (that of the profile by default), leaving the RECORD_CODE / STOP_CODE codes as they are
+        """
+        values = np.asarray(values, dtype=float)
+        factor = firmware_factor or self.firmware_factor
+        is_code = (values == RECORD_CODE) | (values == STOP_CODE)
+        return np.where(is_code, values, self.to_kg(values * factor))
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "coeffs": self.coeffs.tolist(),
+            "firmware_factor": self.firmware_factor,
+            **self.info,
+        }
+
+
+def fit_calibration(
+    counts: Sequence[float],
+    loads: Sequence[float],
+    model: str = "linear",
+    cell: str = "",
+    firmware_factor: float | None = None,
+) -> Calibration:
+    """
+    FUNCTION
+    > Fit a Calibration by least squares to the HX711 counts of known loads [kg] (e.g. the plateaus of a sequence of calibration weights)
+    > The counts are scaled to [-1, 1] for the fit, so that the quadratic term is well conditioned
+    > The details of the fit are kept in 'info': the points, the residuals (std and max [kg]) and the nonlinearity (max residual of the linear fit, as % of the full scale)
+    """
+    if model not in MODELS:
+        raise ValueError(
+            f"Model '{model}' not recognised: must be one of {list(MODELS)}."
+        )
+    counts = np.asarray(counts, dtype=float)
+    loads = np.asarray(loads, dtype=float)
+    degree = MODELS[model]
+    if counts.shape[0] < degree + 1:
+        raise ValueError(
+            f"At least {degree + 1} calibration points are needed for a {model} fit ({counts.shape[0]} given)."
+        )
+
+    scale = np.abs(counts).max() or 1.0
+    A = np.vander(counts / scale, degree + 1, increasing=True)
+    coeffs = np.linalg.lstsq(A, loads, rcond=None)[0] / scale ** np.arange(degree + 1)
+    residuals = loads - np.polynomial.polynomial.polyval(counts, coeffs)
+    linear = np.polynomial.polynomial.polyfit(counts, loads, 1)
+    full_scale = np.ptp(loads) or 1.0
+
+    if firmware_factor is None:
+        firmware_factor = FIRMWARE_FACTORS.get(cell, SKETCH_FACTOR)
+    info = {
+        "model": model,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "points": np.column_stack([counts, loads]).tolist(),
+        "residual_std": float(residuals.std()),
+        "residual_max": float(np.abs(residuals).max()),
+        "nonlinearity_pct": float(
+            100
+            * np.abs(loads - np.polynomial.polynomial.polyval(counts, linear)).max()
+            / full_scale
+        ),
+    }
+    return Calibration(coeffs, firmware_factor, cell, info=info)
+
+
+def _profile_file(cell: str, folder: str | Path = PROFILE_DIR) -> str:
+    return os.path.join(folder, f"{cell}.json")
+
+
+def save_profile(calibration: Calibration, folder: str | Path = PROFILE_DIR) -> int:
+    """
+    FUNCTION
+    > Add 'calibration' to the profile of its load cell as a new version (previous versions are kept); returns the version number
+    """
+    if not calibration.cell:
+        raise ValueError("The calibration has no load cell name.")
+    file = _profile_file(calibration.cell, folder)
+    try:
+        with open(file) as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        profile = {"cell": calibration.cell, "versions": []}
+    calibration.version = len(profile["versions"]) + 1
+    profile["versions"].append(calibration.to_dict())
+    os.makedirs(folder, exist_ok=True)
+    tmp_file = f"{file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(profile, f, indent=4)
+    os.replace(tmp_file, file)
+    return calibration.version
+
+
+def load_profile(
+    cell: str, version: int | None = None, folder: str | Path = PROFILE_DIR
+) -> Calibration:
+    """
+    FUNCTION
+    > Load the calibration of load cell 'cell': version 'version', or the latest one
+    """
+    try:
+        with open(_profile_file(cell, folder)) as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(
+            f"No calibration profile for load cell '{cell}' in {folder}."
+        ) from None
+    versions = profile["versions"]
+    if version is None:
+        version = len(versions)
+    if not 1 <= version <= len(versions):
+        raise ValueError(
+            f"Load cell '{cell}' has no calibration version {version} (latest: {len(versions)})."
+        )
+    entry = dict(versions[version - 1])
+    coeffs = entry.pop("coeffs")
+    firmware_factor = entry.pop("firmware_factor")
+    entry.pop("version")
+    return Calibration(coeffs, firmware_factor, cell, version, info=entry)
+
+
+def _capture_session(
+    weights: Sequence[float], hold: float, min_step: float, prompt: bool
+) -> Tuple[Session, List[list]]:
+    """
+    FUNCTION
+    > Return a Session (without files) that captures the plateau of every calibration weight, in order, and the list that receives the (reading, weight) points
+    """
+    points = []
+
+    def record(load: float, idx: int, plateau: dict | None = None) -> list:
+        print(
+            f"Weight {idx + 1}/{len(weights)} ({weights[idx]} kg): {load:.5f} kg (std {plateau['std']:.5f} kg)."
+        )
+        if prompt and idx + 1 < len(weights):
+            print(f"Place {weights[idx + 1]} kg on the LC.")
+        points.append([load, weights[idx]])
+        return points[-1]
+
+    session = Session(
+        None,
+        record,
+        dsp=Pipeline([MovingMedian()], plateau=PlateauDetector()),
+        auto_capture=AutoCapture(hold, min_step, len(weights), increasing=False),
+    )
+    return session, points
+
+
+def _counts(points: List[list], sketch_factor: float) -> Tuple[np.ndarray, np.ndarray]:
+    rows = np.array(points, dtype=float).reshape(-1, 2)
+    return rows[:, 0] * sketch_factor, rows[:, 1]
+
+
+def points_from_stream(
+    transport,
+    weights: Sequence[float],
+    sketch_factor: float = SKETCH_FACTOR,
+    hold: float = HOLD_TIME,
+    min_step: float = MIN_STEP,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    FUNCTION
+    > Read lc_calibration.ino over 'transport' (e.g. a serial.Serial) while the operator places the 'weights' [kg] on the load cell in turn, and return the HX711 count and load of every weight
+    > Every weight is captured once its reading has settled for 'hold' seconds (see acquisition.dsp.AutoCapture), so the sequence must not have the same weight twice in a row
+    > 'sketch_factor' is the calibration factor of the sketch, to recover the counts
+    """
+    session, points = _capture_session(weights, hold, min_step, prompt=True)
+    print(f"Place {weights[0]} kg on the LC.")
+    acquire(transport, session.feed_many, pattern=LC_PATTERN)
+    return _counts(points, sketch_factor)
+
+
+def points_from_log(
+    raw_file: str,
+    weights: Sequence[float],
+    sketch_factor: float = SKETCH_FACTOR,
+    hold: float = HOLD_TIME,
+    min_step: float = MIN_STEP,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    FUNCTION
+    > As points_from_stream(), from the raw log of a calibration run (e.g. that of an 'lc' rig of acquisition/service.py)
+    """
+    if raw_file.endswith(".npy"):
+        data = np.asarray(load_raw(raw_file))
+    else:
+        data = np.loadtxt(raw_file, delimiter=",", ndmin=2)
+    session, points = _capture_session(weights, hold, min_step, prompt=False)
+    session.feed_many(data[:, 0], data[:, 1])
+    session.close()
+    if len(points) < len(weights):
+        raise ValueError(
+            f"Only {len(points)} of the {len(weights)} calibration weights were found in {raw_file}."
+        )
+    return _counts(points, sketch_factor)
+
+
+def _print_calibration(calibration: Calibration) -> None:
+    info = calibration.info
+    terms = " + ".join(f"{c:.6e} * count^{k}" for k, c in enumerate(calibration.coeffs))
+    print(
+        f"{calibration.cell} ({info['model']}): load [kg] = {terms}\n"
+        f"Residuals: std {info['residual_std']:.5f} kg, max {info['residual_max']:.5f} kg; nonlinearity {info['nonlinearity_pct']:.3f} % of full scale."
+    )
+
+
+if __name__ == "__main__":
+    # Usage examples (from the repository root):
+    # python acquisition/calibration.py record --cell LC-B --port COM5 --weights 0 0.1 0.2 0.5 1.0
+    # python acquisition/calibration.py fit --cell LC-B --log output/lc_lc_raw.npy --weights 0 0.1 0.2 0.5 1.0 --model quadratic
+    # python acquisition/calibration.py show --cell LC-B
+    parser = argparse.ArgumentParser(
+        description="Calibrate a load cell from a sequence of known weights, and store its profile."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--cell", required=True, help="load cell name, e.g. LC-B")
+    fit_args = argparse.ArgumentParser(add_help=False)
+    fit_args.add_argument("--weights", nargs="+", type=float, required=True)
+    fit_args.add_argument("--model", choices=list(MODELS), default="linear")
+    fit_args.add_argument(
+        "--sketch-factor",
+        type=float,
+        default=SKETCH_FACTOR,
+        help="calibration factor of lc_calibration.ino",
+    )
+    fit_args.add_argument(
+        "--firmware-factor",
+        type=float,
+        default=None,
+        help="calibration factor of the test sketches (default: that of the cell in FIRMWARE_FACTORS)",
+    )
+    fit_args.add_argument("--hold", type=float, default=HOLD_TIME)
+    fit_args.add_argument(
+        "--dry-run", action="store_true", help="fit without saving the profile"
+    )
+    record_parser = sub.add_parser(
+        "record",
+        parents=[common, fit_args],
+        help="read the calibration sketch while the weights are placed",
+    )
+    record_parser.add_argument("--port", default="COM3")
+    record_parser.add_argument("--baud", type=int, default=9600)
+    log_parser = sub.add_parser(
+        "fit",
+        parents=[common, fit_args],
+        help="fit from the raw log of a calibration run",
+    )
+    log_parser.add_argument("--log", required=True)
+    show_parser = sub.add_parser(
+        "show", parents=[common], help="print a profile (latest version by default)"
+    )
+    show_parser.add_argument("--version", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "show":
+            _print_calibration(load_profile(args.cell, args.version))
+            sys.exit(0)
+        if args.command == "record":
+            import serial  # WARNING: refers to a package installed with 'pip install pyserial', NOT 'pip install serial'
+
+            transport = serial.Serial(port=args.port, baudrate=args.baud, timeout=0.1)
+            try:
+                counts, loads = points_from_stream(
+                    transport, args.weights, args.sketch_factor, args.hold
+                )
+            finally:
+                transport.close()
+        else:
+            counts, loads = points_from_log(
+                args.log, args.weights, args.sketch_factor, args.hold
+            )
+        calibration = fit_calibration(
+            counts, loads, args.model, args.cell, args.firmware_factor
+        )
+    except ValueError as e:
+        exit(f"ERROR: {e}")
+    _print_calibration(calibration)
+    if not args.dry_run:
+        version = save_profile(calibration)
+        print(f"Saved as version {version} of {_profile_file(args.cell)}.")
@@ -0,0 +1,387 @@
+# T. Atkins, 2024
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import List, Sequence, Tuple
+
+# Streaming signal processing of the load readings [kg], between the parser and the Session (see Session's 'dsp')
+# > Every stage processes one chunk of readings at a time (e.g. the readings parsed from one read of the serial port) and keeps its state between chunks, so that the output does not depend on how the stream was chunked
+# > The running stages (MovingAverage, RunningStats, LowPass) cost O(1) per sample, whatever their window or cut-off, and are vectorised over the chunk
+# > Windows are in samples: the defaults below are for the HX711 at 80 samples/s (RATE pin high, as on the rigs)
+SAMPLE_RATE = 80.0
+MEDIAN_WINDOW = 5  # rejects single-sample spikes
+CUTOFF = 5.0  # [Hz]
+STATS_WINDOW = 40  # 0.5 s
+# A window of readings is settled (i.e. the load has stopped moving) if its standard deviation is below PLATEAU_TOL [kg] (a few times the noise of the HX711 on the rigs, ~0.002 kg)
+PLATEAU_TOL = 0.005
+# A settled window is a tare window (i.e. the rig is unloaded) if it is within ZERO_BAND [kg] of the current zero
+# NB: a plateau under load that is within ZERO_BAND of zero would be taken for a tare window, so it must stay well below the smallest load recorded
+ZERO_BAND = 0.02
+# Minimum time between the two tare windows from which the drift rate is estimated [s]
+DRIFT_BASELINE = 10.0
+# Auto-capture (see AutoCapture): a plateau is taken as a record point once settled for HOLD_TIME [s], if it is at least MIN_STEP [kg] above the previous record point
+HOLD_TIME = 1.0
+MIN_STEP = 0.02
+
+
+class MovingAverage:
+    """
+    CLASS
+    > Moving average of the last 'n' readings (fewer at the start of the stream)
+    > Computed as a difference of cumulative sums over the chunk and the n-1 previous readings, so the cost per sample does not depend on 'n' and rounding errors do not build up over a long test
+    """
+
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self._hist = np.empty(0)
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        buf = np.concatenate((self._hist, x))
+        cs = np.concatenate(([0.0], np.cumsum(buf)))
+        end = np.arange(self._hist.shape[0] + 1, buf.shape[0] + 1)
+        start = np.maximum(end - self.n, 0)
+        self._hist = buf[-(self.n - 1) :] if self.n > 1 else np.empty(0)
+        return (cs[end] - cs[start]) / (end - start)
+
+
+class MovingMedian:
+    """
+    CLASS
+    > Moving median of the last 'n' readings (the first reading is repeated at the start of the stream), to reject spikes (e.g. a bad HX711 conversion) without smoothing steps
+    > NB: Unlike the other stages, the cost per sample grows with 'n' (the median of every window is computed, vectorised over the chunk): it is meant for short windows (3 to 9 readings)
+    """
+
+    def __init__(self, n: int = MEDIAN_WINDOW) -> None:
+        self.n = n
+        self._hist = None
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        if x.shape[0] == 0:
+            return x.copy()
+        if self._hist is None:
+            self._hist = np.full(self.n - 1, x[0])
+        buf = np.concatenate((self._hist, x))
+        self._hist = buf[-(self.n - 1) :] if self.n > 1 else np.empty(0)
+        return np.median(sliding_window_view(buf, self.n), axis=1)
+
+
+class LowPass:
+    """
+    CLASS
+    > First-order IIR low-pass filter (exponential smoothing), with a cut-off frequency of 'cutoff' [Hz] at 'sample_rate' readings/s: y[k] = y[k-1] + a (x[k] - y[k-1])
+    > The recursion is vectorised over the chunk in closed form, y[k] = b^k (y[0] + a sum_{j<=k} b^-j x[j]) with b = 1 - a, in blocks short enough for b^-k not to overflow
+    """
+
+    def __init__(
+        self, cutoff: float = CUTOFF, sample_rate: float = SAMPLE_RATE
+    ) -> None:
+        self.a = 1 - math.exp(-2 * math.pi * cutoff / sample_rate)
+        b = 1 - self.a
+        self._block = max(1, int(200 / -math.log10(b))) if 0 < b < 1 else 1
+        self._y = None
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        b = 1 - self.a
+        if x.shape[0] == 0 or b == 0:
+            return x.copy()
+        if self._y is None:
+            self._y = x[0]
+        y = np.empty_like(x)
+        for s in range(0, x.shape[0], self._block):
+            xs = x[s : s + self._block]
+            k = np.arange(1, xs.shape[0] + 1)
+            ys = (self._y + self.a * np.cumsum(xs * b**-k)) * b**k
+            y[s : s + xs.shape[0]] = ys
+            self._y = ys[-1]
+        return y
+
+
+class RunningStats:
+    """
+    CLASS
+    > Mean and standard deviation of the last 'n' readings, for every reading (with the number of readings in the window, fewer than 'n' at the start of the stream)
+    > As MovingAverage, from cumulative sums of the readings and of their squares (taken about the mean of the chunk, to avoid cancellation)
+    """
+
+    def __init__(self, n: int = STATS_WINDOW) -> None:
+        self.n = n
+        self._hist = np.empty(0)
+
+    def process(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        buf = np.concatenate((self._hist, x))
+        if buf.shape[0] == 0:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=int)
+        ref = buf.mean()
+        d = buf - ref
+        cs = np.concatenate(([0.0], np.cumsum(d)))
+        cs2 = np.concatenate(([0.0], np.cumsum(d * d)))
+        end = np.arange(self._hist.shape[0] + 1, buf.shape[0] + 1)
+        start = np.maximum(end - self.n, 0)
+        count = end - start
+        mean = (cs[end] - cs[start]) / count
+        var = (cs2[end] - cs2[start]) / count - mean**2
+        self._hist = buf[-(self.n - 1) :] if self.n > 1 else np.empty(0)
+        return mean + ref, np.sqrt(np.maximum(var, 0.0)), count
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """
+    FUNCTION
+    > Return the (start, end) indices of the runs of True values of a boolean array, as an (N, 2) array
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges.reshape(-1, 2)
+
+
+class DriftCompensator:
+    """
+    CLASS
+    > Removes the drift of the zero of the load cell (e.g. with temperature, over a long fatigue test), which the tare of the sketch (scale.tare(), at start-up) does not follow
+    > Tare windows are detected in the stream: runs of settled readings (standard deviation of the last 'n' readings below 'tol') within 'zero_band' of the current zero, i.e. when the rig is unloaded
+    > The zero is the mean of the last tare window, extrapolated at the drift rate between it and an earlier window (no drift until there are two); it is updated as a tare window goes on
+    > NB: The zero is updated between chunks (i.e. a few milliseconds late), which is negligible against the rate of drift
+    """
+
+    def __init__(
+        self,
+        n: int = STATS_WINDOW,
+        tol: float = PLATEAU_TOL,
+        zero_band: float = ZERO_BAND,
+    ) -> None:
+        self.n = n
+        self.tol = tol
+        self.zero_band = zero_band
+        self.stats = RunningStats(n)
+        # Tare windows: [sum of times, sum of readings, number of readings]; the last one may still be going on
+        # NB: Only the windows needed for the drift rate are kept (see _update_rate()), so that the list does not grow over a long test
+        self.tares = []
+        self._open = False
+        self._rate = 0.0
+
+    def zero(self, t: np.ndarray) -> np.ndarray:
+        """
+        FUNCTION
+        > Zero of the load cell [kg] at times 't' [s]
+        """
+        if not self.tares:
+            return np.zeros_like(t)
+        t_sum, x_sum, count = self.tares[-1]
+        return x_sum / count + self._rate * (t - t_sum / count)
+
+    def _update_rate(self) -> None:
+        # NB: the rate is taken against the latest window at least DRIFT_BASELINE seconds older, so that a tare window interrupted by a bump does not give a noisy rate
+        # > As the last window only gets later, the windows before that one are never needed again, and are dropped
+        t1, x1, n1 = self.tares[-1]
+        for i in range(len(self.tares) - 2, -1, -1):
+            t0, x0, n0 = self.tares[i]
+            if t1 / n1 - t0 / n0 >= DRIFT_BASELINE:
+                self._rate = (x1 / n1 - x0 / n0) / (t1 / n1 - t0 / n0)
+                del self.tares[:i]
+                return None
+
+    def process(self, t: np.ndarray, x: np.ndarray) -> np.ndarray:
+        zero = self.zero(t)
+        _, std, count = self.stats.process(x)
+        # NB: a reading is only settled once the whole window before it is, so every run is at least 'n' readings long
+        is_zero = (
+            (count == self.n) & (std < self.tol) & (np.abs(x - zero) < self.zero_band)
+        )
+        for start, end in _runs(is_zero):
+            if self._open and start == 0:
+                self.tares[-1][0] += t[start:end].sum()
+                self.tares[-1][1] += x[start:end].sum()
+                self.tares[-1][2] += end - start
+            else:
+                self.tares.append([t[start:end].sum(), x[start:end].sum(), end - start])
+            self._update_rate()
+        self._open = x.shape[0] > 0 and bool(is_zero[-1])
+        return x - zero
+
+
+class PlateauDetector:
+    """
+    CLASS
+    > Detects when the load has settled (standard deviation of the last 'n' readings below 'tol' [kg]), and keeps the mean and standard deviation of the whole settled period (from the start of its first window), so that a record point can be taken as the mean of the plateau rather than a single reading
+    > plateau() returns the current state: mean and std [kg], number of readings, start time and duration [s], and whether the load is settled (if not, the mean and std are those of the last 'n' readings)
+    > The plateaus that ended are also kept (in the same form) until collected with pop_ended(), as one chunk may hold several of them
+    """
+
+    def __init__(self, n: int = STATS_WINDOW, tol: float = PLATEAU_TOL) -> None:
+        self.n = n
+        self.tol = tol
+        self.stats = RunningStats(n)
+        self.settled = False
+        # Settled period: sum and sum of squares of the readings (about 'ref'), number of readings and start time
+        self._sum = self._sum2 = 0.0
+        self._count = 0
+        self._ref = 0.0
+        self._t_start = None
+        self._t_last = None
+        # Times of the last 'n' - 1 readings, for the start of a window that began in a previous chunk
+        self._t_hist = np.empty(0)
+        self._window = (0.0, 0.0, 0)
+        self._ended = []
+
+    def _start(self, mean: float, std: float, t: float) -> None:
+        self._ref = mean
+        self._sum = 0.0
+        self._sum2 = self.n * std**2
+        self._count = self.n
+        self._t_start = t
+
+    def process(self, t: np.ndarray, x: np.ndarray) -> None:
+        if x.shape[0] == 0:
+            return None
+        mean, std, count = self.stats.process(x)
+        settled = (count == self.n) & (std < self.tol)
+        t_buf = np.concatenate((self._t_hist, t))
+        for start, end in _runs(settled):
+            if not (self.settled and start == 0):
+                # The plateau starts at the first reading of its first settled window (NB: 'n' - 1 readings before the one at which it settled)
+                t_first = t_buf[self._t_hist.shape[0] + start - (self.n - 1)]
+                self._start(mean[start], std[start], t_first)
+                start += 1
+            d = x[start:end] - self._ref
+            self._sum += d.sum()
+            self._sum2 += (d * d).sum()
+            self._count += end - start
+            if end < x.shape[0]:
+                self._ended.append(self._summary(t[end - 1]))
+        self.settled = bool(settled[-1])
+        self._t_last = float(t[-1])
+        self._t_hist = t_buf[-(self.n - 1) :] if self.n > 1 else np.empty(0)
+        self._window = (float(mean[-1]), float(std[-1]), int(count[-1]))
+
+    def _summary(self, t_end: float) -> dict:
+        mean = self._sum / self._count
+        return {
+            "mean": float(self._ref + mean),
+            "std": math.sqrt(max(self._sum2 / self._count - mean**2, 0.0)),
+            "n": int(self._count),
+            "t_start": float(self._t_start),
+            "duration": float(t_end - self._t_start),
+            "settled": True,
+        }
+
+    def plateau(self) -> dict:
+        if not self.settled:
+            mean, std, count = self._window
+            return {
+                "mean": mean,
+                "std": std,
+                "n": count,
+                "t_start": self._t_last,
+                "duration": 0.0,
+                "settled": False,
+            }
+        return self._summary(self._t_last)
+
+    def pop_ended(self) -> List[dict]:
+        ended, self._ended = self._ended, []
+        return ended
+
+
+class AutoCapture:
+    """
+    CLASS
+    > Automatic record points, in place of the RECORD_CODE sent when the operator presses the record button: every plateau (see PlateauDetector) settled for at least 'hold' seconds, and at least 'min_step' [kg] above the previous record point, is taken as the next record point
+    > As the load of a compression test only increases from one step to the next, the unloaded rig (before the first step), a plateau interrupted by a bump and the relaxation of the load are not captured
+    > 'n_steps' (optional) is the number of record points of the test, after which done is True (i.e. the test is over without a STOP_CODE)
+    > With 'increasing' False (e.g. a sequence of calibration weights), the first plateau is always captured, and then every plateau at least 'min_step' away from the previous one, either way
+    > NB: A plateau is captured once settled for 'hold' seconds, with the mean of the readings so far, so the next compression can be applied straight away
+    """
+
+    def __init__(
+        self,
+        hold: float = HOLD_TIME,
+        min_step: float = MIN_STEP,
+        n_steps: int | None = None,
+        increasing: bool = True,
+    ) -> None:
+        self.hold = hold
+        self.min_step = min_step
+        self.n_steps = n_steps
+        self.increasing = increasing
+        self.captured: List[dict] = []
+        self._last = 0.0 if increasing else None  # the load is tared at start-up
+
+    @property
+    def done(self) -> bool:
+        return self.n_steps is not None and len(self.captured) >= self.n_steps
+
+    def check(self, detector: PlateauDetector) -> List[dict]:
+        """
+        FUNCTION
+        > Return the new record points (plateaus) since the last call
+        """
+        plateaus = detector.pop_ended()
+        if detector.settled:
+            plateaus.append(detector.plateau())
+        new = []
+        for plateau in plateaus:
+            if self.done or plateau["duration"] < self.hold:
+                continue
+            if self.captured and plateau["t_start"] == self.captured[-1]["t_start"]:
+                continue  # already captured while it was going on
+            if self._last is not None:
+                step = plateau["mean"] - self._last
+                if (step if self.increasing else abs(step)) < self.min_step:
+                    continue
+            self._last = plateau["mean"]
+            self.captured.append(plateau)
+            new.append(plateau)
+        return new
+
+
+class Pipeline:
+    """
+    CLASS
+    > Signal processing stage of a Session: the readings go through the 'filters' (e.g. MovingMedian, then LowPass), the DriftCompensator 'drift' and the PlateauDetector 'plateau', in that order (all optional)
+    > process(t, x) returns the processed readings; load() returns the load to record: the mean of the plateau if the load is settled, the last processed reading otherwise
+    """
+
+    def __init__(
+        self,
+        filters: Sequence = (),
+        drift: DriftCompensator | None = None,
+        plateau: PlateauDetector | None = None,
+    ) -> None:
+        self.filters = list(filters)
+        self.drift = drift
+        self.plateau = plateau
+        self.last = 0.0
+
+    def process(self, t: np.ndarray, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=float)
+        if x.shape[0] == 0:
+            return x
+        for f in self.filters:
+            x = f.process(x)
+        if self.drift is not None:
+            x = self.drift.process(t, x)
+        if self.plateau is not None:
+            self.plateau.process(t, x)
+        self.last = float(x[-1])
+        return x
+
+    def load(self) -> Tuple[float, dict | None]:
+        """
+        FUNCTION
+        > Return the load to record and the state of the plateau (None without a PlateauDetector)
+        """
+        if self.plateau is None:
+            return self.last, None
+        plateau = self.plateau.plateau()
+        return (plateau["mean"] if plateau["settled"] else self.last), plateau
+
+
+def default_pipeline(sample_rate: float = SAMPLE_RATE) -> Pipeline:
+    """
+    FUNCTION
+    > Return the pipeline used by the receivers with 'dsp' on: spike rejection (median of 5), low-pass at CUTOFF, drift compensation and plateau detection
+    """
+    return Pipeline(
+        [MovingMedian(MEDIAN_WINDOW), LowPass(CUTOFF, sample_rate)],
+        drift=DriftCompensator(),
+        plateau=PlateauDetector(),
+    )
@@ -0,0 +1,182 @@
+# T. Atkins, 2024
+import os
+import sys
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import Callable
+
+# Repository root (for the shared 'acquisition' package)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from acquisition.protocol import BITS_PER_BYTE, FRAME_SIZE, encode_frames
+from acquisition.stream import RECORD_CODE, STOP_CODE, load_raw
+
+# Noise of the HX711 readings [kg]
+NOISE = 0.002
+# Calibration factor of LC-B (see tsf_tx.ino), to convert loads to HX711 counts for the binary protocol
+CALIBRATION_FACTOR = 210000.0
+
+
+def tx_script(
+    n_samples: int = 10000,
+    n_records: int = 6,
+    max_load: float = 2.0,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    FUNCTION
+    > Return the readings sent by tsf_tx.ino / ttf_tx.ino over a test: 'n_samples' loads (stepping up to 'max_load' in 'n_records' steps, with noise), each step followed by RECORD_CODE, and STOP_CODE at the end
+    """
+    rng = np.random.default_rng(seed)
+    step = np.minimum(np.arange(n_samples) * (n_records + 1) // n_samples, n_records)
+    loads = step * max_load / max(n_records, 1) + rng.normal(0, NOISE, n_samples)
+    # RECORD_CODE is sent at the end of every step (except the last, which is followed by STOP_CODE)
+    ends = np.flatnonzero(np.diff(step)) + 1
+    readings = np.insert(loads, ends, RECORD_CODE)
+    return np.append(readings, STOP_CODE)
+
+
+def replay_script(raw_file: str, record_every: int | None = None) -> np.ndarray:
+    """
+    FUNCTION
+    > Return the readings of a test previously logged by a Session (raw .npy or .csv file, see acquisition.stream), e.g. to replay a real test through the receivers
+    > NB: the raw log does not hold the codes: RECORD_CODE is inserted every 'record_every' samples (if any), and STOP_CODE at the end
+    """
+    if raw_file.endswith(".npy"):
+        loads = np.asarray(load_raw(raw_file)[:, 1])
+    else:
+        loads = np.loadtxt(raw_file, delimiter=",", ndmin=2)[:, 1]
+    if record_every:
+        idx = np.arange(record_every, loads.shape[0] + 1, record_every)
+        loads = np.insert(loads, idx, RECORD_CODE)
+    return np.append(loads, STOP_CODE)
+
+
+def encode(readings: np.ndarray) -> bytes:
+    """
+    FUNCTION
+    > Format readings as the sketches do: 'Serial.println(scale.get_units(), 5)' for loads and 'Serial.println(1000)' for the codes, with Arduino line endings
+    """
+    lines = [
+        str(int(r)) if r in (RECORD_CODE, STOP_CODE) else f"{r:.5f}" for r in readings
+    ]
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+class HX711Emulator:
+    """
+    CLASS
+    > Stand-in for the serial port of an Arduino running tsf_tx.ino / ttf_tx.ino: sends 'readings' (e.g. from tx_script() or replay_script()) as the sketch would
+    > Implements the part of the serial.Serial interface used by the receivers ('read(n)', 'in_waiting', 'close()'), so it can be passed to acquisition.reader.acquire() or as the transport of acquisition.service.run_service()
+    > Data becomes available at 'sample_rate' lines/s (None: as fast as possible), and no faster than 'baud' allows (None: unlimited), starting from the first read
+    > As with pyserial, read(n) waits up to 'timeout' seconds for n bytes, then returns what is available
+    > 'protocol' is 'text' (Serial.println()) or 'binary' (frames of acquisition/protocol.py, i.e. with BINARY_PROTOCOL set to 1 in the sketch)
+    """
+
+    def __init__(
+        self,
+        readings: np.ndarray,
+        baud: int | None = 9600,
+        sample_rate: float | None = 80.0,
+        timeout: float = 0.1,
+        protocol: str = "text",
+    ) -> None:
+        match protocol:
+            case "text":
+                self.data = encode(readings)
+                ends = np.flatnonzero(np.frombuffer(self.data, np.uint8) == ord("\n"))
+                ends = ends + 1
+            case "binary":
+                self.data = encode_frames(
+                    readings, CALIBRATION_FACTOR, sample_rate, baud
+                )
+                ends = np.arange(FRAME_SIZE, len(self.data) + 1, FRAME_SIZE)
+        self.baud = baud
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        self.pos = 0
+        self._t0 = None
+
+        # Time (from the first read) at which every line (or frame) has been fully sent
+        t_ready = np.zeros(ends.shape[0])
+        if sample_rate is not None:
+            t_ready = np.arange(1, ends.shape[0] + 1) / sample_rate
+        if baud is not None:
+            t_ready = np.maximum(t_ready, ends * BITS_PER_BYTE / baud)
+        self._ends = ends
+        self._t_ready = t_ready
+
+    @property
+    def n_lines(self) -> int:
+        return self._ends.shape[0]
+
+    def _available(self) -> int:
+        if self._t0 is None:
+            self._t0 = time.monotonic()
+        n = np.searchsorted(self._t_ready, time.monotonic() - self._t0, side="right")
+        return int(self._ends[n - 1]) if n else 0
+
+    @property
+    def in_waiting(self) -> int:
+        return self._available() - self.pos
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            available = self._available() - self.pos
+            if available >= size or time.monotonic() >= deadline:
+                break
+            if self.pos + available >= len(self.data):
+                # Everything has been sent: an idle port simply times out
+                time.sleep(max(deadline - time.monotonic(), 0))
+                break
+            time.sleep(min(0.001, max(deadline - time.monotonic(), 0)))
+        n = min(size, self._available() - self.pos)
+        out = self.data[self.pos : self.pos + n]
+        self.pos += n
+        return out
+
+    @property
+    def done(self) -> bool:
+        return self.pos >= len(self.data)
+
+    def close(self) -> None:
+        pass
+
+
+def serve_pty(emulator: HX711Emulator) -> str:
+    """
+    FUNCTION
+    > Expose an emulator as a pseudo-terminal (Linux/macOS only), so that unmodified receivers can open it like the Arduino's port, e.g. tsf_rx("fC", 31, port=serve_pty(HX711Emulator(tx_script())))
+    > A daemon thread writes the data to the master side as it becomes available; returns the path of the slave side
+    """
+    import tty
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+
+    def pump() -> None:
+        while not emulator.done:
+            data = emulator.read(max(emulator.in_waiting, 1))
+            if data:
+                os.write(master, data)
+
+    threading.Thread(target=pump, daemon=True).start()
+    return os.ttyname(slave)
+
+
+def emulators(
+    scripts: dict, sample_rate: float | None = 80.0, protocol: str | dict = "text"
+) -> Callable:
+    """
+    FUNCTION
+    > Transport factory for acquisition.service.run_service(): the rig on port 'p' is emulated with the readings 'scripts[p]', at the baud rate of the rig
+    > 'protocol' is that of every emulated sketch, or a dictionary of protocols by port (as the 'protocol' of each rig in the configuration, see acquisition.service.load_config()) for configurations that mix text and binary rigs
+    """
+
+    def transport(port: str, baud: int | None) -> HX711Emulator:
+        rig_protocol = protocol[port] if isinstance(protocol, dict) else protocol
+        return HX711Emulator(scripts[port], baud, sample_rate, protocol=rig_protocol)
+
+    return transport
@@ -0,0 +1,245 @@
+# T. Atkins, 2024
+import argparse
+import sys
+import time
+import numpy as np
+from collections import deque
+from pathlib import Path
+from typing import Tuple
+
+# Repository root (for the shared 'acquisition' package)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from acquisition.stream import RECORD_CODE, STOP_CODE
+
+# Standard gravity, to display loads [kg] as forces [N] (as in analysis/loading.py)
+G = 9.81
+# Time shown on the live view [s], number of points of the display buffer over that span, and frames per second
+SPAN = 10.0
+N_POINTS = 1000
+FPS = 20.0
+# The frame interval is stretched so that drawing takes at most this fraction of the time of the parser thread (e.g. on a slow machine or with a large window)
+MAX_DRAW_FRACTION = 0.25
+# Margin added to the force axis when it is rescaled (as a fraction of the range), so that it is not rescaled at every new maximum
+Y_MARGIN = 0.2
+# Number of record points kept for display
+N_RECORDS = 100
+
+
+class DisplayBuffer:
+    """
+    CLASS
+    > Decimated ring buffer of the last 'span' seconds of readings, for display: the span is divided into 'n_points' time buckets, of which only the minimum and maximum are kept
+    > The memory and drawing cost are therefore fixed, whatever the sample rate, while peaks (e.g. a slip of the sample in the rig) remain visible, unlike with plain subsampling
+    > push() is vectorised over the readings of a chunk
+    """
+
+    def __init__(self, span: float = SPAN, n_points: int = N_POINTS) -> None:
+        self.span = span
+        self.n_points = n_points
+        self.dt = span / n_points
+        self._bucket = np.full(n_points, -1, dtype=np.int64)
+        self._lo = np.zeros(n_points)
+        self._hi = np.zeros(n_points)
+        self.t_last = None
+
+    def push(self, t: np.ndarray, values: np.ndarray) -> None:
+        if values.shape[0] == 0:
+            return None
+        buckets = np.floor(t / self.dt).astype(np.int64)
+        starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+        buckets = buckets[starts]
+        lo = np.minimum.reduceat(values, starts)
+        hi = np.maximum.reduceat(values, starts)
+        # Only the last n_points buckets of a (long) chunk can be displayed
+        buckets, lo, hi = (
+            buckets[-self.n_points :],
+            lo[-self.n_points :],
+            hi[-self.n_points :],
+        )
+        idx = buckets % self.n_points
+        # The first bucket of the chunk may be the last of the previous chunk
+        if self._bucket[idx[0]] == buckets[0]:
+            lo[0] = min(lo[0], self._lo[idx[0]])
+            hi[0] = max(hi[0], self._hi[idx[0]])
+        self._bucket[idx] = buckets
+        self._lo[idx] = lo
+        self._hi[idx] = hi
+        self.t_last = float(t[-1])
+
+    def xy(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        FUNCTION
+        > Return the envelope of the readings, in time order: times relative to the latest reading [s] (from -span to 0) and values, with the minimum and maximum of every bucket
+        """
+        if self.t_last is None:
+            return np.empty(0), np.empty(0)
+        last = int(np.floor(self.t_last / self.dt))
+        order = (np.arange(1, self.n_points + 1) + last) % self.n_points
+        # NB: buckets skipped (no readings) hold readings from a previous lap of the ring, which are masked out here
+        order = order[self._bucket[order] > last - self.n_points]
+        t = self._bucket[order] * self.dt - self.t_last
+        return (
+            np.repeat(t, 2),
+            np.column_stack((self._lo[order], self._hi[order])).ravel(),
+        )
+
+
+class LivePlot:
+    """
+    CLASS
+    > Live view of a test: scrolling force-vs-time trace of the last 'span' seconds, with the record points (RECORD_CODE) marked
+    > feed(t, values) takes the readings as they are parsed (see acquisition.reader.acquire()): they are only pushed to a DisplayBuffer, and the figure is redrawn at most 'fps' times per second, whatever the sample rate
+    > The figure is redrawn with blitting: the axes (ticks, labels, grid) are drawn once, and only the trace and markers are redrawn on every frame; the time axis is relative to the latest reading, so that it never changes
+    > NB-1: Drawing happens in the parser thread, while a SerialReader thread keeps draining the port, so a slow frame delays the parsing of a few chunks but loses no data; the frame interval is also stretched if drawing takes more than MAX_DRAW_FRACTION of the time
+    > NB-2: Closing the window does not stop the test
+    """
+
+    def __init__(
+        self,
+        title: str = "",
+        span: float = SPAN,
+        n_points: int = N_POINTS,
+        fps: float = FPS,
+    ) -> None:
+        # NB: matplotlib is only imported when a live view is requested
+        from matplotlib import pyplot as plt
+
+        self.plt = plt
+        self.buffer = DisplayBuffer(span, n_points)
+        self.interval = 1 / fps
+        self.frames = 0
+        self.draw_time = 0.0
+        self.closed = False
+        self._records = deque(maxlen=N_RECORDS)
+        self._last = None
+        self._t_frame = 0.0
+        self._interval = self.interval
+        self._y_lim = (-1.0, 1.0)
+
+        self.fig, self.ax = plt.subplots(figsize=(8, 4))
+        self.fig.canvas.manager.set_window_title(title or "Live view")
+        self.ax.set_title(title)
+        self.ax.set_xlim(-span, 0)
+        self.ax.set_ylim(*self._y_lim)
+        self.ax.set_xlabel("Time relative to latest reading [s]")
+        self.ax.set_ylabel("Force [N]")
+        self.ax.grid(alpha=0.3)
+        (self.line,) = self.ax.plot([], [], lw=1, color="tab:blue", animated=True)
+        (self.markers,) = self.ax.plot(
+            [], [], "o", ms=5, color="tab:red", animated=True
+        )
+        self.fig.canvas.mpl_connect("close_event", self._on_close)
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
+        plt.show(block=False)
+        self._redraw()
+
+    def _on_close(self, event) -> None:
+        self.closed = True
+
+    def _on_draw(self, event) -> None:
+        # The background (everything but the animated artists) is captured after every full draw, e.g. when the window is resized
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _redraw(self) -> None:
+        """
+        FUNCTION
+        > Full draw of the figure (when the axes change), which refreshes the background used for blitting
+        """
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    def feed(self, t: np.ndarray, values: np.ndarray) -> None:
+        is_code = (values == RECORD_CODE) | (values == STOP_CODE)
+        if is_code.any():
+            # The record points are marked at the load preceding the code
+            idx = np.arange(values.shape[0])
+            last_load = np.maximum.accumulate(np.where(is_code, -1, idx))
+            for i in np.flatnonzero(values == RECORD_CODE):
+                j = last_load[i]
+                load = values[j] if j >= 0 else self._last
+                if load is not None:
+                    self._records.append((t[i], load * G))
+            t, values = t[~is_code], values[~is_code]
+        if values.shape[0]:
+            self._last = values[-1]
+        self.buffer.push(t, values * G)
+
+        now = time.monotonic()
+        if self.closed or now - self._t_frame < self._interval:
+            return None
+        self._t_frame = now
+        self.draw()
+        dt = time.monotonic() - now
+        self.draw_time += dt
+        self._interval = max(self.interval, dt / MAX_DRAW_FRACTION)
+
+    def draw(self) -> None:
+        """
+        FUNCTION
+        > Draw one frame
+        """
+        x, y = self.buffer.xy()
+        self.line.set_data(x, y)
+        if self._records and self.buffer.t_last is not None:
+            t_rec, f_rec = np.array(self._records).T
+            self.markers.set_data(t_rec - self.buffer.t_last, f_rec)
+
+        # Rescale the force axis (full draw) only when the trace leaves it
+        if y.shape[0]:
+            y_min, y_max = y.min(), y.max()
+            if y_min < self._y_lim[0] or y_max > self._y_lim[1]:
+                margin = Y_MARGIN * max(y_max - y_min, 1.0)
+                self._y_lim = (
+                    min(y_min - margin, self._y_lim[0]),
+                    max(y_max + margin, self._y_lim[1]),
+                )
+                self.ax.set_ylim(*self._y_lim)
+                self._redraw()
+
+        canvas = self.fig.canvas
+        canvas.restore_region(self._background)
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.markers)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+        self.frames += 1
+
+    def close(self) -> None:
+        self.plt.close(self.fig)
+
+
+if __name__ == "__main__":
+    # Usage examples (from the repository root), to check the live view (and its cost) against an emulated sketch:
+    # python acquisition/live.py
+    # python acquisition/live.py --sample-rate 5000 --baud 0 --duration 20
+    from acquisition.emulator import HX711Emulator, tx_script
+    from acquisition.reader import acquire
+
+    parser = argparse.ArgumentParser(
+        description="Run the live view against an emulated HX711 sketch."
+    )
+    parser.add_argument("--sample-rate", type=float, default=80.0)
+    parser.add_argument("--baud", type=int, default=9600, help="0: unlimited")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--protocol", choices=["text", "binary"], default="text")
+    args = parser.parse_args()
+
+    emulator = HX711Emulator(
+        tx_script(int(args.duration * args.sample_rate)),
+        baud=args.baud or None,
+        sample_rate=args.sample_rate,
+        protocol=args.protocol,
+    )
+    live = LivePlot("Emulated test")
+    t_start = time.monotonic()
+    stats = acquire(
+        emulator,
+        lambda t, values: not (values == STOP_CODE).any(),
+        protocol=args.protocol,
+        live=live,
+    )
+    elapsed = time.monotonic() - t_start
+    print(
+        f"{stats.samples} samples in {elapsed:.1f} s ({stats.samples / elapsed:.0f} samples/s), {stats.dropped_lines} dropped line(s); {live.frames} frames ({live.frames / elapsed:.1f} fps), {1e3 * live.draw_time / max(live.frames, 1):.1f} ms per frame."
+    )
+    live.close()
@@ -0,0 +1,208 @@
+# T. Atkins, 2024
+import sys
+import numpy as np
+from pathlib import Path
+
+# Repository root (for the shared 'acquisition' package)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from acquisition.stream import RECORD_CODE, STOP_CODE
+
+# Framed binary protocol of tsf_tx.ino / ttf_tx.ino (with BINARY_PROTOCOL set to 1), 14 bytes per frame, little-endian:
+# | sync (0xA5 0x5A) | seq (u16) | micros (u32) | raw (i32) | flags (u8) | checksum (u8) |
+# > 'seq' is incremented for every frame (wrapping at 65536), so that lost frames can be counted
+# > 'micros' is the time of the Arduino (wrapping at 2^32 us, i.e. ~72 min)
+# > 'raw' is the tared HX711 count (scale.get_value()); load [kg] = raw / calibration factor
+# > 'flags': FLAG_RECORD / FLAG_STOP replace the '1000' / '2000' codes, and FLAG_CONFIG frames carry the calibration factor (float32 bits) in 'raw'
+# > 'checksum' is the sum of bytes 2 to 12, modulo 256
+SYNC = b"\xa5\x5a"
+FRAME_DTYPE = np.dtype(
+    [
+        ("sync", "<u2"),
+        ("seq", "<u2"),
+        ("micros", "<u4"),
+        ("raw", "<i4"),
+        ("flags", "u1"),
+        ("checksum", "u1"),
+    ]
+)
+FRAME_SIZE = FRAME_DTYPE.itemsize
+SYNC_WORD = int.from_bytes(SYNC, "little")
+FLAG_RECORD = 0x01
+FLAG_STOP = 0x02
+FLAG_CONFIG = 0x80
+# Bits per byte on the line (start bit, 8 data bits, stop bit), to convert a baud rate to bytes/s
+BITS_PER_BYTE = 10
+# The sketches resend the calibration factor every CONFIG_PERIOD frames, so that a receiver started mid-stream can scale the data
+CONFIG_PERIOD = 256
+
+
+def _checksums(raw_frames: np.ndarray) -> np.ndarray:
+    """
+    FUNCTION
+    > Checksum of every frame of a (N, FRAME_SIZE) array of bytes
+    """
+    return (raw_frames[:, 2:13].sum(axis=1, dtype=np.uint32) & 0xFF).astype(np.uint8)
+
+
+def encode_frames(
+    readings: np.ndarray,
+    calibration_factor: float,
+    sample_rate: float | None = 80.0,
+    baud: int | None = None,
+    seq0: int = 0,
+) -> bytes:
+    """
+    FUNCTION
+    > Encode readings (loads [kg] and the RECORD_CODE / STOP_CODE codes, as sent by the text protocol) as frames, as the sketches would at 'sample_rate' frames/s, and no faster than 'baud' allows (None: unlimited)
+    > A FLAG_CONFIG frame is inserted first and then every CONFIG_PERIOD frames
+    """
+    readings = np.asarray(readings, dtype=float)
+    n = readings.shape[0]
+    # Positions of the data frames in the sequence, between the config frames
+    m = n + n // (CONFIG_PERIOD - 1) + 1
+    is_config = np.arange(m) % CONFIG_PERIOD == 0
+    data_pos = np.flatnonzero(~is_config)[:n]
+    m = data_pos[-1] + 1 if n else 1
+    is_config = is_config[:m]
+
+    frames = np.zeros(m, dtype=FRAME_DTYPE)
+    flags = np.zeros(n, dtype=np.uint8)
+    flags[readings == RECORD_CODE] = FLAG_RECORD
+    flags[readings == STOP_CODE] = FLAG_STOP
+    raw = np.where(flags == 0, np.round(readings * calibration_factor), 0)
+    frames["raw"][data_pos] = raw.astype(np.int32)
+    frames["flags"][data_pos] = flags
+    frames["raw"][is_config] = np.float32(calibration_factor).view(np.int32)
+    frames["flags"][is_config] = FLAG_CONFIG
+    frames["sync"] = SYNC_WORD
+    frames["seq"] = (seq0 + np.arange(frames.shape[0])) & 0xFFFF
+    t = np.zeros(m)
+    if sample_rate is not None:
+        t = np.arange(m) / sample_rate
+    if baud is not None:
+        t = np.maximum(t, np.arange(1, m + 1) * FRAME_SIZE * BITS_PER_BYTE / baud)
+    frames["micros"] = np.round(t * 1e6).astype(np.int64) & 0xFFFFFFFF
+    raw_frames = frames.view(np.uint8).reshape(-1, FRAME_SIZE)
+    frames["checksum"] = _checksums(raw_frames)
+    return frames.tobytes()
+
+
+class FrameDecoder:
+    """
+    CLASS
+    > Parser stage of the binary protocol (used in place of acquisition.reader.LineParser): decodes all complete frames of a chunk in one go with np.frombuffer, and returns the loads with the RECORD_CODE / STOP_CODE codes in place of the flags, so that a Session is fed exactly as with the text protocol
+    > Frames with a bad sync word or checksum are dropped (counted in 'stats.dropped_lines') and the decoder resynchronises on the next sync word
+    > Missing sequence numbers (frames lost on the line or dropped by the reader thread) are counted in 'stats.gaps'; after a discontinuity (see acquisition.reader.DISCONTINUITY), the incomplete frame is dropped
+    > timestamps() returns the times of the Arduino (micros) of the readings, rather than spreading them between chunks
+    > Data frames received before the first FLAG_CONFIG frame are held until the calibration factor is known, unless 'calibration_factor' is given
+    """
+
+    def __init__(self, stats, calibration_factor: float | None = None) -> None:
+        self.stats = stats
+        self.calibration_factor = calibration_factor
+        self._partial = b""
+        self._pending = (
+            []
+        )  # (raw, flags, times, config) of frames received before the calibration factor
+        self._seq_prev = None
+        self._micros_prev = None
+        self._t_wraps = 0.0
+        self._t_offset = None
+        self._t = np.empty(0)  # times of the Arduino [s] of the last frames decoded
+
+    def _frames(self, data: bytes) -> np.ndarray:
+        """
+        FUNCTION
+        > Return the valid frames of the buffer, keeping any incomplete frame for the next chunk
+        """
+        buf = self._partial + data
+        out = []
+        pos = 0
+        while True:
+            start = buf.find(SYNC, pos)
+            if start < 0:
+                # NB: keep a trailing 0xA5, which may be the start of a sync word
+                self._partial = buf[-1:] if buf[-1:] == SYNC[:1] else b""
+                break
+            n = (len(buf) - start) // FRAME_SIZE
+            if n == 0:
+                self._partial = buf[start:]
+                break
+            frames = np.frombuffer(buf, dtype=FRAME_DTYPE, count=n, offset=start)
+            raw_frames = np.frombuffer(
+                buf, dtype=np.uint8, count=n * FRAME_SIZE, offset=start
+            ).reshape(n, FRAME_SIZE)
+            bad = np.flatnonzero(
+                (frames["sync"] != SYNC_WORD)
+                | (frames["checksum"] != _checksums(raw_frames))
+            )
+            if bad.shape[0] == 0:
+                out.append(frames)
+                self._partial = buf[start + n * FRAME_SIZE :]
+                break
+            # Keep the frames before the first bad one, then resynchronise
+            out.append(frames[: bad[0]])
+            self.stats.dropped_lines += 1
+            pos = start + bad[0] * FRAME_SIZE + 1
+        return np.concatenate(out) if out else np.empty(0, dtype=FRAME_DTYPE)
+
+    def _count_gaps(self, seq: np.ndarray) -> None:
+        prev = seq[0] - 1 if self._seq_prev is None else self._seq_prev
+        self.stats.gaps += int(((np.diff(seq, prepend=prev) - 1) % 65536).sum())
+        self._seq_prev = int(seq[-1])
+
+    def _device_times(self, micros: np.ndarray) -> np.ndarray:
+        """
+        FUNCTION
+        > Unwrap the micros of the Arduino into seconds
+        """
+        prev = micros[0] if self._micros_prev is None else self._micros_prev
+        wraps = np.cumsum(np.diff(micros, prepend=prev) < 0)
+        self._micros_prev = int(micros[-1])
+        t = (micros + wraps * 2**32) / 1e6 + self._t_wraps
+        self._t_wraps += wraps[-1] * 2**32 / 1e6
+        return t
+
+    def parse(self, data: bytes | None) -> np.ndarray:
+        # NB: None is acquisition.reader.DISCONTINUITY (not imported, as reader.py imports this module)
+        if data is None:
+            self._partial = b""
+            return np.empty(0)
+        frames = self._frames(data)
+        if frames.shape[0] == 0:
+            return np.empty(0)
+        # NB: every field is read once, as access to the fields of a structured array is comparatively slow
+        raw = frames["raw"]
+        flags = frames["flags"]
+        self._count_gaps(frames["seq"].astype(np.int64))
+        t = self._device_times(frames["micros"].astype(np.int64))
+
+        config = (flags & FLAG_CONFIG) != 0
+        if config.any():
+            self.calibration_factor = float(raw[config][-1:].view(np.float32)[0])
+        if self.calibration_factor is None:
+            self._pending.append((raw, flags, t, config))
+            return np.empty(0)
+        if self._pending:
+            self._pending.append((raw, flags, t, config))
+            raw, flags, t, config = [np.concatenate(a) for a in zip(*self._pending)]
+            self._pending = []
+
+        keep = ~config
+        values = raw[keep] / self.calibration_factor
+        flags = flags[keep]
+        values[(flags & FLAG_RECORD) != 0] = RECORD_CODE
+        values[(flags & FLAG_STOP) != 0] = STOP_CODE
+        self._t = t[keep]
+        self.stats.samples += values.shape[0]
+        return values
+
+    def timestamps(self, t_prev: float, t: float, n: int) -> np.ndarray:
+        """
+        FUNCTION
+        > Times of the readings returned by the last parse(), given the (receiver) times at which the previous and current chunks were read
+        > The clock of the Arduino is aligned with that of the receiver on the first chunk
+        """
+        if self._t_offset is None:
+            self._t_offset = t - self._t[-1]
+        return self._t + self._t_offset
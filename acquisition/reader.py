@@ -0,0 +1,284 @@
+# T. Atkins, 2024
+import queue
+import re
+import threading
+import time
+import numpy as np
+from typing import Callable, Tuple
+from acquisition.protocol import FrameDecoder
+
+# Maximum number of raw chunks waiting to be parsed before the reader thread starts dropping data
+QUEUE_SIZE = 4096
+READ_SIZE = 4096
+# Queued by the reader thread in place of the chunk(s) it had to drop, ahead of the next chunk: the parsers then discard the line (or frame) in progress rather than splicing it onto data that does not follow it
+DISCONTINUITY = None
+# Wire protocols of the sketches: text lines ('Serial.println()'), or the framed binary protocol of acquisition/protocol.py
+PROTOCOLS = ["text", "binary"]
+
+
+class Stats:
+    """
+    CLASS
+    > Acquisition counters, shared by the reader thread (bytes, and bytes dropped when the parser cannot keep up) and the parser (samples, dropped lines or frames, and gaps in the sequence numbers of the binary protocol)
+    > 't_chunk' is the (monotonic) time at which the chunk being parsed was read off the port (host time, whatever the protocol), e.g. to measure the latency of the pipeline
+    > rates() returns bytes/s and samples/s since the previous call
+    """
+
+    def __init__(self) -> None:
+        self.bytes = 0
+        self.samples = 0
+        self.dropped_lines = 0
+        self.dropped_bytes = 0
+        self.gaps = 0
+        self.t_chunk = None
+        self._last = (time.monotonic(), 0, 0)
+
+    def rates(self) -> Tuple[float, float]:
+        now = time.monotonic()
+        t_prev, bytes_prev, samples_prev = self._last
+        dt = max(now - t_prev, 1e-9)
+        self._last = (now, self.bytes, self.samples)
+        return (self.bytes - bytes_prev) / dt, (self.samples - samples_prev) / dt
+
+
+class SerialReader(threading.Thread):
+    """
+    CLASS
+    > Reader thread: pulls raw bytes from the serial port (or any transport with 'read(n)' and 'in_waiting', such as serial.Serial) into a queue, together with the (monotonic) time at which they were read
+    > The thread does nothing else, so that the port is drained as fast as the data arrives, regardless of how long parsing, storage or display take
+    > If the queue is full (i.e. the parser cannot keep up), the chunk is dropped and counted in 'stats.dropped_bytes' (and, with the text 'protocol', the lines it contained in 'stats.dropped_lines'; the frames of the binary protocol are counted by the decoder, from the gap in their sequence numbers); a DISCONTINUITY is then queued before the next chunk
+    > Any error raised by the transport is stored in 'error' and ends the thread
+    """
+
+    def __init__(
+        self,
+        transport,
+        stats: Stats,
+        queue_size: int = QUEUE_SIZE,
+        protocol: str = "text",
+    ) -> None:
+        super().__init__(daemon=True)
+        self.transport = transport
+        self.stats = stats
+        # NB: in binary frames, b"\n" is just a byte of the payload
+        self._count_lines = protocol == "text"
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self._gap = False
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                # Read whatever is waiting, or block (up to the transport's timeout) for the next byte
+                data = self.transport.read(
+                    min(self.transport.in_waiting, READ_SIZE) or 1
+                )
+                if not data:
+                    continue
+                self.stats.bytes += len(data)
+                t = time.monotonic()
+                try:
+                    if self._gap:
+                        self.queue.put_nowait((t, DISCONTINUITY))
+                        self._gap = False
+                    self.queue.put_nowait((t, data))
+                except queue.Full:
+                    self._gap = True
+                    self.stats.dropped_bytes += len(data)
+                    if self._count_lines:
+                        self.stats.dropped_lines += data.count(b"\n")
+        except Exception as e:
+            self.error = e
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+class LineParser:
+    """
+    CLASS
+    > Parser stage: splits the raw byte stream into lines and converts all complete lines of a chunk to floats in one batch
+    > Incomplete lines are kept until the rest of the line arrives; lines that are not numbers (e.g. corrupted by noise on the line) are dropped and counted
+    > After a DISCONTINUITY (chunks dropped by the reader thread), the incomplete line and the start of the next chunk (up to its first line break) are dropped, as they are parts of different lines
+    > 'pattern' (optional) is a regular expression (on bytes) with one group, for sketches that send readings within text (e.g. lc_calibration.ino): only the group is converted, and lines that do not match (e.g. instructions) are ignored
+    """
+
+    def __init__(self, stats: Stats, pattern: bytes | None = None) -> None:
+        self.stats = stats
+        self.pattern = re.compile(pattern) if pattern is not None else None
+        self._partial = b""
+        self._resync = False
+
+    def parse(self, data: bytes | None) -> np.ndarray:
+        if data is DISCONTINUITY:
+            self._partial = b""
+            self._resync = True
+            return np.empty(0)
+        if self._resync:
+            cut = data.find(b"\n")
+            if cut < 0:
+                return np.empty(0)
+            data = data[cut + 1 :]
+            self._resync = False
+            self.stats.dropped_lines += 1
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        lines = [line.strip() for line in lines]
+        if self.pattern is not None:
+            matches = [self.pattern.search(line) for line in lines]
+            lines = [m.group(1) for m in matches if m is not None]
+        lines = [line for line in lines if line]
+        if not lines:
+            return np.empty(0)
+        try:
+            values = np.array(lines).astype(float)
+        except ValueError:
+            # Fall back to line by line conversion to find the culprit(s)
+            values = []
+            for line in lines:
+                try:
+                    values.append(float(line))
+                except ValueError:
+                    self.stats.dropped_lines += 1
+            values = np.array(values, dtype=float)
+        self.stats.samples += values.shape[0]
+        return values
+
+    def timestamps(self, t_prev: float, t: float, n: int) -> np.ndarray:
+        """
+        FUNCTION
+        > Times of the 'n' readings returned by the last parse(): the text protocol has no timestamps, so they are evenly spread between the times at which the previous and current chunks were read
+        """
+        return np.linspace(t_prev, t, n + 1)[1:]
+
+
+class StatusDisplay:
+    """
+    CLASS
+    > Rate-limited status line (latest reading and acquisition counters), printed at most once every 'interval' seconds
+    > This replaces printing every reading, which throttled how fast the port could be drained when the terminal is slow
+    > 'tag' is prepended to the line (e.g. the rig ID when several rigs share the console)
+    > With 'interval' None, nothing is printed (e.g. in benchmarks, where the line would interleave with their output)
+    """
+
+    def __init__(
+        self, stats: Stats, interval: float | None = 1.0, tag: str = ""
+    ) -> None:
+        self.stats = stats
+        self.interval = interval
+        self.tag = tag
+        self._t_last = 0.0
+
+    def update(self, readout: float) -> None:
+        if self.interval is None:
+            return None
+        now = time.monotonic()
+        if now - self._t_last < self.interval:
+            return None
+        self._t_last = now
+        bytes_rate, samples_rate = self.stats.rates()
+        print(
+            f"{self.tag}Raw: {readout:.5f} | {samples_rate:.0f} samples/s, {bytes_rate:.0f} B/s, {self.stats.dropped_lines} dropped line(s)"
+        )
+
+
+class CalibratedParser:
+    """
+    CLASS
+    > Parser stage that applies a host-side calibration (see acquisition.calibration.Calibration) to the loads of another parser (LineParser or FrameDecoder), leaving the RECORD_CODE / STOP_CODE codes as they are
+    > The loads are converted back to HX711 counts with the calibration factor of the sketch: that sent by the sketch with the binary protocol, or the 'firmware_factor' of the calibration with the text protocol
+    """
+
+    def __init__(self, parser: LineParser | FrameDecoder, calibration) -> None:
+        self.parser = parser
+        self.calibration = calibration
+
+    def parse(self, data: bytes | None) -> np.ndarray:
+        values = self.parser.parse(data)
+        if values.shape[0] == 0:
+            return values
+        factor = getattr(self.parser, "calibration_factor", None)
+        return self.calibration.apply(values, factor)
+
+    def timestamps(self, t_prev: float, t: float, n: int) -> np.ndarray:
+        return self.parser.timestamps(t_prev, t, n)
+
+
+def make_parser(
+    protocol: str, stats: Stats, pattern: bytes | None = None, calibration=None
+) -> LineParser | FrameDecoder | CalibratedParser:
+    """
+    FUNCTION
+    > Return the parser stage for the wire protocol of the sketch ('text' or 'binary'), with the host-side 'calibration' (optional) applied to its loads
+    """
+    match protocol:
+        case "text":
+            parser = LineParser(stats, pattern)
+        case "binary":
+            parser = FrameDecoder(stats)
+        case _:
+            raise ValueError(
+                f"Protocol '{protocol}' not recognised: must be one of {PROTOCOLS}."
+            )
+    if calibration is not None:
+        return CalibratedParser(parser, calibration)
+    return parser
+
+
+def acquire(
+    transport,
+    feed_many: Callable[[np.ndarray, np.ndarray], bool],
+    status_interval: float | None = 1.0,
+    protocol: str = "text",
+    live=None,
+    pattern: bytes | None = None,
+    calibration=None,
+    stats: Stats | None = None,
+) -> Stats:
+    """
+    FUNCTION
+    > Run a producer/consumer acquisition until 'feed_many(t, readings)' returns False (e.g. Session.feed_many() upon receiving the stop code)
+    > A SerialReader thread reads the transport, while the calling thread parses the data in batches (LineParser, or FrameDecoder for the 'binary' protocol), passes it on to 'feed_many' and updates a StatusDisplay
+    > With the text protocol, readings parsed from the same chunk are given timestamps evenly spread between the time of the previous chunk and the time of their own; the binary protocol carries the time of the Arduino
+    > 'live' (optional) is fed every batch of readings as well, e.g. an acquisition.live.LivePlot (which redraws at its own frame rate)
+    > 'pattern' (optional) is that of LineParser, and 'calibration' (optional) a host-side calibration of the load cell (see acquisition/calibration.py) applied to every reading
+    > 'stats' (optional) are the acquisition counters to update, e.g. to read them from 'feed_many' (a new Stats otherwise)
+    > Returns the acquisition counters
+    """
+    if stats is None:
+        stats = Stats()
+    reader = SerialReader(transport, stats, protocol=protocol)
+    parser = make_parser(protocol, stats, pattern, calibration)
+    status = StatusDisplay(stats, status_interval)
+    t_prev = None
+
+    reader.start()
+    try:
+        while True:
+            try:
+                t, data = reader.queue.get(timeout=0.5)
+            except queue.Empty:
+                if not reader.is_alive():
+                    raise Exception(
+                        "Issue with serial communication, re-run program."
+                    ) from reader.error
+                continue
+
+            values = parser.parse(data)
+            if values.shape[0] == 0:
+                continue
+            if t_prev is None:
+                t_prev = t
+            ts = parser.timestamps(t_prev, t, values.shape[0])
+            t_prev = t
+            stats.t_chunk = t
+
+            status.update(values[-1])
+            if live is not None:
+                live.feed(ts, values)
+            if not feed_many(ts, values):
+                return stats
+    finally:
+        reader.stop()
+        reader.join(timeout=1.0)
@@ -0,0 +1,65 @@
+# T. Atkins, 2024
+from typing import Callable, Sequence
+
+# Compressions of the T-SF test, in the order in which they are recorded
+DEFAULT_PCTS = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+
+
+def _plateau_note(plateau: dict | None) -> str:
+    """
+    FUNCTION
+    > Describe the plateau a load was taken from (see acquisition.dsp.PlateauDetector), for the messages of the recorders
+    """
+    if plateau is None:
+        return ""
+    if not plateau["settled"]:
+        return f" (WARNING: load not settled, std {plateau['std']:.5f} kg)"
+    return f" (mean of {plateau['n']} readings over {plateau['duration']:.1f} s, std {plateau['std']:.5f} kg)"
+
+
+def compression_recorder(
+    pcts: Sequence[float], tag: str = ""
+) -> Callable[..., list | None]:
+    """
+    FUNCTION
+    > Return the 'on_record' callback of a T-SF Session: the n-th record point is stored as (load, n-th compression of 'pcts')
+    > 'tag' is prepended to the messages (e.g. the rig ID when several rigs share the console)
+    > With a signal processing stage (Session's 'dsp'), the load is the mean of the plateau, whose standard deviation is reported
+    """
+
+    def record(
+        readout_prev: float, idx: int, plateau: dict | None = None
+    ) -> list | None:
+        # Record data point
+        if idx >= len(pcts):
+            print(
+                f"{tag}WARNING: All {len(pcts)} compressions already recorded, point ignored."
+            )
+            return None
+        # comp = input("Input compression in mm: ")
+        # comp = float(comp)
+        comp = pcts[idx]
+        print(
+            f"{tag}Stored {readout_prev:.5f} kg LOAD @ {int(comp*100)} % COMPRESSION{_plateau_note(plateau)}."
+        )
+        return [abs(readout_prev), comp]
+
+    return record
+
+
+def finger_recorder(tag: str = "") -> Callable[..., list]:
+    """
+    FUNCTION
+    > Return the 'on_record' callback of a T-TF Session: one record point (load) per finger, starting with the index
+    > 'tag' is prepended to the messages (e.g. the rig ID when several rigs share the console)
+    > With a signal processing stage (Session's 'dsp'), the load is the mean of the plateau, whose standard deviation is reported
+    """
+
+    def record(readout_prev: float, idx: int, plateau: dict | None = None) -> list:
+        # Record data point
+        print(
+            f"{tag}Stored {readout_prev:.5f} kg for finger {idx+2}{_plateau_note(plateau)}."
+        )
+        return [abs(readout_prev)]
+
+    return record
@@ -0,0 +1,338 @@
+# T. Atkins, 2024
+# NOTE: Close Arduino IDE Serial Monitor and any other applications communicating over COM ports before running
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Repository root (for the shared 'acquisition' package)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from acquisition.calibration import LC_PATTERN, load_profile
+from acquisition.dsp import AutoCapture, default_pipeline
+from acquisition.reader import (
+    PROTOCOLS,
+    SerialReader,
+    Stats,
+    StatusDisplay,
+    make_parser,
+)
+from acquisition.recorders import DEFAULT_PCTS, compression_recorder, finger_recorder
+from acquisition.stream import Session
+
+# Example configuration (JSON), with one T-SF rig, one T-TF rig and the load-cell calibration sketch:
+# {
+#     "folder": "output/",
+#     "rigs": [
+#         {"id": "tsf-1", "kind": "tsf", "port": "COM3", "test_code": "fC", "test_num": 31},
+#         {"id": "ttf-1", "kind": "ttf", "port": "COM4", "mode": "LOW"},
+#         {"id": "lc", "kind": "lc", "port": "COM5", "baud": 9600}
+#     ]
+# }
+# Optional per rig: "baud" (default 9600), "protocol" ("text" or "binary", default "text"), "folder" (default: the top-level one), "dsp" (true: record the mean of the settled load, see acquisition/dsp.py), "cell" (name of the load cell, whose host-side calibration profile is applied, see acquisition/calibration.py) and, for T-SF rigs, "pcts" and "auto" (true: record points taken when the load settles, without the record button)
+
+RIG_KINDS = ["tsf", "ttf", "lc"]
+DEFAULT_BAUD = 9600
+DEFAULT_FOLDER = "output/"
+# Time [s] a rig task sleeps when its queue is empty, so that the other rigs are served
+POLL_INTERVAL = 0.01
+
+
+def _open_serial(port: str, baud: int):
+    """
+    FUNCTION
+    > Default transport factory: open 'port' with pyserial
+    """
+    import serial  # WARNING: refers to a package installed with 'pip install pyserial', NOT 'pip install serial'
+
+    return serial.Serial(port=port, baudrate=baud, timeout=0.1)
+
+
+class Rig:
+    """
+    CLASS
+    > One rig of the service (see load_config() for the configuration), and the acquisition pipeline of its port: a SerialReader thread, a LineParser, a StatusDisplay and a Session
+    > The output files are named as by tsf_rx() / ttf_rx(), so that the plotting functions are unchanged: 'test[code]_[num].csv' (T-SF), 'ttf[mode].csv' (T-TF), plus the raw logs; the calibration sketch ('lc') only has a raw log, 'lc_[id]_raw.[raw]'
+    > Every message of the rig is tagged with its ID and test, and a sidecar '[output].rig.json' records the rig, port and counters with the data
+    """
+
+    def __init__(self, cfg: dict, raw: str | None = "npy") -> None:
+        self.cfg = cfg
+        self.rig_id = cfg["id"]
+        self.kind = cfg["kind"]
+        self.port = cfg["port"]
+        self.baud = cfg.get("baud", DEFAULT_BAUD)
+        self.protocol = cfg.get("protocol", "text")
+        folder = cfg.get("folder", DEFAULT_FOLDER)
+
+        match self.kind:
+            case "tsf":
+                self.test = f"test{cfg['test_code']}_{str(cfg['test_num']).zfill(3)}"
+                self.summary_file = os.path.join(folder, f"{self.test}.csv")
+            case "ttf":
+                self.test = f"ttf{cfg['mode'].upper()}"
+                self.summary_file = os.path.join(folder, f"{self.test}.csv")
+            case "lc":
+                self.test = f"lc_{self.rig_id}"
+                self.summary_file = None
+        self.raw_file = (
+            os.path.join(folder, f"{self.test}_raw.{raw}") if raw is not None else None
+        )
+        self.tag = f"[{self.rig_id} {self.test}] "
+
+        self.stats = Stats()
+        self.transport = None
+        self.reader = None
+        self.session = None
+        self._t_prev = None
+
+    def outputs(self) -> List[str]:
+        return [f for f in [self.summary_file, self.raw_file] if f is not None]
+
+    def open(self, transport_factory: Callable, status_interval: float | None) -> None:
+        auto = self.kind == "tsf" and self.cfg.get("auto", False)
+        match self.kind:
+            case "tsf":
+                on_record = compression_recorder(
+                    self.cfg.get("pcts", DEFAULT_PCTS), self.tag
+                )
+            case "ttf":
+                on_record = finger_recorder(self.tag)
+            case "lc":
+                on_record = lambda readout_prev, idx, plateau=None: None
+        calibration = load_profile(self.cfg["cell"]) if "cell" in self.cfg else None
+        self.parser = make_parser(
+            self.protocol,
+            self.stats,
+            LC_PATTERN if self.kind == "lc" else None,
+            calibration,
+        )
+        self.status = StatusDisplay(self.stats, status_interval, self.tag)
+        for f in self.outputs():
+            os.makedirs(os.path.dirname(f) or ".", exist_ok=True)
+        self.session = Session(
+            self.summary_file,
+            on_record,
+            raw_file=self.raw_file,
+            dsp=default_pipeline() if self.cfg.get("dsp") or auto else None,
+            auto_capture=(
+                AutoCapture(n_steps=len(self.cfg.get("pcts", DEFAULT_PCTS)))
+                if auto
+                else None
+            ),
+        )
+        self.transport = transport_factory(self.port, self.baud)
+        self.reader = SerialReader(self.transport, self.stats, protocol=self.protocol)
+        self.reader.start()
+
+    def process(self, t: float, data: bytes | None) -> bool:
+        """
+        FUNCTION
+        > Parse one chunk read from the port and pass the readings on to the Session (as acquisition.reader.acquire() does for a single rig)
+        > Returns False once the test is over
+        """
+        values = self.parser.parse(data)
+        if values.shape[0] == 0:
+            return True
+        if self._t_prev is None:
+            self._t_prev = t
+        ts = self.parser.timestamps(self._t_prev, t, values.shape[0])
+        self._t_prev = t
+        self.stats.t_chunk = t
+        self.status.update(values[-1])
+        return self.session.feed_many(ts, values)
+
+    def close(self) -> None:
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader.join(timeout=1.0)
+        if self.session is not None:
+            self.session.close()
+        if self.transport is not None:
+            self.transport.close()
+        out = self.summary_file or self.raw_file
+        if self.session is not None and out is not None:
+            info = {
+                "id": self.rig_id,
+                "kind": self.kind,
+                "test": self.test,
+                "port": self.port,
+                "baud": self.baud,
+                "protocol": self.protocol,
+                "summary_file": self.summary_file,
+                "raw_file": self.raw_file,
+                "records": self.session.n_records,
+                "samples": self.stats.samples,
+                "dropped_lines": self.stats.dropped_lines,
+                "gaps": self.stats.gaps,
+                "plateaus": self.session.plateaus,
+            }
+            with open(os.path.splitext(out)[0] + ".rig.json", "w") as f:
+                json.dump(info, f, indent=4)
+
+
+def load_config(config_file: str) -> List[dict]:
+    """
+    FUNCTION
+    > Read the list of rigs from a JSON configuration file (see the example at the top of this module)
+    > The top-level 'folder' (if any) is the default output folder of the rigs
+    """
+    with open(config_file) as f:
+        config = json.load(f)
+    rigs = config["rigs"]
+    ids = set()
+    for cfg in rigs:
+        cfg.setdefault("folder", config.get("folder", DEFAULT_FOLDER))
+        if cfg.get("id") is None or cfg.get("port") is None:
+            raise ValueError(f"Rig {cfg} must have an 'id' and a 'port'.")
+        if cfg["id"] in ids:
+            raise ValueError(f"Rig ID '{cfg['id']}' is used more than once.")
+        ids.add(cfg["id"])
+        match cfg.get("kind"):
+            case "tsf":
+                if "test_code" not in cfg or "test_num" not in cfg:
+                    raise ValueError(
+                        f"T-SF rig '{cfg['id']}' must have a 'test_code' and a 'test_num'."
+                    )
+            case "ttf":
+                if "mode" not in cfg:
+                    raise ValueError(f"T-TF rig '{cfg['id']}' must have a 'mode'.")
+            case "lc":
+                if cfg.get("protocol", "text") != "text":
+                    raise ValueError(
+                        f"Calibration rig '{cfg['id']}' only supports the 'text' protocol."
+                    )
+            case kind:
+                raise ValueError(
+                    f"Kind '{kind}' of rig '{cfg['id']}' not recognised: must be one of {RIG_KINDS}."
+                )
+        if cfg.get("protocol", "text") not in PROTOCOLS:
+            raise ValueError(
+                f"Protocol '{cfg['protocol']}' of rig '{cfg['id']}' not recognised: must be one of {PROTOCOLS}."
+            )
+        if "cell" in cfg:
+            # NB: the profile is loaded here so that a missing profile is reported before any rig starts
+            load_profile(cfg["cell"])
+    return rigs
+
+
+async def _run_rig(
+    rig: Rig, transport_factory: Callable, status_interval: float | None
+) -> Stats:
+    """
+    FUNCTION
+    > Acquire from one rig until its test is over (or the task is cancelled)
+    > The chunks waiting in the queue of the rig when it is polled are processed in one go, and then the other rigs are given their turn (so that a rig whose queue never empties, e.g. at a high sample rate, does not starve them)
+    """
+    try:
+        rig.open(transport_factory, status_interval)
+        while True:
+            # NB: this task is the only consumer of the queue, so at least 'n' chunks can be taken without blocking
+            n = rig.reader.queue.qsize()
+            if n == 0:
+                if not rig.reader.is_alive():
+                    raise Exception(
+                        f"{rig.tag}Issue with serial communication, re-run program."
+                    ) from rig.reader.error
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            for _ in range(n):
+                t, data = rig.reader.queue.get_nowait()
+                if not rig.process(t, data):
+                    print(f"{rig.tag}Test over, data stored in {rig.outputs()}.")
+                    return rig.stats
+            await asyncio.sleep(0)
+    finally:
+        rig.close()
+
+
+async def _serve(
+    rigs: List[Rig], transport_factory: Callable, status_interval: float | None
+) -> list:
+    tasks = [
+        asyncio.create_task(
+            _run_rig(rig, transport_factory, status_interval), name=rig.rig_id
+        )
+        for rig in rigs
+    ]
+    # NB: a rig that fails does not stop the others
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_service(
+    rigs: List[dict],
+    raw: str | None = "npy",
+    transport_factory: Callable = _open_serial,
+    status_interval: float | None = 1.0,
+    overwrite: bool = False,
+) -> Dict[str, Stats | BaseException]:
+    """
+    FUNCTION
+    > Acquire from several rigs (e.g. as read by load_config()) concurrently in one process: every port is drained by its own SerialReader thread, while a single asyncio loop parses the data of all rigs and writes each rig to its own output
+    > T-SF and T-TF rigs stop upon receiving their STOP code; the calibration sketch ('lc') never sends one, so it runs until the service is interrupted (Ctrl+C), which closes all rigs cleanly
+    > 'transport_factory(port, baud)' opens a port (pyserial by default)
+    > Returns the acquisition counters of every rig (or the error that stopped it), by rig ID
+    """
+    if raw not in ["npy", "csv", None]:
+        exit(
+            f"ERROR: Raw log format '{raw}' not recognised: must be 'npy', 'csv' or None."
+        )
+    rigs = [Rig(cfg, raw) for cfg in rigs]
+    if raw is None and any(rig.kind == "lc" for rig in rigs):
+        exit(
+            "ERROR: Calibration rigs ('lc') only have a raw log: 'raw' cannot be None."
+        )
+
+    outputs = [f for rig in rigs for f in rig.outputs()]
+    if len(set(outputs)) < len(outputs):
+        exit("ERROR: Several rigs write to the same output file(s).")
+    existing = [f for f in outputs if os.path.isfile(f)]
+    if existing and not overwrite:  # overwrite protection
+        print(f"WARNING: Output file(s) {existing} already exist.")
+        proceed = input(
+            "Type 'c' to continue and overwrite, or any other key to halt: "
+        )
+        if proceed != "c":
+            print("Execution halted to avoid overwrite.")
+            exit()
+
+    try:
+        results = asyncio.run(_serve(rigs, transport_factory, status_interval))
+    except KeyboardInterrupt:
+        print("Service interrupted, all rigs closed.")
+        results = [rig.stats for rig in rigs]
+
+    summary = {}
+    for rig, result in zip(rigs, results):
+        summary[rig.rig_id] = result
+        if isinstance(result, BaseException):
+            print(f"{rig.tag}ERROR: {result}")
+        else:
+            print(
+                f"{rig.tag}{result.samples} samples received, {result.dropped_lines} line(s) dropped, {result.gaps} gap(s)."
+            )
+    return summary
+
+
+if __name__ == "__main__":
+    # Usage examples:
+    # python acquisition/service.py rigs.json
+    # python acquisition/service.py rigs.json --raw csv --overwrite
+    parser = argparse.ArgumentParser(
+        description="Acquire from several T-SF / T-TF / load-cell calibration rigs at once."
+    )
+    parser.add_argument("config", help="JSON file listing the rigs")
+    parser.add_argument("--raw", choices=["npy", "csv", "none"], default="npy")
+    parser.add_argument(
+        "--overwrite", action="store_true", help="overwrite existing output files"
+    )
+    args = parser.parse_args()
+
+    run_service(
+        load_config(args.config),
+        raw=None if args.raw == "none" else args.raw,
+        overwrite=args.overwrite,
+    )
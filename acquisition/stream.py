@@ -0,0 +1,346 @@
+# T. Atkins, 2024
+import os
+import numpy as np
+from collections import deque
+from typing import Callable, List, Sequence
+
+# Codes sent by the Arduino sketches (tsf_tx.ino, ttf_tx.ino) in place of a load reading
+RECORD_CODE = 1000
+STOP_CODE = 2000
+
+# Total size of the header of the .npy files written by NpySink (fixed, so that it can be rewritten in place as samples are appended)
+NPY_HEADER_LEN = 128
+
+
+class CsvSink:
+    """
+    CLASS
+    > Append rows of samples to a CSV file as they arrive, in the same format as np.savetxt(..., delimiter=",")
+    > Every write is flushed to disk, so that the data written so far survives a crash of the program (or of the computer)
+    """
+
+    def __init__(self, path: str, fmt: str = "%.18e") -> None:
+        self.path = path
+        self.fmt = fmt
+        self._f = open(path, "w")
+
+    def write(self, rows: np.ndarray) -> None:
+        np.savetxt(self._f, rows, fmt=self.fmt, delimiter=",")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+
+
+class NpySink:
+    """
+    CLASS
+    > Append rows of samples to a NumPy .npy file as they arrive, e.g. to log every load-cell sample of a long test in a compact binary format
+    > The header (which holds the number of rows) has a fixed size and is updated in place after every write, so the file is a valid .npy file at all times
+    > Every write is flushed to disk; after a crash, load_raw() recovers all rows that were written (even if the header was not yet updated)
+    """
+
+    def __init__(self, path: str, n_cols: int = 2) -> None:
+        self.path = path
+        self.n_cols = n_cols
+        self.rows = 0
+        self._f = open(path, "w+b")
+        self._write_header()
+
+    def _write_header(self) -> None:
+        header = repr(
+            {"descr": "<f8", "fortran_order": False, "shape": (self.rows, self.n_cols)}
+        )
+        hlen = (
+            NPY_HEADER_LEN - 10
+        )  # magic string (6), version (2) and header length (2)
+        header = header.ljust(hlen - 1) + "\n"
+        self._f.seek(0)
+        self._f.write(b"\x93NUMPY\x01\x00" + hlen.to_bytes(2, "little"))
+        self._f.write(header.encode("latin1"))
+        self._f.seek(0, os.SEEK_END)
+
+    def write(self, rows: np.ndarray) -> None:
+        self._f.write(np.ascontiguousarray(rows, dtype="<f8").tobytes())
+        self.rows += rows.shape[0]
+        self._write_header()
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+
+
+def load_raw(path: str) -> np.ndarray:
+    """
+    FUNCTION
+    > Open a raw sample log written by NpySink (or any 2D .npy file) as a read-only memory map, i.e. without reading (or copying) the data
+    > The number of rows is taken from the size of the file rather than the header, so that all samples are recovered if the test was interrupted
+    """
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+    n_cols = shape[1] if len(shape) > 1 else 1
+    rows = (size - offset) // (dtype.itemsize * n_cols)
+    if rows == 0:
+        return np.empty((0, n_cols), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(rows, n_cols))
+
+
+class ChunkedBuffer:
+    """
+    CLASS
+    > Growable buffer of samples (one row per sample, e.g. timestamp and load) stored in fixed-size chunks
+    > Samples are passed on to the 'sinks' (e.g. a CsvSink) whenever a chunk is full or flush() is called, and only the 'keep' most recent chunks are held in memory
+    > As a result, memory use is bounded regardless of the length of a test, while recent() still gives access to the latest samples (e.g. for display)
+    """
+
+    def __init__(
+        self,
+        n_cols: int = 2,
+        chunk_size: int = 4096,
+        keep: int = 4,
+        sinks: Sequence = (),
+    ) -> None:
+        self.n_cols = n_cols
+        self.chunk_size = chunk_size
+        self.sinks = list(sinks)
+        self.count = 0  # total number of samples appended
+        self._chunks = deque(maxlen=keep - 1 if keep > 1 else 1)
+        self._chunk = np.empty((chunk_size, n_cols))
+        # Number of samples in the current chunk, and how many of them were already passed to the sinks
+        self._n = 0
+        self._flushed = 0
+
+    def append(self, row: Sequence[float]) -> None:
+        self._chunk[self._n] = row
+        self._n += 1
+        self.count += 1
+        if self._n == self.chunk_size:
+            self._next_chunk()
+
+    def extend(self, rows: np.ndarray) -> None:
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.n_cols)
+        while rows.shape[0]:
+            n = min(self.chunk_size - self._n, rows.shape[0])
+            self._chunk[self._n : self._n + n] = rows[:n]
+            self._n += n
+            self.count += n
+            rows = rows[n:]
+            if self._n == self.chunk_size:
+                self._next_chunk()
+
+    def _next_chunk(self) -> None:
+        self.flush()
+        self._chunks.append(self._chunk)
+        self._chunk = np.empty((self.chunk_size, self.n_cols))
+        self._n = 0
+        self._flushed = 0
+
+    def flush(self) -> None:
+        """
+        FUNCTION
+        > Pass the samples that have not been written yet to the sinks
+        """
+        if self._n > self._flushed:
+            rows = self._chunk[self._flushed : self._n]
+            for sink in self.sinks:
+                sink.write(rows)
+            self._flushed = self._n
+
+    def recent(self, n: int) -> np.ndarray:
+        """
+        FUNCTION
+        > Return (a copy of) up to the 'n' most recent samples still held in memory, oldest first
+        """
+        parts = [self._chunk[: self._n]]
+        total = self._n
+        for chunk in reversed(self._chunks):
+            if total >= n:
+                break
+            parts.insert(0, chunk)
+            total += chunk.shape[0]
+        return np.concatenate(parts)[-n:] if n > 0 else np.empty((0, self.n_cols))
+
+    def close(self) -> None:
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+
+def _raw_sink(raw_file: str) -> CsvSink | NpySink:
+    """
+    FUNCTION
+    > Return the sink for a raw sample log, based on the extension of the file
+    """
+    if raw_file.endswith(".npy"):
+        return NpySink(raw_file, n_cols=2)
+    return CsvSink(raw_file)
+
+
+class Session:
+    """
+    CLASS
+    > A single test: every load reading is streamed to a ChunkedBuffer (together with its timestamp), and record points are written to the summary CSV as soon as they are taken
+    > Upon receiving RECORD_CODE, 'on_record(load, idx)' is called with the last load reading before the code and the number of points recorded so far, and returns the row to store in the summary CSV (or None to ignore the code)
+    > NB: As previously, rows that are entirely zero are not stored (but still count as a recorded point)
+    > Upon receiving STOP_CODE, feed() returns False and the test is over
+    > The summary CSV has the same layout as the one previously written at the end of the test with np.savetxt(), so that the plotting functions are unchanged
+    > 'raw_file' (optional) receives every sample as (time since the start of the test [s], load [kg]), flushed every 'flush_interval' seconds: at most that much data is lost on a crash
+    > The raw file is written in binary (see NpySink and load_raw()) if its name ends in '.npy', or as a CSV otherwise
+    > 'summary_file' may be None for streams without record points (e.g. the load-cell calibration sketch), in which case only the raw file is written
+    > 'dsp' (optional) is a signal processing stage (see acquisition/dsp.py) between the readings and the record points: the raw file still receives the readings as received, but the load passed to 'on_record' is that of the stage (the mean of the plateau if the load has settled), and 'on_record(load, idx, plateau)' also receives the state of the plateau (see PlateauDetector.plateau())
+    > 'auto_capture' (optional, needs 'dsp') is an acquisition.dsp.AutoCapture: record points are taken when the load settles rather than upon RECORD_CODE (which is then ignored), and the test is over once all of them are taken (or upon STOP_CODE)
+    """
+
+    def __init__(
+        self,
+        summary_file: str | None,
+        on_record: Callable[[float, int], Sequence[float] | None],
+        raw_file: str | None = None,
+        chunk_size: int = 4096,
+        flush_interval: float = 1.0,
+        dsp=None,
+        auto_capture=None,
+    ) -> None:
+        if auto_capture is not None and (dsp is None or dsp.plateau is None):
+            raise ValueError(
+                "Auto-capture needs a signal processing stage with a plateau detector."
+            )
+        self.on_record = on_record
+        self.dsp = dsp
+        self.auto_capture = auto_capture
+        self.plateaus: List[dict | None] = []
+        self.flush_interval = flush_interval
+        self.summary = CsvSink(summary_file) if summary_file is not None else None
+        self.buffer = ChunkedBuffer(
+            n_cols=2,
+            chunk_size=chunk_size,
+            sinks=[_raw_sink(raw_file)] if raw_file is not None else [],
+        )
+        self.records: List[Sequence[float]] = []
+        self.n_records = 0
+        self.readout_prev = 0.0
+        self._t0 = None
+        self._t_flush = 0.0
+
+    def feed(self, t: float, readout: float) -> bool:
+        """
+        FUNCTION
+        > Process one reading received at (monotonic) time 't' [s]
+        > Returns False once the test is over (i.e. STOP_CODE has been received)
+        """
+        if self._t0 is None:
+            self._t0 = t
+        t = t - self._t0
+
+        if readout == RECORD_CODE:
+            # Record data point
+            if self.auto_capture is not None:
+                pass
+            elif self.dsp is None:
+                self._record(self.on_record(self.readout_prev, self.n_records))
+            else:
+                load, plateau = self.dsp.load()
+                self.plateaus.append(plateau)
+                self._record(self.on_record(load, self.n_records, plateau))
+        elif readout == STOP_CODE:
+            self.close()
+            return False
+        else:
+            # NB: this ensures that the codes ('1000' and '2000') are not stored as load data
+            self.buffer.append((t, readout))
+            self.readout_prev = readout
+            if self.dsp is not None:
+                self.dsp.process(np.array([t]), np.array([readout]))
+            if not self._capture():
+                self.close()
+                return False
+
+        if t - self._t_flush >= self.flush_interval:
+            self.buffer.flush()
+            self._t_flush = t
+        return True
+
+    def feed_many(self, t: np.ndarray, readouts: np.ndarray) -> bool:
+        """
+        FUNCTION
+        > Process a batch of readings (e.g. all the lines parsed from one read of the serial port) received at (monotonic) times 't' [s]
+        > Equivalent to calling feed() for every reading, but runs of load readings are passed to the buffer in one go, and only the codes are handled one at a time
+        > Returns False once the test is over (i.e. STOP_CODE has been received, or all record points have been auto-captured), in which case any readings after that are ignored
+        """
+        t = np.asarray(t, dtype=float)
+        readouts = np.asarray(readouts, dtype=float)
+        if readouts.shape[0] == 0:
+            return True
+        if self._t0 is None:
+            self._t0 = t[0]
+
+        start = 0
+        for idx in np.flatnonzero((readouts == RECORD_CODE) | (readouts == STOP_CODE)):
+            if not self._extend(t[start:idx], readouts[start:idx]):
+                return False
+            if not self.feed(t[idx], readouts[idx]):
+                return False
+            start = idx + 1
+        if not self._extend(t[start:], readouts[start:]):
+            return False
+
+        if t[-1] - self._t0 - self._t_flush >= self.flush_interval:
+            self.buffer.flush()
+            self._t_flush = t[-1] - self._t0
+        return True
+
+    def _extend(self, t: np.ndarray, readouts: np.ndarray) -> bool:
+        """
+        FUNCTION
+        > Store a run of load readings (i.e. without any codes)
+        > Returns False once the test is over (all record points auto-captured)
+        """
+        if readouts.shape[0]:
+            self.buffer.extend(np.column_stack([t - self._t0, readouts]))
+            self.readout_prev = float(readouts[-1])
+            if self.dsp is not None:
+                self.dsp.process(t - self._t0, readouts)
+            if not self._capture():
+                self.close()
+                return False
+        return True
+
+    def _record(self, row: Sequence[float] | None) -> None:
+        """
+        FUNCTION
+        > Store a record point (the row returned by 'on_record'), unless None
+        """
+        if row is not None:
+            self.n_records += 1
+            if np.any(np.asarray(row) != 0):
+                self.records.append(row)
+                if self.summary is not None:
+                    self.summary.write(np.asarray(row, dtype=float)[None, :])
+
+    def _capture(self) -> bool:
+        """
+        FUNCTION
+        > Take the record points detected by 'auto_capture' (if any); returns False once all of them are taken
+        """
+        if self.auto_capture is None:
+            return True
+        for plateau in self.auto_capture.check(self.dsp.plateau):
+            self.plateaus.append(plateau)
+            self._record(self.on_record(plateau["mean"], self.n_records, plateau))
+        return not self.auto_capture.done
+
+    def close(self) -> None:
+        self.buffer.close()
+        if self.summary is not None:
+            self.summary.close()
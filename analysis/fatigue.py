@@ -0,0 +1,298 @@
+# T. Atkins, 2024
+import argparse
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Tuple
+
+# Repository root (for the shared 'acquisition' and 'analysis' packages)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from acquisition.stream import load_raw
+from analysis.loading import G
+
+# Cycle streams of the fatigue tests: raw logs (acquisition.stream.Session / NpySink, .npy or .csv) with one row per sample: time [s], load [kg] and, optionally, pin spacing d [mm] (e.g. from the position of the actuator)
+# > Named 'ftg_[id]_[material]_raw.[npy|csv]' (e.g. 'ftg_023_petg_raw.npy'), with 'id' the test number of the spring (see plotting._stdsetup()) and 'material' one of MATERIALS
+STREAM_PATTERN = re.compile(r"ftg_(\d+)_([a-z]+)_raw\.(npy|csv)$")
+MATERIALS = ["petg", "pla"]
+# Number of rows read from the stream at once (the stream is memory-mapped, so memory use is bounded by this, whatever the length of the test)
+CHUNK_ROWS = 1 << 20
+# A cycle starts when the load rises above the upper threshold, after having fallen below the lower one (Schmitt trigger, so that noise around a single threshold does not split cycles)
+# > The thresholds are at the middle of the load range of the first CHUNK_ROWS rows (whatever the chunk size, so that the cycles found do not depend on it), +/- HYSTERESIS_BAND of that range
+HYSTERESIS_BAND = 0.1
+# Cycles (counted from 1) compared in the summary table of plotting_fatigue(): the first cycle and the 10th (as in the report), or the last if 'post' is None
+PRE_CYCLE = 1
+POST_CYCLE = 10
+# Number of cycles averaged for the reference of the degradation trend
+REF_CYCLES = 10
+# Compression (fraction of the pin spacing at rest) at which the load of every cycle is compared, as in the report ('load at 50% compression')
+COMPRESSION_POINT = 0.5
+# Per-cycle metric of the summary table, by plotting_fatigue() mode: peak load [N] ('load', from the load alone, as the acquisition only logs the time and load) or pin spacing at rest [mm] ('len', which needs streams with pin spacing)
+SUMMARY_METRICS = {"load": "peak_load", "len": "rest_spacing"}
+# Axis labels of plotting_fatigue() for a summary table computed from cycle streams (NB: the 'load' mode differs from that of the summary CSVs of the report, i.e. the load at 50% compression)
+SUMMARY_LABELS = {"load": r"Peak load [N]", "len": r"Pin spacing $d$ at rest [mm]"}
+
+
+def load_stream(file: str) -> np.ndarray:
+    """
+    FUNCTION
+    > Open a cycle stream: .npy files are memory-mapped (see acquisition.stream.load_raw()), so that they are only read chunk by chunk
+    """
+    if file.endswith(".npy"):
+        return load_raw(file)
+    return np.loadtxt(file, delimiter=",", ndmin=2)
+
+
+def _thresholds(load: np.ndarray) -> Tuple[float, float]:
+    lo, hi = np.percentile(load, [5, 95])
+    mid, band = (lo + hi) / 2, HYSTERESIS_BAND * (hi - lo)
+    return mid - band, mid + band
+
+
+def _cycle_starts(
+    load: np.ndarray, lo: float, hi: float, state: int
+) -> Tuple[np.ndarray, int]:
+    """
+    FUNCTION
+    > Return the indices at which cycles start in a chunk of loads, and the state of the Schmitt trigger at the end of the chunk (+1 above the upper threshold, -1 below the lower one, 0 before either)
+    """
+    mark = np.where(load > hi, 1, np.where(load < lo, -1, 0))
+    # Carry the last mark forward over the samples between the thresholds
+    idx = np.maximum.accumulate(np.where(mark != 0, np.arange(mark.shape[0]), -1))
+    states = np.where(idx >= 0, mark[np.maximum(idx, 0)], state)
+    prev = np.concatenate(([state], states[:-1]))
+    starts = np.flatnonzero((states == 1) & (prev == -1))
+    return starts, int(states[-1])
+
+
+def _metrics(block: np.ndarray, bounds: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Metrics of consecutive cycles, all at once: 'block' holds the samples from the start of the first cycle to the start of the one after the last, and 'bounds' the (relative) start of every cycle and the end of the last
+    """
+    starts = bounds[:-1]
+    n = np.diff(bounds)
+    t = block[:, 0]
+    F = block[:, 1] * G
+    out = {
+        "t_start": t[starts],
+        "duration": t[bounds[1:]] - t[starts],
+        "peak_load": np.maximum.reduceat(F[:-1], starts),
+        "min_load": np.minimum.reduceat(F[:-1], starts),
+    }
+    if block.shape[1] < 3:
+        for key in [
+            "rest_spacing",
+            "min_spacing",
+            "compression_load",
+            "hysteresis",
+            "stiffness",
+            "secant_stiffness",
+        ]:
+            out[key] = np.full(starts.shape[0], np.nan)
+        return out
+
+    d = block[:, 2]
+    d_max = np.maximum.reduceat(d[:-1], starts)
+    d_min = np.minimum.reduceat(d[:-1], starts)
+    # Load at COMPRESSION_POINT: interpolated where the spacing first falls to that compression of the rest spacing (i.e. on the loading stroke), NaN for cycles that do not reach it
+    cycle = np.repeat(np.arange(starts.shape[0]), n)
+    target = (d_max * (1 - COMPRESSION_POINT))[cycle]
+    cross = np.flatnonzero((d[:-1] > target) & (d[1:] <= target))
+    reached, first = np.unique(cycle[cross], return_index=True)
+    i = cross[first]
+    frac = (d[i] - target[i]) / (d[i] - d[i + 1])
+    out["compression_load"] = np.full(starts.shape[0], np.nan)
+    out["compression_load"][reached] = F[i] + frac * (F[i + 1] - F[i])
+    # Hysteresis: area of the load-spacing loop (trapezoids), the last one closing the loop on the first sample of the next cycle
+    work = 0.5 * (F[1:] + F[:-1]) * np.diff(d)
+    # Stiffness: least-squares slope of the load against the compression (i.e. against -d) over the whole cycle, from running sums
+    x = d[:-1] - d[:-1].mean()
+    y = F[:-1]
+    sx, sy = np.add.reduceat(x, starts), np.add.reduceat(y, starts)
+    sxx, sxy = np.add.reduceat(x * x, starts), np.add.reduceat(x * y, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["stiffness"] = -(n * sxy - sx * sy) / (n * sxx - sx**2)
+        out["secant_stiffness"] = (out["peak_load"] - out["min_load"]) / (d_max - d_min)
+    out["rest_spacing"] = d_max
+    out["min_spacing"] = d_min
+    out["hysteresis"] = np.abs(np.add.reduceat(work, starts))
+    return out
+
+
+def analyse_cycles(
+    data: np.ndarray,
+    chunk_rows: int = CHUNK_ROWS,
+    thresholds: Tuple[float, float] | None = None,
+) -> pd.DataFrame:
+    """
+    FUNCTION
+    > Segment a cycle stream (see load_stream()) into cycles and return one row per complete cycle: cycle number (from 1), start time and duration [s], peak and minimum load [N], pin spacing at rest and at full compression [mm], load at COMPRESSION_POINT [N], hysteresis (area of the load-spacing loop) [N.mm = mJ], stiffness (least-squares slope over the cycle) and secant stiffness (peak to peak) [N/mm]
+    > The spacing metrics (and the load at COMPRESSION_POINT) are NaN for streams without pin spacing
+    > The stream is processed 'chunk_rows' rows at a time, and the metrics of all cycles completed in a chunk are computed at once, so that very long tests (memory-mapped) are analysed in bounded memory
+    > 'thresholds' (optional) are the lower and upper loads [kg] of the cycle detection (see HYSTERESIS_BAND)
+    """
+    n_rows = data.shape[0]
+    if thresholds is None:
+        thresholds = _thresholds(np.asarray(data[:CHUNK_ROWS, 1]))
+    lo, hi = thresholds
+
+    state = 0
+    pending = None  # start of the cycle in progress (row of the stream)
+    tables = []
+    for c0 in range(0, n_rows, chunk_rows):
+        load = np.asarray(data[c0 : c0 + chunk_rows, 1])
+        starts, state = _cycle_starts(load, lo, hi, state)
+        starts = starts + c0
+        if pending is not None:
+            starts = np.concatenate(([pending], starts))
+        if starts.shape[0] >= 2:
+            block = np.asarray(data[starts[0] : starts[-1] + 1])
+            tables.append(_metrics(block, starts - starts[0]))
+        if starts.shape[0]:
+            pending = starts[-1]
+
+    columns = [
+        "t_start",
+        "duration",
+        "peak_load",
+        "min_load",
+        "rest_spacing",
+        "min_spacing",
+        "compression_load",
+        "hysteresis",
+        "stiffness",
+        "secant_stiffness",
+    ]
+    if not tables:
+        return pd.DataFrame(columns=["cycle"] + columns)
+    df = pd.DataFrame({k: np.concatenate([t[k] for t in tables]) for k in columns})
+    df.insert(0, "cycle", np.arange(1, df.shape[0] + 1))
+    return df
+
+
+def degradation(
+    cycles: pd.DataFrame, metric: str = "stiffness", ref_cycles: int = REF_CYCLES
+) -> dict:
+    """
+    FUNCTION
+    > Degradation trend of a per-cycle metric (see analyse_cycles()) over the test, relative to its mean over the first 'ref_cycles' cycles:
+    > 'change_pct': change over the test (mean of the last 'ref_cycles' cycles) [%]
+    > 'per_decade_pct': slope of a least-squares fit against log10(cycle), i.e. change per tenfold increase in cycles [%], as fatigue degradation is typically logarithmic
+    > 'cycles_to_10pct': number of cycles at which that fit reaches a 10 % loss (extrapolated; None if the metric is not decreasing)
+    """
+    values = cycles[metric].to_numpy(dtype=float)
+    n = cycles["cycle"].to_numpy(dtype=float)
+    ok = np.isfinite(values)
+    values, n = values[ok], n[ok]
+    if values.shape[0] < 2:
+        return {
+            "metric": metric,
+            "ref": np.nan,
+            "change_pct": np.nan,
+            "per_decade_pct": np.nan,
+            "cycles_to_10pct": None,
+        }
+    ref = values[:ref_cycles].mean()
+    rel = 100 * (values / ref - 1)
+    slope, intercept = np.polyfit(np.log10(n), rel, 1)
+    to_10pct = None
+    if slope < 0:
+        to_10pct = float(10 ** ((-10 - intercept) / slope))
+    return {
+        "metric": metric,
+        "ref": float(ref),
+        "change_pct": float(rel[-ref_cycles:].mean()),
+        "per_decade_pct": float(slope),
+        "cycles_to_10pct": to_10pct,
+    }
+
+
+def find_streams(folder: str) -> Dict[Tuple[int, str], str]:
+    """
+    FUNCTION
+    > Return the cycle streams of a folder, by (test number, material) (see STREAM_PATTERN)
+    """
+    streams = {}
+    for f in sorted(os.listdir(folder)):
+        m = STREAM_PATTERN.match(f)
+        if m is not None and m.group(2) in MATERIALS:
+            streams[(int(m.group(1)), m.group(2))] = os.path.join(folder, f)
+    return streams
+
+
+def summary_table(
+    folder: str, mode: str, pre: int = PRE_CYCLE, post: int | None = POST_CYCLE
+) -> pd.DataFrame:
+    """
+    FUNCTION
+    > Analyse every cycle stream of 'folder' and return the summary table read by plotting_fatigue(): one row per test number, with the columns 'id', 'petg_pre', 'petg_post', 'pla_pre' and 'pla_post'
+    > 'mode' is that of plotting_fatigue(): 'load' (peak load [N]) or 'len' (pin spacing at rest [mm], which raises ValueError for streams without pin spacing)
+    > The values are those of cycle 'pre' and cycle 'post' (the last complete cycle if None, or if the test stopped before)
+    """
+    if mode not in SUMMARY_METRICS:
+        raise ValueError(
+            f"Mode '{mode}' not recognised: must be one of {list(SUMMARY_METRICS)}."
+        )
+    metric = SUMMARY_METRICS[mode]
+    rows = {}
+    for (num, material), file in find_streams(folder).items():
+        cycles = analyse_cycles(load_stream(file))
+        if cycles.shape[0] == 0:
+            continue
+        values = cycles[metric].to_numpy()
+        if np.isnan(values).all():
+            raise ValueError(
+                f"{file} has no '{metric}': the pin spacing at rest needs streams with pin spacing (streams of time and load only can be summarised in the 'load' mode)."
+            )
+        i_post = len(values) - 1 if post is None else min(post, len(values)) - 1
+        row = rows.setdefault(num, {"id": num})
+        row[f"{material}_pre"] = values[min(pre, len(values)) - 1]
+        row[f"{material}_post"] = values[i_post]
+    columns = ["id"] + [f"{m}_{s}" for m in MATERIALS for s in ["pre", "post"]]
+    return pd.DataFrame(list(rows.values()), columns=columns)
+
+
+if __name__ == "__main__":
+    # Usage examples (from the repository root):
+    # python analysis/fatigue.py cycles data/ftg/ftg_023_petg_raw.npy --out ftg_023_petg_cycles.csv
+    # python analysis/fatigue.py summary data/ftg --mode load --out data/ftg_load.csv
+    parser = argparse.ArgumentParser(
+        description="Per-cycle analysis of the fatigue tests, and summary tables for plotting_fatigue()."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    cycles_parser = sub.add_parser("cycles", help="analyse one cycle stream")
+    cycles_parser.add_argument("stream")
+    cycles_parser.add_argument("--out", help="CSV of the per-cycle metrics")
+    summary_parser = sub.add_parser(
+        "summary", help="summary table of a folder of cycle streams"
+    )
+    summary_parser.add_argument("folder")
+    summary_parser.add_argument("--mode", choices=list(SUMMARY_METRICS), required=True)
+    summary_parser.add_argument("--post", type=int, default=POST_CYCLE)
+    summary_parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    match args.command:
+        case "cycles":
+            cycles = analyse_cycles(load_stream(args.stream))
+            print(f"{cycles.shape[0]} complete cycle(s) in {args.stream}.")
+            for metric in ["peak_load", "stiffness", "hysteresis"]:
+                trend = degradation(cycles, metric)
+                print(
+                    f"{metric}: {trend['ref']:.4g} initially, {trend['change_pct']:+.2f} % over the test, {trend['per_decade_pct']:+.2f} % per decade of cycles"
+                    + (
+                        f", 10 % loss at ~{trend['cycles_to_10pct']:.3g} cycles"
+                        if trend["cycles_to_10pct"]
+                        else ""
+                    )
+                    + "."
+                )
+            if args.out:
+                cycles.to_csv(args.out, index=False)
+        case "summary":
+            df = summary_table(args.folder, args.mode, post=args.post)
+            df.to_csv(args.out, index=False)
+            print(f"Summary of {df.shape[0]} spring(s) written to {args.out}.")
@@ -0,0 +1,114 @@
+# T. Atkins, 2024
+import hashlib
+import os
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+# Standard gravity, to convert loads from kilograms to Newtons
+G = 9.81
+
+# The parsed CSVs are cached in a single folder (rather than in the data folders), under a name that holds a hash of the path of the CSV and the key of the cache (e.g. 'output/testA_023.csv' -> '[hash].[mtime].[size].npy')
+# > The folder can be moved with the ANALYSIS_CACHE environment variable
+CACHE_DIR = os.environ.get(
+    "ANALYSIS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "analysis")
+)
+# Number of files read at once
+N_WORKERS = 8
+
+# In-process copy of the parsed files, so that figures drawn in the same run do not even hit the on-disk cache
+_loaded: Dict[str, Tuple[Tuple[int, int], np.ndarray]] = {}
+
+
+def _cache_prefix(path: str) -> str:
+    return hashlib.sha1(path.encode()).hexdigest()[:16] + "."
+
+
+def _cache_file(path: str, key: Tuple[int, int]) -> str:
+    return os.path.join(CACHE_DIR, f"{_cache_prefix(path)}{key[0]}.{key[1]}.npy")
+
+
+def load_csv(file: str) -> np.ndarray:
+    """
+    FUNCTION
+    > Load a headerless numerical CSV (e.g. the output of tsf_rx() or ttf_rx()) as a 2D array, one column per CSV column
+    > The parsed array is cached on disk as a .npy file (see CACHE_DIR), keyed on the (absolute) path, modification time and size of the CSV: any change to the file (e.g. a re-run test) invalidates it
+    > NB: Failing to write the cache (e.g. on a read-only network share) is not an error, the file is simply parsed again on the next run
+    """
+    path = os.path.abspath(file)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    # Already loaded during this run
+    if path in _loaded and _loaded[path][0] == key:
+        return _loaded[path][1]
+
+    # Try the on-disk cache
+    cache_file = _cache_file(path, key)
+    try:
+        data = np.load(cache_file, allow_pickle=False)
+    except (OSError, ValueError):
+        data = None
+
+    # Otherwise, parse the CSV and refresh the cache (written to a temporary file first so that a concurrent reader never sees a partial cache)
+    if data is None:
+        if stat.st_size == 0:
+            data = np.empty((0, 0))
+        else:
+            data = np.loadtxt(path, delimiter=",", ndmin=2)
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Remove the caches of previous versions of the file
+            prefix = _cache_prefix(path)
+            for f in os.listdir(CACHE_DIR):
+                if f.startswith(prefix) and f.endswith(".npy"):
+                    os.remove(os.path.join(CACHE_DIR, f))
+            with open(tmp_file, "wb") as f:
+                np.save(f, data, allow_pickle=False)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+
+    # NB: the array is shared by all callers, so it is made read-only
+    data.flags.writeable = False
+    _loaded[path] = (key, data)
+    return data
+
+
+def load_csvs(files: Sequence[str], n_workers: int = N_WORKERS) -> List[np.ndarray]:
+    """
+    FUNCTION
+    > Load several CSVs (see load_csv()) in parallel, in the order of 'files'
+    """
+    if len(files) <= 1:
+        return [load_csv(f) for f in files]
+    with ThreadPoolExecutor(max_workers=min(n_workers, len(files))) as pool:
+        return list(pool.map(load_csv, files))
+
+
+def load_frames(
+    files: Sequence[str],
+    names: Sequence[str],
+    to_newtons: Sequence[str] = ("load",),
+    n_workers: int = N_WORKERS,
+) -> List[pd.DataFrame]:
+    """
+    FUNCTION
+    > Load several CSVs in parallel (see load_csvs()) as DataFrames with the columns 'names' (the first len(names) columns of the files)
+    > The columns in 'to_newtons' are converted from kilograms to Newtons (as a whole column, rather than value by value)
+    > NB: An empty file gives an empty DataFrame, whereas a file with fewer columns than 'names' raises a ValueError (as pd.read_csv(usecols=...) did)
+    """
+    dfs = []
+    scale = np.array([G if name in to_newtons else 1.0 for name in names])
+    for file, data in zip(files, load_csvs(files, n_workers)):
+        if data.size == 0:
+            data = np.empty((0, len(names)))
+        elif data.shape[1] < len(names):
+            raise ValueError(
+                f"{file} has {data.shape[1]} column(s), {len(names)} expected ({', '.join(names)})."
+            )
+        dfs.append(pd.DataFrame(data[:, : len(names)] * scale, columns=list(names)))
+    return dfs
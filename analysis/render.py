@@ -0,0 +1,243 @@
+# T. Atkins, 2024
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Repository root
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+from analysis.style import DEFAULT_PROFILE, PROFILES
+
+# Plotting modules (NB: both packages are named 'package', so they are loaded from their path under another name)
+MODULES = {
+    "tsf": ROOT / "tsf" / "package" / "plotting.py",
+    "ttf": ROOT / "ttf" / "package" / "plotting.py",
+}
+TEST_CODES = ["A", "B", "C"]
+FTYPE = "pdf"
+# Record of the inputs of every figure rendered, kept in the output directory
+MANIFEST = ".render_manifest.json"
+
+_modules = {}
+
+
+def _module(name: str):
+    """
+    FUNCTION
+    > Import (once per process) the plotting module 'name' ('tsf' or 'ttf'), with the Agg backend (no display needed)
+    """
+    if name not in _modules:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        spec = importlib.util.spec_from_file_location(f"{name}_plotting", MODULES[name])
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[name] = module
+    return _modules[name]
+
+
+def _ftg_inputs(file: str) -> List[str]:
+    """
+    FUNCTION
+    > Input files of a fatigue figure: its summary table, or a folder of cycle streams together with every stream in it (the modification time of a folder only changes when files are added or removed, not when a stream is rewritten)
+    """
+    if not os.path.isdir(file):
+        return [file]
+    from analysis.fatigue import find_streams
+
+    return [file] + list(find_streams(file).values())
+
+
+def figures(
+    tsf_data: str | None = None,
+    ftg_load: str | None = None,
+    ftg_len: str | None = None,
+    ttf_data: str | None = None,
+) -> List[dict]:
+    """
+    FUNCTION
+    > Return the figures of the report (STD A/B/C, F-LOAD A/B/C, F-LEN A/B/C and the T-TF chart) for which the input data was given
+    > Every figure is a dictionary: name (also that of the output file), plotting module and function, its keyword arguments and its input files
+    """
+    tsf = _module("tsf")
+    figs = []
+    if tsf_data is not None:
+        for code in TEST_CODES:
+            figs.append(
+                {
+                    "name": f"std{code}",
+                    "module": "tsf",
+                    "func": "plotting_standard",
+                    "kwargs": {"test_code": code, "loc": tsf_data},
+                    "inputs": tsf.standard_files(code, tsf_data),
+                }
+            )
+    for mode, file in [("load", ftg_load), ("len", ftg_len)]:
+        if file is None:
+            continue
+        for code in TEST_CODES:
+            figs.append(
+                {
+                    "name": f"ftg{mode}{code}",
+                    "module": "tsf",
+                    "func": "plotting_fatigue",
+                    "kwargs": {"mode": mode, "test_code": code, "file": file},
+                    "inputs": _ftg_inputs(file),
+                }
+            )
+    if ttf_data is not None:
+        figs.append(
+            {
+                "name": "ttf",
+                "module": "ttf",
+                "func": "plotting",
+                "kwargs": {"loc": ttf_data},
+                "inputs": _module("ttf").ttf_files(ttf_data),
+            }
+        )
+    return figs
+
+
+def _key(fig: dict, profile: str) -> str:
+    """
+    FUNCTION
+    > Return a digest of everything a figure depends on: its arguments, the render profile, its input files (path, modification time and size) and the source of its plotting module
+    > NB: Missing input files are part of the key, so that the figure is rendered (and fails) rather than silently skipped
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([fig["func"], fig["kwargs"], profile], sort_keys=True).encode())
+    h.update(Path(MODULES[fig["module"]]).read_bytes())
+    for f in fig["inputs"]:
+        try:
+            stat = os.stat(f)
+            h.update(f"{os.path.abspath(f)}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+        except OSError:
+            h.update(f"{os.path.abspath(f)}:missing".encode())
+    return h.hexdigest()
+
+
+def _render(fig: dict, out_dir: str, profile: str) -> Tuple[float, float]:
+    """
+    FUNCTION
+    > Render one figure to 'out_dir' (run in a worker process); returns the total time taken and the time taken to save the figure (i.e. to typeset its text) [s]
+    """
+    from matplotlib import pyplot as plt
+    from analysis.style import TIMINGS, apply_profile
+
+    t0 = time.perf_counter()
+    plt.close("all")
+    module = _module(fig["module"])
+    apply_profile(profile)
+    n = len(TIMINGS)
+    getattr(module, fig["func"])(**fig["kwargs"], save_dir=out_dir)
+    plt.close("all")
+    return time.perf_counter() - t0, sum(t[2] for t in TIMINGS[n:])
+
+
+def render(
+    figs: List[dict],
+    out_dir: str,
+    force: bool = False,
+    workers: int | None = None,
+    profile: str = DEFAULT_PROFILE,
+) -> Dict[str, str]:
+    """
+    FUNCTION
+    > Render all figures of 'figs' (see figures()) to 'out_dir' with a pool of worker processes, with the render profile 'profile' (see analysis/style.py)
+    > Only figures whose inputs (or plotting code, or profile) changed since they were last rendered, or whose output file is missing, are rendered again, unless 'force'
+    > Returns the outcome of every figure: 'rendered', 'unchanged' or the error raised
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_file = os.path.join(out_dir, MANIFEST)
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    if profile not in PROFILES:
+        exit(
+            f"ERROR: Render profile '{profile}' not recognised: must be one of {PROFILES}."
+        )
+    outcome = {}
+    todo = []
+    for fig in figs:
+        key = _key(fig, profile)
+        out_file = os.path.join(out_dir, f"{fig['name']}.{FTYPE}")
+        if not force and manifest.get(fig["name"]) == key and os.path.isfile(out_file):
+            outcome[fig["name"]] = "unchanged"
+        else:
+            todo.append((fig, key))
+
+    t0 = time.perf_counter()
+    t_save = 0.0
+    if todo:
+        # NB: imported here, as it is slow to import and not needed for '--help' or when nothing changed
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                (fig, key, pool.submit(_render, fig, out_dir, profile))
+                for fig, key in todo
+            ]
+            for fig, key, future in futures:
+                try:
+                    dt, dt_save = future.result()
+                    t_save += dt_save
+                    manifest[fig["name"]] = key
+                    outcome[fig["name"]] = "rendered"
+                    print(
+                        f"Figure {fig['name']}.{FTYPE} rendered in {dt:.2f} s ({dt_save:.2f} s to save)."
+                    )
+                except (Exception, SystemExit) as e:
+                    # NB: the plotting functions call exit() on bad inputs
+                    manifest.pop(fig["name"], None)
+                    outcome[fig["name"]] = f"ERROR: {e}"
+                    print(f"Figure {fig['name']}.{FTYPE} failed: {e}")
+
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=4)
+    n_rendered = sum(v == "rendered" for v in outcome.values())
+    n_unchanged = sum(v == "unchanged" for v in outcome.values())
+    print(
+        f"[{profile}] {n_rendered} figure(s) rendered in {time.perf_counter() - t0:.2f} s ({t_save:.2f} s to save, across all workers), {n_unchanged} unchanged, {len(todo) - n_rendered} failed."
+    )
+    return outcome
+
+
+if __name__ == "__main__":
+    # Usage examples (from the repository root):
+    # python analysis/render.py --tsf-data tsf/output --ttf-data ttf/output --ftg-load data/ftg_load.csv --ftg-len data/ftg_len.csv --out figures
+    # python analysis/render.py --tsf-data tsf/output --out figures --force
+    # python analysis/render.py --tsf-data tsf/output --out figures --profile publication
+    parser = argparse.ArgumentParser(
+        description="Render every report figure whose input data changed."
+    )
+    parser.add_argument("--tsf-data", help="directory of the T-SF test CSVs (STD)")
+    parser.add_argument("--ftg-load", help="CSV of the fatigue loads (F-LOAD)")
+    parser.add_argument("--ftg-len", help="CSV of the fatigue pin spacings (F-LEN)")
+    parser.add_argument("--ttf-data", help="directory of the T-TF test CSVs")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--force", action="store_true", help="render all figures")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--profile",
+        choices=PROFILES,
+        default=DEFAULT_PROFILE,
+        help="'draft' (mathtext, fast) or 'publication' (LaTeX, as in the report)",
+    )
+    args = parser.parse_args()
+
+    figs = figures(args.tsf_data, args.ftg_load, args.ftg_len, args.ttf_data)
+    if not figs:
+        exit("ERROR: No input data given.")
+    outcome = render(figs, args.out, args.force, args.workers, args.profile)
+    if any(v.startswith("ERROR") for v in outcome.values()):
+        sys.exit(1)
@@ -0,0 +1,72 @@
+# T. Atkins, 2024
+import os
+import time
+from typing import List, Tuple
+
+# NB: matplotlib is only imported when a profile is applied, so that the command line tools importing the constants below start quickly
+
+# Render profiles:
+# > 'draft': text is typeset by matplotlib's own mathtext, with Computer Modern fonts to match the look of LaTeX (fast, no TeX installation needed)
+# > 'publication': text is typeset by LaTeX (usetex), as for the figures of the report (LaTeX is run for every text element, so this is much slower)
+PROFILES = ["draft", "publication"]
+DEFAULT_PROFILE = "draft"
+# Environment variables: the profile (e.g. 'PLOT_PROFILE=publication python plotting_main.py STD y'), and whether to print the time taken to save every figure
+PROFILE_ENV = "PLOT_PROFILE"
+TIMING_ENV = "PLOT_TIMING"
+
+# Time taken to save every figure of this run: (file, profile, seconds)
+TIMINGS: List[Tuple[str, str, float]] = []
+
+_profile = None
+
+
+def apply_profile(profile: str | None = None, family: str = "serif") -> str:
+    """
+    FUNCTION
+    > Set the matplotlib text rendering for the render profile 'profile' (see PROFILES), or the one set in the environment (PROFILE_ENV), 'draft' by default
+    > 'family' is the font family of the figures: 'serif' (Computer Modern) or 'sans-serif' (Helvetica with usetex, DejaVu Sans otherwise)
+    > Returns the profile applied
+    """
+    if profile is None:
+        profile = os.environ.get(PROFILE_ENV, DEFAULT_PROFILE)
+    match profile:
+        case "draft":
+            rc = {"text.usetex": False, "font.family": family}
+            if family == "serif":
+                rc["mathtext.fontset"] = "cm"
+                rc["font.serif"] = ["cmr10"]
+                # NB: cmr10 has no Unicode minus sign, and the axes tick labels need mathtext to use the one of the math fonts
+                rc["axes.formatter.use_mathtext"] = True
+            else:
+                rc["mathtext.fontset"] = "dejavusans"
+        case "publication":
+            rc = {"text.usetex": True, "font.family": family}
+            if family == "sans-serif":
+                rc["font.sans-serif"] = ["Helvetica"]
+        case _:
+            raise ValueError(
+                f"Render profile '{profile}' not recognised: must be one of {PROFILES}."
+            )
+
+    import matplotlib
+
+    matplotlib.rcParams.update(rc)
+    global _profile
+    _profile = profile
+    return profile
+
+
+def savefig(fig: "matplotlib.figure.Figure", file: str, **kwargs) -> float:
+    """
+    FUNCTION
+    > Save a figure as fig.savefig() does, and record the time taken in TIMINGS (most of the cost of the 'publication' profile is incurred here, when text is typeset)
+    > The time is also printed if TIMING_ENV is set in the environment
+    > Returns the time taken [s]
+    """
+    t0 = time.perf_counter()
+    fig.savefig(file, **kwargs)
+    dt = time.perf_counter() - t0
+    TIMINGS.append((file, _profile, dt))
+    if os.environ.get(TIMING_ENV):
+        print(f"[{_profile}] {file} saved in {dt:.2f} s.")
+    return dt
@@ -0,0 +1,110 @@
+# T. Atkins, 2024
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+ROOT = Path(__file__).resolve().parent
+
+# Commands that should return (with help or an error) without loading NumPy, pandas or matplotlib: (name, working directory, arguments)
+COMMANDS = [
+    ("spring_generator --help", "spring_generator", ["main.py", "--help"]),
+    ("spring_generator (no command)", "spring_generator", ["main.py"]),
+    (
+        "spring_generator spring (bad finger)",
+        "spring_generator",
+        ["main.py", "spring", "toe", "1", "1", "1"],
+    ),
+    ("tsf plotting (no mode)", "tsf", ["plotting_main.py"]),
+    ("tsf plotting (bad mode)", "tsf", ["plotting_main.py", "XYZ"]),
+    ("render --help", "", ["analysis/render.py", "--help"]),
+]
+# Target time [ms] for help output and command line errors
+TARGET_MS = 100.0
+# Modules whose import means that a command loaded more than it needed
+HEAVY = ["numpy", "pandas", "matplotlib"]
+
+
+def _run(cwd: str, args: List[str], importtime: bool = False) -> Tuple[float, str]:
+    """
+    FUNCTION
+    > Run 'python [args]' in the directory 'cwd' (relative to the repository root), returning the wall time taken [ms] and the standard error
+    """
+    flags = ["-X", "importtime"] if importtime else []
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, *flags, *args],
+        cwd=ROOT / cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return (time.perf_counter() - t0) * 1e3, proc.stderr
+
+
+def _imports(stderr: str) -> List[Tuple[str, float]]:
+    """
+    FUNCTION
+    > Parse the output of '-X importtime' into (top-level module, cumulative time [ms]), slowest first
+    """
+    out = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            out.append((name.strip(), int(cumulative) / 1e3))
+    return sorted(out, key=lambda x: -x[1])
+
+
+def bench_startup(n_runs: int = 5, n_top: int = 3) -> List[dict]:
+    """
+    FUNCTION
+    > Time every command of COMMANDS (median of 'n_runs' runs, after a first run to warm the bytecode caches) and print them as a table with their slowest imports
+    """
+    results = []
+    print(f"{'command':<40} {'median [ms]':>11} {'heavy':>6}  slowest imports [ms]")
+    for name, cwd, args in COMMANDS:
+        _run(cwd, args)
+        times = [_run(cwd, args)[0] for _ in range(n_runs)]
+        imports = _imports(_run(cwd, args, importtime=True)[1])
+        heavy = [m for m, _ in imports if m.split(".")[0] in HEAVY]
+        res = {
+            "command": name,
+            "median_ms": statistics.median(times),
+            "heavy": heavy,
+            "imports": imports[:n_top],
+        }
+        results.append(res)
+        top = ", ".join(f"{m} {t:.0f}" for m, t in res["imports"])
+        print(
+            f"{name:<40} {res['median_ms']:>11.1f} {'yes' if heavy else 'no':>6}  {top}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    # Usage examples (from the repository root):
+    # python bench_startup.py
+    # python bench_startup.py --runs 10 --max-ms 100
+    parser = argparse.ArgumentParser(
+        description="Benchmark the start-up time of the command line entry points (help output and command line errors)."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help=f"exit with an error if any command is slower (e.g. {TARGET_MS:.0f}), or imports {', '.join(HEAVY)}",
+    )
+    args = parser.parse_args()
+
+    results = bench_startup(args.runs)
+    if args.max_ms is not None and any(
+        r["median_ms"] > args.max_ms or r["heavy"] for r in results
+    ):
+        sys.exit(1)
@@ -1,54 +1,300 @@
 # T. Atkins, 2024
-from package.mk_spring_testing import mk_spring_testing
-from package.apply_heuristics import apply_heuristics
+import argparse
+import json
+import sys
+from contextlib import redirect_stdout
+from typing import List, Sequence
+from package.errors import SpringGenerationAborted, SpringGeneratorError
+from package.policies import FINGER_LST, POLICY_LST
 
-# from spring_generator.package.tests import tests
+# NB: The functions of the 'package' directory (and, with them, NumPy and pandas) are only imported by the command that uses them, so that '--help' and command line errors are instantaneous (see bench_startup.py)
 
+# Exit codes (NB: argparse exits with 2 on command line errors)
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_ABORTED = 3
 
-def main() -> None:
+# Examples of use (NB: these do not reflect the entire use history of this script throughout ALL testing, but rather snapshots of its use)
+# > MANUALLY create springs using mk_spring_testing(), e.g. TSF Test A (vary thickness: 75%, 100%, 125%)
+#   python main.py spring 2 12 80 12 0 --yes --comment TSF-testA --param-file [PARAMETER CSV] --tracker-file [TRACKER CSV]
+#   python main.py spring 2 12 80 16 0 --yes --comment TSF-testA --param-file [PARAMETER CSV] --tracker-file [TRACKER CSV]
+#   python main.py spring 2 12 80 20 0 --yes --comment TSF-testA --param-file [PARAMETER CSV] --tracker-file [TRACKER CSV]
+# > Use HEURISTICS to generate springs, i.e. using apply_heuristics() (for either the author's hand or the passive hand)
+#   python main.py heuristics [PARAMETER CSV] [TRACKER CSV] --policy batchC --batch-code "Batch C"
+# > OPTIMISE the springs of a hand for a target tip force profile [N] (constant, or one value per pose), i.e. using optimise_springs()
+#   python main.py optimise [PARAMETER CSV] [TRACKER CSV] --target 0.5 --batch-code "Batch O" --surrogate [STIFFNESS SURROGATE NPZ] --yes
+# > Evaluate every policy over a whole clinic of patients, i.e. using batch_heuristics()
+#   python main.py batch [PATIENT DIRECTORIES OR PARAMETER CSVS ...] --out results.csv
+# > Record the saved springs in the SQLite spring registry as well, i.e. using SpringRegistry
+#   python main.py heuristics [PARAMETER CSV] [TRACKER CSV] --policy batchC --batch-code "Batch C" --registry springs.db
+# > Unattended jobs (e.g. from a scheduler) should pass '--yes' or '--dry-run' and read the JSON summary, e.g. '--json -' (written to stdout, with all other output moved to stderr)
+
+
+def _parser() -> argparse.ArgumentParser:
     """
     FUNCTION
-    > Run various functions (mainly with the aim of generating springs) contained in the 'package' directory
-    > NB-1: The contents of this main() function do not reflect the entire use history of this function throughout ALL testing, but rather examples/snapshots of its use
-    > NB-2: See further details in the comments of the functions of the 'package' directory
+    > Build the command line parser of main()
     """
-    # Code to MANUALLY create springs using mk_spring_testing()
-    # # TSF Test A: vary thickness (75%, 100%, 125%)
-    # SAVE_MODE = "yes"
-    # print("Test A: vary thickness")
-    # mk_spring_testing(2, "12", 80, 12, 0, save_mode=SAVE_MODE, comment="TSF-testA")
-    # mk_spring_testing(2, "12", 80, 16, 0, save_mode=SAVE_MODE, comment="TSF-testA")
-    # mk_spring_testing(2, "12", 80, 20, 0, save_mode=SAVE_MODE, comment="TSF-testA")
-    # print("***")
-    # # TSF Test B: vary alpha (75%, 100%, 125%)
-    # print("Test B: vary alpha")
-    # mk_spring_testing(2, "12", 60, 16, 0, save_mode=SAVE_MODE, comment="TSF-testB")
-    # mk_spring_testing(2, "12", 80, 16, 0, save_mode=SAVE_MODE, comment="TSF-testB")
-    # mk_spring_testing(2, "12", 100, 16, 0, save_mode=SAVE_MODE, comment="TSF-testB")
-    # print("***")
-    # # TSF Test C: vary preload (i.e. pin spacing)
-    # print("Test C: vary preload")
-    # mk_spring_testing(2, "12", 80, 16, 0, save_mode=SAVE_MODE, comment="TSF-testC")
-    # mk_spring_testing(2, "12", 80, 16, 10, save_mode=SAVE_MODE, comment="TSF-testC")
-    # mk_spring_testing(2, "12", 80, 16, 30, save_mode=SAVE_MODE, comment="TSF-testC")
-
-    # ---------------#
-
-    # Use HEURISTICS to generate springs, i.e. using apply_heuristics()
-    # -> Author's hand
-    PARAM_FILE = "[INSERT PATH TO PARAMETER CSV (HUMAN) HERE]"
-    TRACKER_FILE = "[INSERT PATH TO TRACKER CSV (HUMAN) HERE]"
-    # -> Passive hand
-    PARAM_FILE = "[INSERT PATH TO PARAMETER CSV (PASSIVE HAND) HERE]"
-    TRACKER_FILE = "[INSERT PATH TO TRACKER CSV (PASSIVE HAND) HERE]"
-    apply_heuristics(
-        PARAM_FILE,
-        TRACKER_FILE,
-        policy="batchC",
-        batch_code="Batch C",
-        save_fingers="all",
+    # Options shared by every command
+    common = argparse.ArgumentParser(add_help=False)
+    confirm = common.add_mutually_exclusive_group()
+    confirm.add_argument(
+        "--yes",
+        action="store_true",
+        help="save generated springs without asking for confirmation",
+    )
+    confirm.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="generate springs without saving them (and without asking for confirmation)",
+    )
+    common.add_argument(
+        "--json",
+        metavar="PATH",
+        help="write a JSON summary of the run to PATH ('-' for stdout)",
+    )
+    common.add_argument(
+        "--registry",
+        metavar="DB",
+        help="also record the saved springs in the spring registry DB (see registry.py)",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Generate springs with the functions of the 'package' directory."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # apply_heuristics()
+    heuristics = subparsers.add_parser(
+        "heuristics",
+        parents=[common],
+        help="generate springs for a hand with a heuristic policy",
+    )
+    heuristics.add_argument("param_file")
+    heuristics.add_argument("tracker_file")
+    heuristics.add_argument("--policy", required=True, choices=POLICY_LST)
+    heuristics.add_argument("--batch-code", default="N/A")
+    heuristics.add_argument(
+        "--fingers", nargs="+", choices=FINGER_LST, default="all", metavar="FINGER"
+    )
+
+    # optimise_springs()
+    optimise = subparsers.add_parser(
+        "optimise",
+        parents=[common],
+        help="search the springs of a hand for a target tip force profile",
     )
+    optimise.add_argument("param_file")
+    optimise.add_argument("tracker_file")
+    optimise.add_argument(
+        "--target",
+        nargs="+",
+        type=float,
+        required=True,
+        help="tip force [N]: one value, or one per pose of the profile",
+    )
+    optimise.add_argument("--batch-code", default="N/A")
+    optimise.add_argument(
+        "--fingers", nargs="+", choices=FINGER_LST, default="all", metavar="FINGER"
+    )
+    optimise.add_argument(
+        "--hand", default="real", help="finger dimensions of the force model"
+    )
+    optimise.add_argument(
+        "--surrogate",
+        help="stiffness surrogate (.npz) predicting the spring forces (required to save the springs, see stiffness.py)",
+    )
+    optimise.add_argument("--material", default="petg", choices=["petg", "pla"])
+    optimise.add_argument("--workers", type=int, help="number of parallel processes")
+
+    # mk_spring_testing()
+    spring = subparsers.add_parser(
+        "spring",
+        parents=[common],
+        help="generate a single spring from user-specified parameters",
+    )
+    spring.add_argument("finger", type=int, choices=range(1, 6))
+    spring.add_argument("loc")
+    spring.add_argument("alpha", type=float)
+    spring.add_argument("thick", type=int, help="thickness in tenths of a mm")
+    spring.add_argument("preload", type=int, help="preload in %%")
+    spring.add_argument("--shape", default="triangle", choices=["triangle", "bell"])
+    spring.add_argument("--mode", default="prototype", choices=["prototype", "final"])
+    spring.add_argument("--comment", default="-")
+    spring.add_argument("--param-file")
+    spring.add_argument("--tracker-file")
+
+    # tests()
+    test_run = subparsers.add_parser(
+        "tests", parents=[common], help="generate one of the test runs of tests()"
+    )
+    test_run.add_argument("run", choices=["alpha", "preload", "thickness"])
+    test_run.add_argument("--param-file")
+    test_run.add_argument("--tracker-file")
+
+    # batch_heuristics()
+    batch = subparsers.add_parser(
+        "batch",
+        parents=[common],
+        help="evaluate heuristic policies over many hands at once",
+    )
+    batch.add_argument("hands", nargs="+", help="parameter CSVs or patient directories")
+    batch.add_argument(
+        "--policy", nargs="+", choices=POLICY_LST, default="all", dest="policies"
+    )
+    batch.add_argument("--out", help="CSV to write all results to")
+
+    return parser
+
+
+def _run(args: argparse.Namespace) -> List[dict]:
+    """
+    FUNCTION
+    > Run the command selected on the command line and return the generated springs
+    """
+    if args.yes:
+        save_mode = "yes"
+    elif args.dry_run:
+        save_mode = "no"
+    else:
+        save_mode = "manual"
+
+    match args.command:
+        case "heuristics":
+            from package.apply_heuristics import apply_heuristics
+
+            return apply_heuristics(
+                args.param_file,
+                args.tracker_file,
+                policy=args.policy,
+                batch_code=args.batch_code,
+                save_fingers=args.fingers,
+                save_mode=save_mode,
+            )
+        case "optimise":
+            from package.optimise import optimise_springs
+
+            return optimise_springs(
+                args.param_file,
+                args.tracker_file,
+                args.target,
+                batch_code=args.batch_code,
+                save_fingers=args.fingers,
+                save_mode=save_mode,
+                hand=args.hand,
+                surrogate=args.surrogate,
+                material=args.material,
+                workers=args.workers,
+            )
+        case "spring":
+            from package.mk_spring_testing import mk_spring_testing
+
+            return [
+                mk_spring_testing(
+                    args.finger,
+                    args.loc,
+                    args.alpha,
+                    args.thick,
+                    args.preload,
+                    shape=args.shape,
+                    mode=args.mode,
+                    save_mode=save_mode,
+                    comment=args.comment,
+                    param_file=args.param_file,
+                    tracker_file=args.tracker_file,
+                )
+            ]
+        case "tests":
+            from package.tests import tests
+
+            return tests(
+                args.run,
+                save_mode=save_mode,
+                param_file=args.param_file,
+                tracker_file=args.tracker_file,
+            )
+        case "batch":
+            from package.batch_heuristics import batch_heuristics
+
+            results = batch_heuristics(args.hands, args.policies, args.out)
+            return [
+                {"policy": policy, "hands": int(res["d"].shape[0])}
+                for policy, res in results.items()
+            ]
+
+
+def _record(db_file: str, springs: List[dict]) -> str | None:
+    """
+    FUNCTION
+    > Insert the springs of a run that were saved into the spring registry (in one transaction)
+    > The springs are already saved to the parameter and tracker files (which remain the reference) by then, so a failure of the registry does not fail the run: it is returned as a warning, and the registry is brought back in line by re-importing both files (see registry.py)
+    """
+    import sqlite3
+    from package.registry import SpringRegistry
+
+    saved = [s for s in springs if s.get("saved")]
+    try:
+        with SpringRegistry(db_file) as registry:
+            n = registry.add_springs(saved)
+    except sqlite3.Error as e:
+        ids = ", ".join(s["id"] for s in saved)
+        return f"Springs {ids} were saved, but not recorded in {db_file} ({e}): re-import the parameter and tracker files with 'python -m package.registry {db_file} import [PARAMETER CSV] [TRACKER CSV]'."
+    print(f"{n} spring(s) recorded in {db_file}.")
+    return None
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """
+    FUNCTION
+    > Run various functions (mainly with the aim of generating springs) contained in the 'package' directory from the command line (see the examples above and 'python main.py --help')
+    > Errors are reported on stderr and mapped to an exit code (EXIT_*) rather than halting the interpreter, so that generation jobs can be run unattended and in parallel
+    > NB-1: Without '--yes' or '--dry-run', the user is asked to confirm before any spring is saved (as when the functions are called directly)
+    > NB-2: See further details in the comments of the functions of the 'package' directory
+    """
+    args = _parser().parse_args(argv)
+
+    # When the JSON summary goes to stdout, everything else is moved to stderr so that stdout remains machine-readable
+    out = sys.stderr if args.json == "-" else sys.stdout
+    springs = []
+    error = None
+    warning = None
+    with redirect_stdout(out):
+        try:
+            springs = _run(args)
+            if args.registry is not None:
+                warning = _record(args.registry, springs)
+                if warning is not None:
+                    print(f"WARNING: {warning}", file=sys.stderr)
+            status, code = "ok", EXIT_OK
+        except SpringGenerationAborted as e:
+            status, code, error = "aborted", EXIT_ABORTED, str(e)
+            print(f"WARNING: {e}", file=sys.stderr)
+        except EOFError:
+            # A confirmation prompt was reached without an interactive user (use '--yes' or '--dry-run' in batch jobs)
+            status, code, error = "aborted", EXIT_ABORTED, "No confirmation given."
+            print(f"WARNING: {error}", file=sys.stderr)
+        except (SpringGeneratorError, OSError) as e:
+            status, code, error = "error", EXIT_ERROR, str(e)
+            print(f"ERROR: {e}", file=sys.stderr)
+
+    if args.json is not None:
+        summary = {
+            "command": args.command,
+            "status": status,
+            "exit_code": code,
+            "error": error,
+            "warning": warning,
+            "springs": springs,
+        }
+        if args.json == "-":
+            json.dump(summary, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, "w") as f:
+                json.dump(summary, f, indent=2)
+
+    return code
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
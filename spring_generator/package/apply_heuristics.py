@@ -1,10 +1,29 @@
 # T. Atkins, 2024
 import math
 import numpy as np
-import pandas as pd
+from package.errors import SpringGenerationAborted, SpringGeneratorError
+from package.param_store import load_params, param_value
+from package.policies import FINGER_LST, POLICY_LST
 from package.save_spring import save_spring
 from package.thickness_binning import thickness_binning
-from typing import Sequence, Union
+from typing import List, Sequence, Union
+
+# Setup (NB: the lists of possible policies and fingers are in package/policies.py)
+PRELOAD = 30
+ALPHA_SUFFIX = "alpha"
+
+# Setup spring thicknesses (the "base" value is 'CENTRE_T')
+T_INCREMENT = 0.4
+CENTRE_T = 1.6
+LOWER_T = np.round(CENTRE_T - T_INCREMENT, 2)
+HIGHER_T = np.round(CENTRE_T + T_INCREMENT, 2)
+T_BINS = np.round([LOWER_T, CENTRE_T, HIGHER_T], 2)
+
+# Alpha adjustments of the 'batchD' and 'bin_adaptive_lower' policies
+BATCHD_ALPHA_GAIN = 1.1
+MAX_ALPHA = 160.0
+# ADAPTIVE_PCT = T_INCREMENT / CENTRE_T # 25% is quite high
+ADAPTIVE_PCT = 0.1  # NB: this is a number found through trial and error
 
 
 def apply_heuristics(
@@ -13,7 +32,8 @@ def apply_heuristics(
     policy: str,
     batch_code: str = "N/A",
     save_fingers: Union[Sequence[str], str] = "all",
-) -> None:
+    save_mode: str = "manual",
+) -> List[dict]:
     """
     FUNCTION
     > Generate springs based on a selected 'policy'
@@ -24,49 +44,25 @@ def apply_heuristics(
     > NB-2: This process, or 'pipeline', for spring generation is explained in more detail in the report itself
     > For example, a very simplistic policy might state that the alpha of each spring should be proportional to its pin spacing
     > The policies listed below are more multi-faceted, and are more clearly detailed in the report itself
+    > 'save_mode' is as in mk_spring_testing(): "manual" asks for confirmation, whereas "yes" and "no" save (or discard) the springs without any prompt, for unattended batch jobs
+    > Returns the generated springs (see save_spring())
     """
-    # List of possible policies
-    POLICY_LST = [
-        "batchB",
-        "batchC",
-        "batchD",
-        "bin_fixed",
-        "bin_lower",
-        "bin_adaptive_lower",
-        "bin_outlier",
-    ]
     if policy not in POLICY_LST:
-        exit(f"ERROR: Heuristic policy '{policy}' not recognised.")
+        raise SpringGeneratorError(f"Heuristic policy '{policy}' not recognised.")
+    if save_mode not in ["manual", "yes", "no"]:
+        raise SpringGeneratorError(f"Save mode '{save_mode}' not recognised.")
     print(f"Applying heuristic policy '{policy}'.")
 
-    # Setup
-    FINGER_LST = ["thumb", "index", "middle", "ring", "little"]
-    PRELOAD = 30
-    ALPHA_SUFFIX = "alpha"
-
     # For fast prototpying (or the replacement of specific damaged or defective springs), it may not be required to print springs for an entire hand, but rather specific fingers
     if any(item not in FINGER_LST for item in save_fingers) and save_fingers != "all":
-        exit("ERROR: Parameter 'save_fingers' contains an incorrect value.")
+        raise SpringGeneratorError(
+            "Parameter 'save_fingers' contains an incorrect value."
+        )
     if save_fingers == "all":
         save_fingers = FINGER_LST
 
-    # Setup spring thicknesses (the "base" value is 'CENTRE_T')
-    T_INCREMENT = 0.4
-    CENTRE_T = 1.6
-    LOWER_T = np.round(CENTRE_T - T_INCREMENT, 2)
-    HIGHER_T = np.round(CENTRE_T + T_INCREMENT, 2)
-    T_BINS = np.round([LOWER_T, CENTRE_T, HIGHER_T], 2)
-
     # Import parameters
-    COL1_NAME = "param"
-    COL2_NAME = "value"
-    COL3_NAME = "unit"
-    df_param = pd.read_csv(
-        param_file,
-        names=[COL1_NAME, COL2_NAME, COL3_NAME],
-        usecols=[0, 1, 2],
-        dtype={COL1_NAME: str, COL2_NAME: float, COL3_NAME: str},
-    )
+    params = load_params(param_file)
 
     phalange_strs = []
     d_all = []
@@ -86,13 +82,13 @@ def apply_heuristics(
             alpha_param_str = phalange + ALPHA_SUFFIX
 
             # Retrieve measured values from the parameter file
-            d_base = df_param.loc[df_param[COL1_NAME] == phalange][COL2_NAME].iloc[0]
-            alpha_base = df_param.loc[df_param[COL1_NAME] == alpha_param_str][
-                COL2_NAME
-            ].iloc[0]
+            d_base = param_value(params, phalange)
+            alpha_base = param_value(params, alpha_param_str)
 
             if math.isnan(d_base) or math.isnan(alpha_base):
-                exit("ERROR: Pin spacing and/or alpha measurement not found in CSV.")
+                raise SpringGeneratorError(
+                    "Pin spacing and/or alpha measurement not found in CSV."
+                )
 
             # Apply preload
             d = d_base * (1 + PRELOAD / 100)
@@ -121,7 +117,7 @@ def apply_heuristics(
                         t_all.append(CENTRE_T)
                 case "batchD":
                     t_all.append(LOWER_T)
-                    alpha = min(160.0, alpha * 1.1)
+                    alpha = min(MAX_ALPHA, alpha * BATCHD_ALPHA_GAIN)
                 case _:
                     pass
 
@@ -135,9 +131,10 @@ def apply_heuristics(
 
     # The below contains the code used to select parameters based on binning logic (more details available in the report)
     if "bin_" in policy:
-        check = input("Applying tiebreaking, do you wish to continue (y/n)?: ")
-        if check != "y":
-            exit("WARNING: Execution halted.")
+        if save_mode == "manual":
+            check = input("Applying tiebreaking, do you wish to continue (y/n)?: ")
+            if check != "y":
+                raise SpringGenerationAborted("Execution halted.")
 
         # Binning wrt alpha
         binned_t_alpha = thickness_binning(alpha_all, T_BINS)
@@ -160,14 +157,16 @@ def apply_heuristics(
                     case "bin_lower":
                         t_use = min(t_alpha, t_d)
                     case "bin_adaptive_lower":
-                        # pct = T_INCREMENT / CENTRE_T # 25% is quite high
-                        pct = 0.1  # NB: this is a number found through trial and error
                         t_use = min(t_alpha, t_d)
-                        alpha_all[idx] = alpha_all[idx] * (1 + pct)
+                        alpha_all[idx] = alpha_all[idx] * (1 + ADAPTIVE_PCT)
                     case "bin_outlier":
-                        exit("ERROR: Tiebreak policy 'outlier' not yet implemented.")
+                        raise SpringGeneratorError(
+                            "Tiebreak policy 'outlier' not yet implemented."
+                        )
                     case _:
-                        exit(f"ERROR: Binning policy '{policy}' not recognised.")
+                        raise SpringGeneratorError(
+                            f"Binning policy '{policy}' not recognised."
+                        )
             else:
                 t_use = t_alpha
             t_all.append(t_use)
@@ -187,10 +186,9 @@ def apply_heuristics(
     # print(t_all)
 
     # Save spring
-    save_spring(
+    return save_spring(
         param_file,
         tracker_file,
-        df_param,
         phalange_strs,
         alpha_all,
         d_all,
@@ -198,6 +196,7 @@ def apply_heuristics(
         PRELOAD,
         batch_code,
         save_fingers,
+        save_mode=save_mode,
     )
 
 
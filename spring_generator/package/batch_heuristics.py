@@ -0,0 +1,181 @@
+# T. Atkins, 2024
+import os
+import numpy as np
+import pandas as pd
+from package.apply_heuristics import (
+    ADAPTIVE_PCT,
+    ALPHA_SUFFIX,
+    BATCHD_ALPHA_GAIN,
+    CENTRE_T,
+    FINGER_LST,
+    HIGHER_T,
+    LOWER_T,
+    MAX_ALPHA,
+    POLICY_LST,
+    PRELOAD,
+    T_BINS,
+)
+from package.errors import SpringGeneratorError
+from package.param_store import load_params, param_value
+from package.thickness_binning import thickness_binning_batch
+from typing import Dict, Sequence, Union
+
+# When a hand is given as a directory, its parameter file is expected under this name
+PARAM_FNAME = "param.csv"
+
+# Phalanges in the same order as apply_heuristics(), e.g. 'thumb01', 'thumb12', 'index01', ...
+PHALANGE_LST = [
+    finger + loc
+    for finger in FINGER_LST
+    for loc in (["01", "12"] if finger == "thumb" else ["01", "12", "23"])
+]
+FINGER_ARR = np.array([p[:-2] for p in PHALANGE_LST])
+LOC_ARR = np.array([p[-2:] for p in PHALANGE_LST])
+
+
+def _hand_file(hand: str) -> str:
+    """
+    FUNCTION
+    > Return the parameter file of a hand, given either the file itself or the directory of a patient
+    """
+    if os.path.isdir(hand):
+        return os.path.join(hand, PARAM_FNAME)
+    return hand
+
+
+def _policy_thickness(
+    policy: str, d: np.ndarray, alpha: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Apply a single heuristic policy to the (N, 14) arrays of preloaded pin spacings and alphas
+    > Returns the final d, alpha and thickness arrays of the policy (see apply_heuristics() for the definition of each policy)
+    """
+    alpha = alpha.copy()
+
+    match policy:
+        case "batchB":
+            t = np.where(np.isin(LOC_ARR, ["01", "12"]), CENTRE_T, LOWER_T)
+        case "batchC":
+            t = np.where(
+                LOC_ARR == "12",
+                CENTRE_T,
+                np.where(
+                    LOC_ARR == "23",
+                    LOWER_T,
+                    np.where(
+                        (LOC_ARR == "01")
+                        & np.isin(FINGER_ARR, ["index", "middle", "ring"]),
+                        HIGHER_T,
+                        CENTRE_T,
+                    ),
+                ),
+            )
+        case "batchD":
+            t = np.full(LOC_ARR.shape, LOWER_T)
+            alpha = np.minimum(MAX_ALPHA, alpha * BATCHD_ALPHA_GAIN)
+        case _:
+            # Binning wrt alpha and d, followed by a tiebreak policy where both disagree
+            t_alpha = thickness_binning_batch(alpha, T_BINS)
+            t_d = thickness_binning_batch(d, T_BINS)
+            tie = t_alpha != t_d
+            match policy:
+                case "bin_fixed":
+                    t = np.where(tie, CENTRE_T, t_alpha)
+                case "bin_lower":
+                    t = np.where(tie, np.minimum(t_alpha, t_d), t_alpha)
+                case "bin_adaptive_lower":
+                    t = np.where(tie, np.minimum(t_alpha, t_d), t_alpha)
+                    alpha = np.where(tie, alpha * (1 + ADAPTIVE_PCT), alpha)
+                case "bin_outlier":
+                    # The 'outlier' tiebreak is not yet implemented (see apply_heuristics()): tied phalanges are left without a thickness
+                    t = np.where(tie, np.nan, t_alpha)
+                    if tie.any():
+                        print(
+                            f"WARNING: Tiebreak policy 'outlier' not yet implemented, {int(tie.sum())} tied phalange(s) have no thickness."
+                        )
+                case _:
+                    raise SpringGeneratorError(
+                        f"Binning policy '{policy}' not recognised."
+                    )
+
+    t = np.broadcast_to(t, d.shape).astype(float)
+    return {"d": np.round(d).astype(int), "alpha": np.round(alpha).astype(int), "t": t}
+
+
+def batch_heuristics(
+    hands: Sequence[str],
+    policies: Union[Sequence[str], str] = "all",
+    out_file: str | None = None,
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    FUNCTION
+    > Batch equivalent of apply_heuristics(): compute d, alpha and thickness for every phalange of N hands at once, for one or more policies
+    > 'hands' is a list of parameter files (or patient directories containing a parameter file named PARAM_FNAME), one per hand
+    > All N x 14 phalanges are processed as NumPy arrays in a single pass per policy, rather than one hand (and one phalange) at a time
+    > Results are returned as {policy: {"d": (N, 14), "alpha": (N, 14), "t": (N, 14)}} with columns in the order of PHALANGE_LST
+    > 'policies' is "all", a single policy, or a list of policies (of POLICY_LST)
+    > If 'out_file' is given, all results are also written to it in a single (long format) CSV: one row per hand, policy and phalange
+    > NB-1: Unlike apply_heuristics(), nothing is saved in the parameter and tracker files (and no confirmation is requested), as this mode is meant for evaluating policies over many patients
+    > NB-2: Hands missing a pin spacing or alpha measurement are reported and skipped
+    > NB-3: Where apply_heuristics() raises on a tie of the 'outlier' policy (not yet implemented), the tied phalanges are left without a thickness (NaN) so that the other policies are still evaluated, and flagged in the 'unresolved_tie' column of the CSV
+    """
+    if policies == "all":
+        policies = POLICY_LST
+    elif isinstance(policies, str):
+        policies = [policies]
+    if any(policy not in POLICY_LST for policy in policies):
+        raise SpringGeneratorError(f"Heuristic policies '{policies}' not recognised.")
+
+    # Import the measurements of every hand into (N, 14) arrays
+    hand_files = [_hand_file(hand) for hand in hands]
+    d_base = np.empty((len(hand_files), len(PHALANGE_LST)))
+    alpha_base = np.empty_like(d_base)
+    for idx, hand_file in enumerate(hand_files):
+        params = load_params(hand_file)
+        d_base[idx] = [param_value(params, p) for p in PHALANGE_LST]
+        alpha_base[idx] = [param_value(params, p + ALPHA_SUFFIX) for p in PHALANGE_LST]
+
+    valid = ~(np.isnan(d_base).any(axis=1) | np.isnan(alpha_base).any(axis=1))
+    for hand_file in np.array(hand_files)[~valid]:
+        print(
+            f"WARNING: Pin spacing and/or alpha measurement not found in {hand_file}."
+        )
+    hand_files = [f for f, v in zip(hand_files, valid) if v]
+    d_base = d_base[valid]
+    alpha_base = alpha_base[valid]
+
+    # Apply preload
+    d = d_base * (1 + PRELOAD / 100)
+    alpha = alpha_base * (1 + PRELOAD / 100)
+
+    results = {policy: _policy_thickness(policy, d, alpha) for policy in policies}
+
+    # Write all results at once
+    if out_file is not None:
+        n_hands, n_phalanges = d.shape
+        df_out = pd.concat(
+            [
+                pd.DataFrame(
+                    {
+                        "hand": np.repeat(hand_files, n_phalanges),
+                        "policy": policy,
+                        "phalange": np.tile(PHALANGE_LST, n_hands),
+                        "d": res["d"].ravel(),
+                        "alpha": res["alpha"].ravel(),
+                        "t": res["t"].ravel(),
+                        "unresolved_tie": np.isnan(res["t"]).ravel(),
+                    }
+                )
+                for policy, res in results.items()
+            ],
+            ignore_index=True,
+        )
+        df_out.to_csv(out_file, index=False)
+        print(f"Results for {n_hands} hands stored in {out_file}.")
+
+    return results
+
+
+if __name__ == "__main__":
+    batch_heuristics()
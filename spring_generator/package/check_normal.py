@@ -1,10 +1,16 @@
 # T. Atkins, 2024
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy.stats as stats
+from pathlib import Path
 
-plt.rc("text", usetex=True)
-plt.rc("font", **{"family": "sans-serif", "sans-serif": ["Helvetica"]})
+# Repository root (for the shared 'analysis' package)
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from analysis.style import apply_profile
+
+# Render profile: 'draft' (mathtext, fast) unless PLOT_PROFILE=publication (usetex), see analysis/style.py
+apply_profile(family="sans-serif")
 
 
 def check_normal(mode: str = "qq") -> None:
@@ -0,0 +1,16 @@
+# T. Atkins, 2024
+
+
+class SpringGeneratorError(Exception):
+    """
+    CLASS
+    > Raised by the functions of the 'package' directory when spring generation cannot proceed (e.g. unknown policy, missing measurement)
+    > main() reports these errors and maps them to an exit code, rather than the functions exiting the interpreter themselves
+    """
+
+
+class SpringGenerationAborted(SpringGeneratorError):
+    """
+    CLASS
+    > Raised when the user declines a confirmation prompt
+    """
@@ -0,0 +1,236 @@
+# T. Atkins, 2024
+import numpy as np
+from package.policies import FINGER_LST
+from typing import Dict, List, Sequence
+
+# NumPy port of the finger force model of 'fk' (geometry.m, torques.m, jacobian.m, tip_force.m, as run by main.m), vectorised over any number of hands, fingers and joint-angle configurations
+# > Every input broadcasts against the others: the per-finger arrays have the 3 joints (or 4 pins for 'nxt') on their last axis, and any leading axes (e.g. (N,) configurations of one finger, or (hands, fingers, N))
+# > Units are those of the MATLAB scripts: lengths [mm], angles [rad], forces [N], torques [N.mm]
+
+# Hand dimensions of fk/main.m, by finger (ILLUSTRATIVE ONLY: the forces are dummy values there too)
+# > 'hgt': pin height above the phalanges [mm]; 'nxt': pin distance (along the phalange) to the next joint (or finger tip) [mm]; 'len': phalange lengths [mm] (0 for the missing 3rd phalange of the thumb); 'theta': joint angles [deg]; 'force': spring force per joint [N]
+HANDS = {
+    "real": {
+        "thumb": {
+            "hgt": 8.0,
+            "nxt": [34.37, 32.63 / 2, 30.74 / 2, 0.0],
+            "len": [32.63, 30.74, 0.0],
+            "theta": [80.0, 90.0, 0.0],
+            "force": [10.0, 10.0, 10.0],
+        },
+        "index": {
+            "hgt": 8.0,
+            "nxt": [24.7, 46.25 / 2, 24.30 / 2, 23.64 / 2],
+            "len": [46.25, 24.30, 25.18],
+            "theta": [90.0, 95.0, 80.0],
+            "force": [10.0, 10.0, 10.0],
+        },
+        "middle": {
+            "hgt": 8.0,
+            "nxt": [30.50, 48.64 / 2, 27.74 / 2, 24.50 / 2],
+            "len": [48.64, 27.74, 26.69],
+            "theta": [90.0, 95.0, 80.0],
+            "force": [10.0, 10.0, 10.0],
+        },
+        "ring": {
+            "hgt": 8.0,
+            "nxt": [26.90, 25.87 / 2, 26.78 / 2, 24.50 / 2],
+            "len": [25.87, 26.78, 24.50],
+            "theta": [90.0, 95.0, 80.0],
+            "force": [10.0, 10.0, 10.0],
+        },
+        "little": {
+            "hgt": 8.0,
+            "nxt": [19.35, 25.87 / 2, 26.78 / 2, 24.50 / 2],
+            "len": [25.87, 26.78, 24.50],
+            "theta": [90.0, 95.0, 80.0],
+            "force": [10.0, 10.0, 10.0],
+        },
+    }
+}
+
+
+def _index(names: np.ndarray, valid: List[str], kind: str) -> np.ndarray:
+    """
+    FUNCTION
+    > Return the positions of an array of names in the list 'valid'
+    """
+    unique, inverse = np.unique(names, return_inverse=True)
+    for name in unique:
+        if name not in valid:
+            raise ValueError(f"{kind} '{name}' not recognised: must be one of {valid}.")
+    return np.array([valid.index(n) for n in unique], dtype=int)[inverse].reshape(
+        names.shape
+    )
+
+
+def hand_params(
+    hands: str | Sequence[str], fingers: str | Sequence[str]
+) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Return the dimensions of HANDS for arrays of hand and finger names (broadcast against each other), as arrays with the shape of the names and the joints (or pins) on an extra last axis
+    > 'theta' is converted to radians, as expected by forces()
+    > e.g. hand_params("real", FINGER_LST)["len"] is a (5, 3) array
+    """
+    hands, fingers = np.broadcast_arrays(np.asarray(hands), np.asarray(fingers))
+    h_idx = _index(hands, list(HANDS), "Hand")
+    f_idx = _index(fingers, FINGER_LST, "Finger")
+    out = {}
+    for key in ["hgt", "nxt", "len", "theta", "force"]:
+        table = np.array(
+            [[HANDS[h][f][key] for f in FINGER_LST] for h in HANDS], dtype=float
+        )
+        out[key] = table[h_idx, f_idx]
+    out["theta"] = np.deg2rad(out["theta"])
+    return out
+
+
+def geometry(
+    x: np.ndarray, y: np.ndarray, h: np.ndarray, theta: np.ndarray, F: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Equivalent of fk/geometry.m for any number of joints at once: 'x' and 'y' are the distances of the proximal and distal pins to the joint, 'h' the pin height, 'theta' the joint angle and 'F' the spring force
+    > Returns the pin spacing 'd', the angles 'alpha' and 'lambda', and the tangential and normal forces on the proximal (1) and distal (2) phalanges ('F_T1', 'F_T2', 'F_N1', 'F_N2')
+    > NB: The steps of geometry.m are kept, but epsilon and gamma are eliminated: with the pins at (k + h sin(epsilon), h cos(epsilon)) and (-h sin(epsilon), -h cos(epsilon)) (step 6) and sin(epsilon) = p/k, d^2 = k^2 + 4h(p + h), and the angles of steps 9-10 only enter through their sines and cosines, so that only one arcsine is computed per joint
+    """
+    sin_t, cos_t = np.sin(theta), np.cos(theta)
+    # Steps 1-2 (cos(pi - theta) = -cos(theta))
+    k2 = x * x + y * y + 2 * x * y * cos_t
+    p = y * sin_t
+    # Steps 3-6
+    d = np.sqrt(k2 + 4 * h * (p + h))
+    # Steps 7-8
+    sin_l = (p - h * cos_t + h) / d
+    cos_l = np.sqrt(1 - sin_l * sin_l)
+    lam = np.arcsin(sin_l)
+    alpha = theta - lam
+    # Step 9: distal forces, beta = pi/2 - alpha
+    cos_a = cos_t * cos_l + sin_t * sin_l
+    sin_a = sin_t * cos_l - cos_t * sin_l
+    # Step 10: proximal forces, sigma = pi/2 - lambda
+    return {
+        "d": d,
+        "alpha": alpha,
+        "lambda": lam,
+        "F_T1": F * cos_l,
+        "F_T2": F * cos_a,
+        "F_N1": F * sin_l,
+        "F_N2": F * sin_a,
+    }
+
+
+def jacobian(length: np.ndarray, theta: np.ndarray) -> np.ndarray:
+    """
+    FUNCTION
+    > Equivalent of fk/jacobian.m: planar Jacobian (x, y, orientation) of the finger tip, as a (..., 3, 3) array
+    """
+    phi = np.cumsum(theta, axis=-1)
+    s = length * np.sin(phi)
+    c = length * np.cos(phi)
+    # Contribution of every phalange, summed from the tip down to each joint
+    a = np.stack(
+        [s[..., 0] + s[..., 1] + s[..., 2], s[..., 1] + s[..., 2], s[..., 2]], -1
+    )
+    b = np.stack(
+        [c[..., 0] + c[..., 1] + c[..., 2], c[..., 1] + c[..., 2], c[..., 2]], -1
+    )
+    return np.stack([-a, b, np.ones_like(a)], axis=-2)
+
+
+def forces(
+    nxt: np.ndarray,
+    length: np.ndarray,
+    hgt: np.ndarray,
+    theta: np.ndarray,
+    force: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Evaluate the whole force model of fk/main.m (geometry, joint torques, Jacobian solve and tip force) for any number of fingers and configurations at once
+    > 'nxt' (..., 4), 'length' (..., 3), 'theta' (..., 3) and 'force' (..., 3) are the arrays of hand_params() (or of a sweep of joint angles), and 'hgt' (...) the pin height; they broadcast against each other
+    > Returns the per-joint outputs of geometry() (..., 3) (NaN for missing joints, i.e. the 3rd of the thumb), the joint torques 'torque' (..., 3) as in torques.m, the end-effector force 'F_ee' (..., 3) (solution of J^T F_ee = torque) and the tip force 'F_tip' (...) as in tip_force.m
+    > NB: The 3x3 solve uses Cramer's rule (exact, and much faster than a batched np.linalg.solve()); singular configurations give NaN or inf
+    """
+    nxt, length, theta, force = (
+        np.asarray(a, dtype=float) for a in (nxt, length, theta, force)
+    )
+    h = np.asarray(hgt, dtype=float)[..., None]
+
+    # Geometry of all joints: the phalanges missing (len = 0) exert no force
+    present = length != 0
+    y = length - nxt[..., 1:]
+    geo = geometry(nxt[..., :3], y, h, theta, force)
+    F_T1, F_T2, F_N1, F_N2 = (geo[key] for key in ["F_T1", "F_T2", "F_N1", "F_N2"])
+    if not present.all():
+        F_T1, F_T2, F_N1, F_N2 = (
+            np.where(present, F, 0.0) for F in (F_T1, F_T2, F_N1, F_N2)
+        )
+        for key in geo:
+            geo[key] = np.where(present, geo[key], np.nan)
+
+    # Torques (torques.m): every joint takes the distal forces of its own pins and the proximal forces of the next joint
+    shape = F_T1.shape[:-1] + (1,)
+    F_T1_next = np.concatenate([F_T1[..., 1:], np.zeros(shape)], axis=-1)
+    F_N1_next = np.concatenate([F_N1[..., 1:], np.zeros(shape)], axis=-1)
+    torque = h * (F_T2 - F_T1_next) - y * (F_N2 - F_N1_next)
+    if not present.all():
+        torque = np.where(present, torque, 0.0)
+
+    # Forces in base frame: J^T F_ee = torque, with J^T = [[-a1, b1, 1], [-a2, b2, 1], [-a3, b3, 1]] (see jacobian())
+    # > Subtracting the last row leaves a 2x2 system in (Fx, Fy), with a1 - a3 = s1 + s2, a2 - a3 = s2 (s: L*sin(phi) of every phalange, and c: L*cos(phi)), and then F_ee(3) = tau3 + a3 Fx - b3 Fy
+    phi = np.cumsum(theta, axis=-1)
+    sin_phi, cos_phi = np.sin(phi), np.cos(phi)
+    s_ph = length * sin_phi
+    c_ph = length * cos_phi
+    a13, a23 = s_ph[..., 0] + s_ph[..., 1], s_ph[..., 1]
+    b13, b23 = c_ph[..., 0] + c_ph[..., 1], c_ph[..., 1]
+    t13 = torque[..., 0] - torque[..., 2]
+    t23 = torque[..., 1] - torque[..., 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        det = a23 * b13 - a13 * b23
+        Fx = (t13 * b23 - t23 * b13) / det
+        Fy = (a23 * t13 - a13 * t23) / det
+    Fz = torque[..., 2] + s_ph[..., 2] * Fx - c_ph[..., 2] * Fy
+    F_ee = np.stack([Fx, Fy, Fz], axis=-1)
+
+    # Tip force (tip_force.m), with rho = phi3: cos(mu) = cos(rho - pi/2) = sin(rho) and cos(xi) = cos(pi - rho) = -cos(rho)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        F_tip = np.hypot(Fx / sin_phi[..., 2], Fy * cos_phi[..., 2])
+
+    return geo | {"torque": torque, "F_ee": F_ee, "F_tip": F_tip}
+
+
+def sweep(
+    hand: str, finger: str, theta: np.ndarray, force: np.ndarray | None = None
+) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Evaluate forces() for one finger of HANDS over an array of joint-angle configurations 'theta' (..., 3) [rad], and optionally of spring forces 'force' (..., 3) [N] (those of HANDS otherwise)
+    """
+    p = hand_params(hand, finger)
+    if force is None:
+        force = p["force"]
+    return forces(p["nxt"], p["len"], p["hgt"], theta, force)
+
+
+if __name__ == "__main__":
+    # Usage example (from spring_generator): python -m package.kinematics
+    # > Prints the same quantities as fk/main.m (F_ee(1:2) and Ftip for every finger), to check the port against the MATLAB scripts, then times a sweep of joint angles
+    import time
+
+    p = hand_params("real", FINGER_LST)
+    out = forces(p["nxt"], p["len"], p["hgt"], p["theta"], p["force"])
+    for i, finger in enumerate(FINGER_LST):
+        print(
+            f"{finger}: F_ee(1:2) = {out['F_ee'][i, :2]}, Ftip = {out['F_tip'][i]:.4f}"
+        )
+
+    N = 1_000_000
+    rng = np.random.default_rng(0)
+    theta = np.deg2rad(rng.uniform(60, 120, (N, 3)))
+    t0 = time.perf_counter()
+    sweep("real", "index", theta)
+    dt = time.perf_counter() - t0
+    print(f"{N} configurations in {dt:.2f} s ({N / dt / 1e6:.1f} M/s).")
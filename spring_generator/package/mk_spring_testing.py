@@ -1,7 +1,16 @@
 # T. Atkins, 2024
 import sys
-import pandas as pd
-from string import digits
+from contextlib import nullcontext
+from package.errors import SpringGeneratorError
+from package.param_store import load_params, param_value
+from package.spring_code import encode_code
+from package.spring_id import ALPHA_PREFIX, D_PREFIX, T_PREFIX
+from package.spring_writer import SpringWriter
+
+# Default parameter file location
+PARAM_FILE = "[INSERT PATH TO PARAMETER CSV HERE]"
+# Default tracker file location
+TRACKER_FILE = "[INSERT PATH TO TRACKER CSV HERE]"
 
 
 def mk_spring_testing(
@@ -14,7 +23,10 @@ def mk_spring_testing(
     mode="prototype",
     save_mode="manual",
     comment="-",
-) -> None:
+    param_file: str | None = None,
+    tracker_file: str | None = None,
+    writer: SpringWriter | None = None,
+) -> dict:
     """
     FUNCTION
     > Unlike apply_heuristics(), which generates springs based on pre-set rules, this function serves to manually generate springs given user-specified spring parameters
@@ -23,6 +35,9 @@ def mk_spring_testing(
     > The tracker file stores the parameters of the generated spring in a more human-readable format, allowing for easy lookup when writing test reports etc.
     > NB-1: The parameter file also contains the (fixed) measurements of the user's hand (e.g. range-of-motion (ROM) and pin spacing at max. ROM without preload)
     > NB-2: This process, or 'pipeline', for spring generation is explained in more detail in the report itself
+    > NB-3: 'param_file' and 'tracker_file' default to the locations below (PARAM_FILE and TRACKER_FILE)
+    > NB-4: The spring is saved to both files in a single transaction (see SpringWriter); when generating many springs in a loop, pass an open 'writer' so that they are all saved in one bulk write (the writer's files are then used)
+    > Returns a dictionary describing the spring (ID, parameters, code and whether it was saved), e.g. for the JSON summary of main(); a spring that is not saved has no ID (None)
     """
     # Input type checking
     if (
@@ -36,7 +51,7 @@ def mk_spring_testing(
         or save_mode not in ["manual", "yes", "no"]
         or not isinstance(comment, str)
     ):
-        raise Exception("Parameter error.")
+        raise SpringGeneratorError("Parameter error.")
 
     # Given the numeric finger integer passed to the function, assign a finger name
     # NB: This name is used in the parameter CSV, e.g. 'index01' refers to the pin spacing for the (from proximal to distal) first spring on the index
@@ -49,64 +64,34 @@ def mk_spring_testing(
     preload = preload_raw / 100
     alpha = round(alpha)
 
-    # Parameter file location
-    FILE_LOC = "[INSERT PATH TO PARAMETER CSV HERE]"
-    # Tracker file location
-    TRACKER_LOC = "[INSERT PATH TO TRACKER CSV HERE]"
+    # Parameter and tracker file locations
+    if writer is not None:
+        FILE_LOC = writer.param_file
+        TRACKER_LOC = writer.tracker_file
+    else:
+        FILE_LOC = PARAM_FILE if param_file is None else param_file
+        TRACKER_LOC = TRACKER_FILE if tracker_file is None else tracker_file
 
     # Retrieve the measured pin spacing at max. ROM for the selected finger and apply the preload to compute the pin spacing (d) of the spring
-    COL1_NAME = "param"
-    COL2_NAME = "value"
-    COL3_NAME = "unit"
-    df = pd.read_csv(
-        FILE_LOC,
-        names=[COL1_NAME, COL2_NAME, COL3_NAME],
-        usecols=[0, 1, 2],
-        dtype={COL1_NAME: str, COL2_NAME: float, COL3_NAME: str},
-    )
-    try:
-        d_base = df.loc[df[COL1_NAME] == phalange][COL2_NAME].iloc[0]
-    except:
-        exit("ERROR: Pin spacings not located in reference CSV.")
+    params = load_params(FILE_LOC)
+    if phalange not in params:
+        raise SpringGeneratorError("Pin spacings not located in reference CSV.")
+    d_base = param_value(params, phalange)
     d = d_base * (1 + preload)
 
-    ALPHA_PREFIX = "a"
-    D_PREFIX = "d"
-    THICK_PREFIX = "t"
+    # Parameter file rows of the new spring (d, alpha and thickness), prefixed with its ID once allocated
+    # NB: alpha is written as a float (e.g. '80.0'), as it was when these rows were written through a DataFrame
+    param_rows = [
+        [D_PREFIX, d, "mm"],
+        [ALPHA_PREFIX, float(alpha), "deg"],
+        [T_PREFIX, thick, "mm"],
+    ]
 
-    # Generate a unique ID for the new spring (this is the same process as in save_spring())
-    tail = df.tail(1).iloc[0, 0]
-    numeric_tail = "".join(c for c in tail if c in digits)
-    letter_tail = "".join(i for i in tail if not i.isdigit())
-    if numeric_tail == "" or letter_tail not in [ALPHA_PREFIX, D_PREFIX, THICK_PREFIX]:
-        id_str = "001"
-    else:
-        id_str = str(int(numeric_tail) + 1).zfill(3)
+    # Generate the spring code for storage in the tracker file (the structure of this code is detailed in the report and details all characteristics of the spring)
+    code_str = encode_code(phalange, alpha, thick, preload_raw, shape=shape, mode=mode)
 
-    # Store the d, alpha and thickness of the new spring in a DataFrame
-    new_spring = pd.DataFrame(
-        [
-            [D_PREFIX + id_str, d, "mm"],
-            [ALPHA_PREFIX + id_str, alpha, "deg"],
-            [THICK_PREFIX + id_str, thick, "mm"],
-        ]
-    )
-
-    # Generate the spring code for storage in the tracker file (the structure of this code is detailed in the report and details all characteristics of the spring) and store it in a DataFrame
-    if shape == "triangle":
-        name_code = "T"
-    else:
-        name_code = "B"
-
-    if mode == "prototype":
-        mode_code = "P"
-    else:
-        mode_code = "F"
-    code_str = f"{name_code}({mode_code})-{finger_lst[finger-1]}{loc}-{str(alpha).zfill(3)}.{str(thick_raw).zfill(2)}.{str(preload_raw).zfill(2)}"
-    new_code = pd.DataFrame([[id_str, code_str, comment]])
-
-    print(f"Specification for spring {id_str}:")
-    print(new_spring.to_string(index=False, header=False))
+    print(f"Specification for the new spring ({phalange}):")
+    print(f"d: {d} mm, alpha: {alpha} deg, t: {thick} mm")
     print(f"Spring code: {code_str}")
 
     # Append the details of the new spring to the relevant CSV file
@@ -114,21 +99,37 @@ def mk_spring_testing(
         save_mode == "manual"
     ):  # in this mode the user provides input for every spring; for later programmatic spring generation, "yes" and "no" overrides are provided
         save = input("Confirm storing of new spring (y/n): ")
-        if save == "y":
-            new_spring.to_csv(FILE_LOC, index=False, header=False, mode="a")
-            new_code.to_csv(TRACKER_LOC, index=False, header=False, mode="a")
-            save_bool = True
-        else:
-            save_bool = False
-    elif save_mode == "yes":
-        new_spring.to_csv(FILE_LOC, index=False, header=False, mode="a")
-        new_code.to_csv(TRACKER_LOC, index=False, header=False, mode="a")
-        save_bool = True
+        save_bool = save == "y"
     else:
-        save_bool = False
+        save_bool = save_mode == "yes"
+    id_str = None
+    if save_bool:
+        # Generate a unique ID for the new spring (this is the same process as in save_spring())
+        # NB: The ID is only allocated once the spring is confirmed, and the parameter file stays locked from then until the spring is saved, so that concurrent generators cannot hand out the same ID
+        with (
+            nullcontext(writer) if writer else SpringWriter(FILE_LOC, TRACKER_LOC)
+        ) as w:
+            id_str = str(w.next_id).zfill(3)
+            w.add(
+                [[prefix + id_str, value, unit] for prefix, value, unit in param_rows],
+                [id_str, code_str, comment],
+            )
+        print(f"Spring ID: {id_str}")
     print(f"Saved: {save_bool}")
     print("-----")
 
+    return {
+        "id": id_str,
+        "phalange": phalange,
+        "d": float(d),
+        "alpha": int(alpha),
+        "t": thick,
+        "preload": preload_raw,
+        "code": code_str,
+        "comment": comment,
+        "saved": save_bool,
+    }
+
 
 if __name__ == "__main__":
     # The below allows for this function to (alternatively) be run from the command line with: 'python mkspring.py [finger] [loc] [alpha] [thick] [preload]'
@@ -0,0 +1,375 @@
+# T. Atkins, 2024
+import math
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from package.apply_heuristics import CENTRE_T, MAX_ALPHA, T_INCREMENT
+from package.errors import SpringGeneratorError
+from package.kinematics import HANDS, forces, hand_params
+from package.param_store import load_params, param_value
+from package.policies import FINGER_LST
+from package.save_spring import save_spring
+from typing import Dict, List, Sequence, Tuple, Union
+
+# Search space of every spring (phalange)
+# > Alpha [deg] and preload [%] are saved as integers, so the search is refined down to steps of 1
+# > Thicknesses are restricted to printable values, i.e. multiples of the extrusion width of the nozzle (T_INCREMENT, as for T_BINS), within the range of the T-SF tests
+ALPHA_RANGE = (50, int(MAX_ALPHA))
+PRELOAD_RANGE = (0, 50)
+T_GRID = np.round(np.arange(0.8, 2.0 + 1e-9, T_INCREMENT), 2)
+# Coarse grid steps (alpha [deg], preload [%]), halved at every refinement around the best springs until they reach 1
+ALPHA_STEP = 20
+PRELOAD_STEP = 10
+
+# Target tip force profile: the joint angles of the poses are these fractions of the max. ROM of the finger (the angles of kinematics.HANDS)
+PROFILE_FRACTIONS = (0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+# Number of candidate springs of the first joint evaluated together with every combination of the others (bounds the memory of the search)
+COMBO_CHUNK = 16
+
+# Spring stiffness model [N/mm], as a function of alpha and thickness (ILLUSTRATIVE ONLY: a placeholder, used unless a surrogate fitted to the T-SF tests is given, see stiffness.py)
+# > Bending of a leaf: the stiffness grows with the cube of the thickness, and decreases as the spring opens (alpha)
+K_REF = 0.5
+ALPHA_REF = 80.0
+ALPHA_EXP = 1.0
+
+
+def spring_stiffness(alpha: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """
+    FUNCTION
+    > Stiffness [N/mm] of springs of angle 'alpha' [deg] and thickness 't' [mm] (see K_REF)
+    """
+    return K_REF * (t / CENTRE_T) ** 3 * (ALPHA_REF / alpha) ** ALPHA_EXP
+
+
+@lru_cache(maxsize=None)
+def _surrogate(file: str) -> "StiffnessTable":
+    # NB: imported here, as the surrogate brings in pandas (and the T-SF loaders), which the default model does not need
+    from package.stiffness import StiffnessTable
+
+    return StiffnessTable(file)
+
+
+@lru_cache(maxsize=None)
+def _unit_response(
+    hand: str, finger: str, fractions: Tuple[float, ...]
+) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Evaluate the force model (see kinematics.forces()) once for every pose of the profile and a unit spring force at every joint, and memoise it
+    > The end-effector force is linear in the spring forces, so that the tip force of any set of springs follows from these unit responses without evaluating the model again
+    > Returns the pin spacings 'd' (P, 3) [mm], the pin spacing at max. ROM 'd_rom' (3,), the base-frame forces 'Fx' and 'Fy' (P, 3) per unit force of every joint, the angle 'rho' (P,) of the tip (see tip_force.m) and the number of joints
+    """
+    p = hand_params(hand, finger)
+    theta = p["theta"] * np.asarray(fractions)[:, None]
+    unit = forces(
+        p["nxt"], p["len"], p["hgt"], theta[:, None, :], np.eye(3)[None, :, :]
+    )
+    rom = forces(p["nxt"], p["len"], p["hgt"], p["theta"], p["force"])
+    return {
+        "d": unit["d"][:, 0, :],
+        "d_rom": rom["d"],
+        "Fx": unit["F_ee"][..., 0],
+        "Fy": unit["F_ee"][..., 1],
+        "rho": theta.sum(axis=-1),
+        "n_joints": int((p["len"] != 0).sum()),
+    }
+
+
+def _candidates(
+    alphas: np.ndarray, ts: np.ndarray, preloads: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Return every combination of the given alphas, thicknesses and preloads, as flat arrays
+    """
+    a, t, pl = np.meshgrid(alphas, ts, preloads, indexing="ij")
+    return {"alpha": a.ravel(), "t": t.ravel(), "preload": pl.ravel()}
+
+
+def _spring_forces(
+    cand: Dict[str, np.ndarray],
+    d: np.ndarray,
+    d_rom: float,
+    surrogate: str | None = None,
+    material: str = "petg",
+) -> np.ndarray:
+    """
+    FUNCTION
+    > Force [N] of candidate springs of one joint at every pose of the profile, as a (C, P) array
+    > The free length of a spring is the pin spacing at max. ROM with the preload applied, rounded to a mm (i.e. the pin spacing d saved by optimise_springs()), and it only pushes when compressed
+    > The force is that of the stiffness surrogate 'surrogate' (.npz, see stiffness.py) for 'material' if given, or of spring_stiffness() otherwise
+    """
+    free = np.round(d_rom * (1 + cand["preload"][:, None] / 100))
+    compression = np.maximum(free - d[None, :], 0.0)
+    if surrogate is not None:
+        return _surrogate(surrogate).load(
+            cand["t"][:, None],
+            cand["alpha"][:, None],
+            free,
+            compression / free,
+            material,
+        )
+    k = spring_stiffness(cand["alpha"], cand["t"])[:, None]
+    return k * compression
+
+
+def _best_combo(
+    cands: List[Dict[str, np.ndarray]],
+    response: Dict[str, np.ndarray],
+    target: np.ndarray,
+    surrogate: str | None = None,
+    material: str = "petg",
+) -> Tuple[List[int], float]:
+    """
+    FUNCTION
+    > Evaluate the tip force profile of every combination of the candidate springs of the joints (at least 2) of a finger at once, and return the combination (index of the candidate of every joint) closest to 'target' (least squares) and its RMS error [N]
+    """
+    # Contributions of the candidates of every joint to the base-frame tip force, (C, P) each
+    Fx, Fy = [], []
+    for j, c in enumerate(cands):
+        F = _spring_forces(
+            c, response["d"][:, j], response["d_rom"][j], surrogate, material
+        )
+        Fx.append(F * response["Fx"][:, j])
+        Fy.append(F * response["Fy"][:, j])
+    # Sum the contributions of all joints but the first into one flat (C1 x C2 x ..., P) table
+    P = target.shape[0]
+    rest_x, rest_y = Fx[-1], Fy[-1]
+    for j in range(len(cands) - 2, 0, -1):
+        rest_x = (Fx[j][:, None, :] + rest_x[None, :, :]).reshape(-1, P)
+        rest_y = (Fy[j][:, None, :] + rest_y[None, :, :]).reshape(-1, P)
+
+    # Tip force (tip_force.m), for chunks of the candidates of the first joint against all combinations of the others
+    sin_rho, cos_rho = np.sin(response["rho"]), np.cos(response["rho"])
+    best, best_err = (0, 0), math.inf
+    for i in range(0, Fx[0].shape[0], COMBO_CHUNK):
+        x = (Fx[0][i : i + COMBO_CHUNK, None, :] + rest_x[None]) / sin_rho
+        y = (Fy[0][i : i + COMBO_CHUNK, None, :] + rest_y[None]) * cos_rho
+        err = ((np.hypot(x, y) - target) ** 2).mean(axis=-1)
+        idx = np.unravel_index(np.argmin(err), err.shape)
+        if err[idx] < best_err:
+            best, best_err = (i + idx[0], idx[1]), float(err[idx])
+
+    sizes = [c["alpha"].shape[0] for c in cands[1:]]
+    combo = [int(best[0])] + [int(i) for i in np.unravel_index(best[1], sizes)]
+    return combo, math.sqrt(best_err)
+
+
+def _axis(centre: float, step: float, bounds: Tuple[int, int]) -> np.ndarray:
+    """
+    FUNCTION
+    > Values of a parameter around 'centre', one 'step' apart, within 'bounds' (rounded to integers, as saved)
+    """
+    values = np.round(np.clip([centre - step, centre, centre + step], *bounds))
+    return np.unique(values)
+
+
+def optimise_finger(
+    finger: str,
+    target: Sequence[float],
+    hand: str = "real",
+    fractions: Sequence[float] = PROFILE_FRACTIONS,
+    surrogate: str | None = None,
+    material: str = "petg",
+    d_base: Sequence[float] | None = None,
+) -> Dict[str, list | float]:
+    """
+    FUNCTION
+    > Search the alpha, thickness and preload of every spring of a finger so that its tip force (see kinematics.py) follows 'target' [N] over the poses of 'fractions' (see PROFILE_FRACTIONS)
+    > 'surrogate' and 'material' select the model of the spring force (see _spring_forces())
+    > 'd_base' is the pin spacing at max. ROM of every joint measured on the hand (see the parameter file): the pin spacings of the force model are scaled to it, so that the free length of the springs searched is that of the springs saved (by default, the pin spacings of kinematics.HANDS are used as they are)
+    > Coarse-to-fine grid search: every combination of the springs of all joints is evaluated at once on a coarse grid (ALPHA_STEP, PRELOAD_STEP, T_GRID), and the grid is then refined around the best springs, with half the steps, until they reach 1 deg and 1 %
+    > Returns lists of the alphas, thicknesses and preloads of the springs (from proximal to distal), the tip force profile reached, and its RMS error [N]
+    """
+    fractions = tuple(float(f) for f in fractions)
+    target = np.broadcast_to(np.asarray(target, dtype=float), (len(fractions),))
+    response = _unit_response(hand, finger, fractions)
+    n = response["n_joints"]
+    if d_base is not None:
+        if len(d_base) != n:
+            raise SpringGeneratorError(
+                f"{n} pin spacing(s) expected for the {finger}, {len(d_base)} given."
+            )
+        d_rom = response["d_rom"].copy()
+        d_rom[:n] = d_base
+        response = {
+            **response,
+            "d": response["d"] * (d_rom / response["d_rom"]),
+            "d_rom": d_rom,
+        }
+
+    # Coarse grid
+    alphas = np.arange(ALPHA_RANGE[0], ALPHA_RANGE[1] + 1, ALPHA_STEP)
+    preloads = np.arange(PRELOAD_RANGE[0], PRELOAD_RANGE[1] + 1, PRELOAD_STEP)
+    cands = [_candidates(alphas, T_GRID, preloads)] * n
+    combo, err = _best_combo(cands, response, target, surrogate, material)
+    springs = [{k: v[i] for k, v in c.items()} for c, i in zip(cands, combo)]
+
+    # Refinement around the best springs (the neighbouring printable thicknesses are kept in the search)
+    a_step, p_step = ALPHA_STEP, PRELOAD_STEP
+    while a_step > 1 or p_step > 1:
+        a_step, p_step = max(a_step // 2, 1), max(p_step // 2, 1)
+        cands = []
+        for s in springs:
+            i_t = int(np.argmin(np.abs(T_GRID - s["t"])))
+            cands.append(
+                _candidates(
+                    _axis(s["alpha"], a_step, ALPHA_RANGE),
+                    T_GRID[max(i_t - 1, 0) : i_t + 2],
+                    _axis(s["preload"], p_step, PRELOAD_RANGE),
+                )
+            )
+        combo, err = _best_combo(cands, response, target, surrogate, material)
+        springs = [{k: v[i] for k, v in c.items()} for c, i in zip(cands, combo)]
+
+    # Tip force profile of the springs found
+    F = np.stack(
+        [
+            _spring_forces(
+                {k: np.atleast_1d(v) for k, v in s.items()},
+                response["d"][:, j],
+                response["d_rom"][j],
+                surrogate,
+                material,
+            )[0]
+            for j, s in enumerate(springs)
+        ],
+        axis=-1,
+    )
+    Fx = (F * response["Fx"][:, :n]).sum(axis=-1)
+    Fy = (F * response["Fy"][:, :n]).sum(axis=-1)
+    F_tip = np.hypot(Fx / np.sin(response["rho"]), Fy * np.cos(response["rho"]))
+
+    return {
+        "alpha": [int(s["alpha"]) for s in springs],
+        "t": [float(s["t"]) for s in springs],
+        "preload": [int(s["preload"]) for s in springs],
+        "F_tip": F_tip.tolist(),
+        "rms_error": err,
+    }
+
+
+def _optimise_finger_job(job: tuple) -> Dict[str, list | float]:
+    return optimise_finger(*job)
+
+
+def optimise_springs(
+    param_file: str,
+    tracker_file: str,
+    target: Union[Sequence[float], float],
+    batch_code: str = "N/A",
+    save_fingers: Union[Sequence[str], str] = "all",
+    save_mode: str = "manual",
+    hand: str = "real",
+    surrogate: str | None = None,
+    material: str = "petg",
+    workers: int | None = None,
+) -> List[dict]:
+    """
+    FUNCTION
+    > Optimisation mode of the spring generator: unlike the fixed rules of apply_heuristics(), the alpha, thickness and preload of every spring are searched (see optimise_finger()) so that the tip force of every finger follows a target profile
+    > 'target' is the tip force [N], either constant or one value per pose of PROFILE_FRACTIONS
+    > 'surrogate' is the stiffness surrogate (.npz, see stiffness.py) predicting the force of the springs of 'material'; without it, the placeholder spring_stiffness() is used, and the springs can only be generated with save_mode "no" (i.e. not saved)
+    > 'hand' selects the finger dimensions of the force model (see kinematics.HANDS), scaled to the pin spacings at max. ROM measured in the parameter file (see optimise_finger()); the pin spacings of the saved springs are these measurements, with the preload applied (as in apply_heuristics())
+    > The fingers are optimised in parallel, by up to 'workers' processes (one per finger by default, within the number of CPUs)
+    > The springs are saved with save_spring() (i.e. in the same format as the other modes, for the CAD import), with the preload of every spring in its code and their own mode ('optimised', see spring_code.py)
+    > Returns the generated springs (see save_spring()), with the tip force profile reached by every finger and its RMS error
+    """
+    if save_mode not in ["manual", "yes", "no"]:
+        raise SpringGeneratorError(f"Save mode '{save_mode}' not recognised.")
+    if hand not in HANDS:
+        raise SpringGeneratorError(f"Hand '{hand}' not recognised.")
+    if surrogate is None and save_mode != "no":
+        raise SpringGeneratorError(
+            "Springs optimised with the placeholder stiffness model cannot be saved: give a stiffness surrogate (see stiffness.py), or use save mode 'no'."
+        )
+    if surrogate is not None:
+        # The surrogate must have curves of the material (otherwise every force of the search would be NaN)
+        try:
+            _surrogate(surrogate).load(CENTRE_T, ALPHA_REF, 0.0, 0.0, material)
+        except ValueError as e:
+            raise SpringGeneratorError(str(e)) from e
+    if save_fingers == "all":
+        save_fingers = FINGER_LST
+    if any(item not in FINGER_LST for item in save_fingers):
+        raise SpringGeneratorError(
+            "Parameter 'save_fingers' contains an incorrect value."
+        )
+    if np.ndim(target) > 0 and len(target) not in [1, len(PROFILE_FRACTIONS)]:
+        raise SpringGeneratorError(
+            f"The target must be one tip force, or one per pose ({len(PROFILE_FRACTIONS)})."
+        )
+    print(f"Optimising springs for a tip force of {target} N.")
+
+    # Only the fingers saved are optimised, for the pin spacings at max. ROM measured on the hand
+    fingers = [f for f in FINGER_LST if f in save_fingers]
+    params = load_params(param_file)
+    d_bases = {}
+    for finger in fingers:
+        n = int((hand_params(hand, finger)["len"] != 0).sum())
+        d_bases[finger] = [
+            param_value(params, finger + loc) for loc in ["01", "12", "23"][:n]
+        ]
+        if any(math.isnan(d) for d in d_bases[finger]):
+            raise SpringGeneratorError("Pin spacing measurement not found in CSV.")
+    jobs = [
+        (finger, target, hand, PROFILE_FRACTIONS, surrogate, material, d_bases[finger])
+        for finger in fingers
+    ]
+    if workers is None:
+        workers = min(len(jobs), os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = dict(zip(fingers, pool.map(_optimise_finger_job, jobs)))
+    else:
+        results = {finger: optimise_finger(*job) for finger, job in zip(fingers, jobs)}
+
+    # Springs whose tip force could not be predicted (e.g. outside the surrogate) must not be saved
+    failed = [
+        finger
+        for finger in fingers
+        if not (
+            np.isfinite(results[finger]["rms_error"])
+            and np.isfinite(results[finger]["F_tip"]).all()
+        )
+    ]
+    if failed:
+        raise SpringGeneratorError(
+            f"The tip force of {failed} could not be predicted with the stiffness model: no springs were saved."
+        )
+
+    # Pin spacings of the springs: measured at max. ROM, with the preload applied (as in _spring_forces())
+    phalange_strs, alpha_all, d_all, t_all, preload_all = [], [], [], [], []
+    for finger in fingers:
+        res = results[finger]
+        print(
+            f"{finger}: tip force {np.round(res['F_tip'], 2).tolist()} N (RMS error: {res['rms_error']:.3f} N)."
+        )
+        for loc, d_base, alpha, t, preload in zip(
+            ["01", "12", "23"], d_bases[finger], res["alpha"], res["t"], res["preload"]
+        ):
+            phalange_strs.append(finger + loc)
+            alpha_all.append(alpha)
+            d_all.append(int(round(d_base * (1 + preload / 100))))
+            t_all.append(t)
+            preload_all.append(preload)
+
+    springs = save_spring(
+        param_file,
+        tracker_file,
+        phalange_strs,
+        alpha_all,
+        d_all,
+        t_all,
+        preload_all,
+        batch_code,
+        save_fingers,
+        save_mode=save_mode,
+        mode="optimised",
+    )
+    for spring in springs:
+        res = results["".join(i for i in spring["phalange"] if not i.isdigit())]
+        spring["F_tip"] = res["F_tip"]
+        spring["rms_error"] = res["rms_error"]
+    return springs
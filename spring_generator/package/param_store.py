@@ -0,0 +1,123 @@
+# T. Atkins, 2024
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+from typing import Dict, Tuple
+
+# The caches of all parameter files are stored in a single folder (rather than next to each file, e.g. in the patient directories of batch_heuristics()), as JSON named after a hash of the path of the parameter file
+# > The folder can be moved with the SPRING_GENERATOR_CACHE environment variable
+CACHE_DIR = os.environ.get(
+    "SPRING_GENERATOR_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "spring_generator"),
+)
+CACHE_VERSION = 2
+
+# In-process copy of the parsed parameter files, so that repeated lookups within a single run do not even hit the on-disk cache
+_loaded: Dict[str, Tuple[Tuple[int, int], Dict[str, Tuple[float, str]]]] = {}
+
+
+def _cache_file(path: str) -> str:
+    return os.path.join(
+        CACHE_DIR, hashlib.sha1(path.encode()).hexdigest()[:16] + ".json"
+    )
+
+
+def _parse_params(param_file: str) -> Dict[str, Tuple[float, str]]:
+    """
+    FUNCTION
+    > Parse the parameter CSV into a dictionary mapping each parameter name (e.g. 'index12', 'index12alpha', 'd001') to its (value, unit) pair
+    > Only the first occurrence of a parameter name is kept, which matches the behaviour of the previous 'df.loc[df[...] == name].iloc[0]' lookups
+    > Missing values are stored as NaN, as they were when the file was read with pandas
+    """
+    params = {}
+    with open(param_file, newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0] in params:
+                continue
+            if len(row) > 1 and row[1].strip() != "":
+                value = float(row[1])
+            else:
+                value = math.nan
+            unit = row[2] if len(row) > 2 else ""
+            params[row[0]] = (value, unit)
+    return params
+
+
+def load_params(param_file: str) -> Dict[str, Tuple[float, str]]:
+    """
+    FUNCTION
+    > Load the parameter file into a hashed index of parameter name -> (value, unit), so that every lookup is O(1) instead of a scan of the whole file
+    > The parameter file grows by three rows for every spring ever saved, so the parsed index is also cached on disk (see CACHE_DIR)
+    > The cache is keyed on the modification time and size of the parameter file: any change to the file (e.g. a newly saved spring) invalidates it
+    > NB: Failing to write the cache (e.g. on a read-only network share) is not an error, the file is simply parsed again on the next run
+    """
+    stat = os.stat(param_file)
+    key = (stat.st_mtime_ns, stat.st_size)
+    path = os.path.abspath(param_file)
+
+    # Already loaded during this run
+    if path in _loaded and _loaded[path][0] == key:
+        return _loaded[path][1]
+
+    # Try the on-disk cache
+    cache_file = _cache_file(path)
+    params = None
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+        # NB: The path is checked as well, in case of a collision of the hashes
+        if [cache["version"], cache["path"], cache["key"]] == [
+            CACHE_VERSION,
+            path,
+            list(key),
+        ]:
+            params = {k: (float(v), str(u)) for k, (v, u) in cache["params"].items()}
+    except (OSError, ValueError, TypeError, KeyError):
+        pass
+
+    # Otherwise, parse the CSV and refresh the cache (written to a temporary file first so that a concurrent reader never sees a partial cache)
+    if params is None:
+        params = _parse_params(param_file)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(tmp_file, "w") as f:
+                # NB: Missing values are written as NaN, which json reads back
+                json.dump(
+                    {
+                        "version": CACHE_VERSION,
+                        "path": path,
+                        "key": list(key),
+                        "params": params,
+                    },
+                    f,
+                )
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+
+    _loaded[path] = (key, params)
+    return params
+
+
+def param_value(params: Dict[str, Tuple[float, str]], name: str) -> float:
+    """
+    FUNCTION
+    > Return the value of parameter 'name', or NaN if it is not present in the parameter file
+    """
+    return params.get(name, (math.nan, ""))[0]
+
+
+if __name__ == "__main__":
+    # Usage example (from spring_generator): python -m package.param_store [PARAMETER CSV]
+    parser = argparse.ArgumentParser(
+        description="Load (and cache) a parameter file, and print its parameters."
+    )
+    parser.add_argument("param_file")
+    args = parser.parse_args()
+
+    for name, (value, unit) in load_params(args.param_file).items():
+        print(f"{name}: {value} {unit}")
@@ -0,0 +1,15 @@
+# T. Atkins, 2024
+# NB: This module has no dependencies, so that the command line (main.py) can offer these choices without loading NumPy or pandas
+
+# List of possible policies
+POLICY_LST = [
+    "batchB",
+    "batchC",
+    "batchD",
+    "bin_fixed",
+    "bin_lower",
+    "bin_adaptive_lower",
+    "bin_outlier",
+]
+
+FINGER_LST = ["thumb", "index", "middle", "ring", "little"]
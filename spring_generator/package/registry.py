@@ -0,0 +1,355 @@
+# T. Atkins, 2024
+import argparse
+import csv
+import os
+import sqlite3
+from package.errors import SpringGeneratorError
+from package.spring_code import decode_code
+from package.spring_id import ALPHA_PREFIX, D_PREFIX, T_PREFIX
+from typing import Dict, Iterable, List, Sequence
+
+# Columns of the springs table (see SpringRegistry), in the order of the dictionaries returned by save_spring() and mk_spring_testing() where they exist
+SPRING_COLUMNS = [
+    "id",
+    "phalange",
+    "alpha",
+    "d",
+    "t",
+    "preload",
+    "shape",
+    "mode",
+    "code",
+    "batch",
+    "material",
+]
+# The values of a spring's rows of the parameter file as written (d, alpha, thickness), when imported from it (see import_csv()), so that export_param_csv() reproduces the file exactly
+WRITTEN_COLUMN = "written"
+# Columns that can be queried with SpringRegistry.find() (all of them indexed, alone or as the leading columns of an index)
+QUERY_COLUMNS = ["id", "phalange", "t", "batch", "alpha", "material"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS springs (
+    id INTEGER PRIMARY KEY,
+    phalange TEXT,
+    alpha REAL NOT NULL,
+    d REAL NOT NULL,
+    t REAL NOT NULL,
+    preload INTEGER,
+    shape TEXT,
+    mode TEXT,
+    code TEXT,
+    batch TEXT,
+    material TEXT,
+    written TEXT
+);
+CREATE INDEX IF NOT EXISTS springs_phalange_t_batch ON springs (phalange, t, batch);
+CREATE INDEX IF NOT EXISTS springs_batch ON springs (batch);
+CREATE INDEX IF NOT EXISTS springs_alpha ON springs (alpha);
+CREATE INDEX IF NOT EXISTS springs_material ON springs (material);
+CREATE TABLE IF NOT EXISTS measurements (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    value REAL,
+    unit TEXT,
+    written TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    spring_id INTEGER NOT NULL REFERENCES springs (id),
+    test TEXT NOT NULL,
+    material TEXT,
+    comp REAL NOT NULL,
+    load REAL NOT NULL,
+    PRIMARY KEY (spring_id, test, comp)
+);
+"""
+
+
+def _decode(code: str | None) -> dict:
+    """
+    FUNCTION
+    > Parameters of a spring code (see decode_code()), or an empty dictionary if there is no valid code
+    """
+    try:
+        return decode_code(code) if code else {}
+    except SpringGeneratorError:
+        return {}
+
+
+def _spring_row(spring: dict) -> tuple:
+    """
+    FUNCTION
+    > Row of the springs table for a spring dictionary (e.g. of save_spring() or mk_spring_testing()): the shape, mode (names of decode_code()) and preload are decoded from its code where not given, and the batch is its 'batch' (or 'comment')
+    """
+    code = _decode(spring.get("code"))
+    row = {
+        "id": int(spring["id"]),
+        "phalange": spring.get("phalange"),
+        "alpha": float(spring["alpha"]),
+        "d": float(spring["d"]),
+        # NB: thicknesses are stored rounded, so that they can be looked up by equality
+        "t": round(float(spring["t"]), 2),
+        "preload": spring.get("preload", code.get("preload")),
+        "shape": spring.get("shape", code.get("shape")),
+        "mode": spring.get("mode", code.get("mode")),
+        "code": spring.get("code"),
+        "batch": spring.get("batch", spring.get("comment")),
+        "material": spring.get("material"),
+        WRITTEN_COLUMN: spring.get(WRITTEN_COLUMN),
+    }
+    return tuple(row[c] for c in SPRING_COLUMNS + [WRITTEN_COLUMN])
+
+
+class SpringRegistry:
+    """
+    CLASS
+    > Embedded (SQLite) registry of the springs: one row per spring with indexed columns, the measurements of the hand, and the results of the tests of the springs
+    > Unlike the parameter and tracker files, springs are looked up with indexed queries (e.g. find(phalange="index12", t=1.6, batch="Batch C")) rather than by parsing whole files, and the parameter file read by Autodesk Inventor is regenerated on demand (see export_param_csv())
+    > Use as a context manager: the changes are committed on a normal exit (or rolled back if an exception is raised); every add_*() inserts its rows in one statement
+    """
+
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self) -> "SpringRegistry":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
+
+    def add_springs(self, springs: Iterable[dict]) -> int:
+        """
+        FUNCTION
+        > Insert (or replace, by ID) springs given as dictionaries with (at least) the keys 'id', 'alpha', 'd' and 't' (see _spring_row())
+        > Returns the number of springs inserted
+        """
+        columns = SPRING_COLUMNS + [WRITTEN_COLUMN]
+        rows = [_spring_row(s) for s in springs]
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO springs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            rows,
+        )
+        return len(rows)
+
+    def add_measurements(self, rows: Iterable[Sequence]) -> int:
+        """
+        FUNCTION
+        > Insert (or update) measurements of the hand as (name, value, unit) rows, e.g. ('index12', 41.16, 'mm'), optionally followed by the value as written in the parameter file; their order is kept for export_param_csv()
+        """
+        rows = [(*r, None) if len(r) == 3 else tuple(r) for r in rows]
+        self.conn.executemany(
+            "INSERT INTO measurements (name, value, unit, written) VALUES (?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value, unit = excluded.unit, written = excluded.written",
+            rows,
+        )
+        return len(rows)
+
+    def add_results(self, rows: Iterable[Sequence]) -> int:
+        """
+        FUNCTION
+        > Insert (or replace) test results as (spring ID, test code, material, compression, load [N]) rows, e.g. the record points of the T-SF tests (see stiffness.ingest())
+        """
+        rows = [(int(r[0]), r[1], r[2], float(r[3]), float(r[4])) for r in rows]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows
+        )
+        return len(rows)
+
+    def find(self, **filters) -> List[dict]:
+        """
+        FUNCTION
+        > Return the springs (as dictionaries, by ID) matching all 'filters', e.g. find(phalange="index12", t=1.6, batch="Batch C")
+        > A filter is a value, or a list of values (any of which matches); the columns that can be filtered are those of QUERY_COLUMNS
+        """
+        clauses, values = [], []
+        for column, value in filters.items():
+            if column not in QUERY_COLUMNS:
+                raise ValueError(
+                    f"Column '{column}' cannot be queried: must be one of {QUERY_COLUMNS}."
+                )
+            value_lst = value if isinstance(value, (list, tuple)) else [value]
+            if column == "t":
+                value_lst = [round(float(v), 2) for v in value_lst]
+            clauses.append(f"{column} IN ({', '.join('?' * len(value_lst))})")
+            values.extend(value_lst)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        cur = self.conn.execute(
+            f"SELECT {', '.join(SPRING_COLUMNS)} FROM springs{where} ORDER BY id",
+            values,
+        )
+        return [dict(row) for row in cur]
+
+    def results(self, spring_id: int) -> List[dict]:
+        """
+        FUNCTION
+        > Return the test results of a spring, by test and compression
+        """
+        cur = self.conn.execute(
+            "SELECT test, material, comp, load FROM results WHERE spring_id = ? ORDER BY test, comp",
+            (int(spring_id),),
+        )
+        return [dict(row) for row in cur]
+
+    def import_csv(self, param_file: str, tracker_file: str) -> Dict[str, int]:
+        """
+        FUNCTION
+        > Import the springs and hand measurements of a parameter file and its tracker file (the dual-CSV store of save_spring()) in one transaction
+        > The spring rows of the parameter file ('dNNN', 'aNNN', 'tNNN') are joined to the tracker rows by ID (springs without a tracker row are kept, without phalange, code or batch); all other rows are measurements
+        > The values are also kept as written (e.g. '40' or '40.0'), so that exporting the registry reproduces the parameter file byte for byte
+        > Returns the number of springs and measurements imported
+        """
+        springs, measurements = {}, []
+        with open(param_file, newline="") as f:
+            for row in csv.reader(f):
+                if not row:
+                    continue
+                name = row[0]
+                written = row[1] if len(row) > 1 else ""
+                value = float(written) if written.strip() else None
+                prefix, num = name[:1], name[1:]
+                if prefix in [D_PREFIX, ALPHA_PREFIX, T_PREFIX] and num.isdigit():
+                    key = {D_PREFIX: "d", ALPHA_PREFIX: "alpha", T_PREFIX: "t"}[prefix]
+                    spring = springs.setdefault(int(num), {"id": int(num)})
+                    spring[key] = value
+                    spring[f"{key}_{WRITTEN_COLUMN}"] = written
+                else:
+                    measurements.append(
+                        (name, value, row[2] if len(row) > 2 else "", written)
+                    )
+        with open(tracker_file, newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 2 or not row[0].strip().isdigit():
+                    continue
+                spring = springs.get(int(row[0]))
+                if spring is None:
+                    continue
+                spring["code"] = row[1].strip()
+                spring["batch"] = row[2] if len(row) > 2 else None
+                code = _decode(spring["code"])
+                if code:
+                    spring["phalange"] = code["phalange"]
+        complete = [s for s in springs.values() if {"alpha", "d", "t"} <= s.keys()]
+        for s in complete:
+            s[WRITTEN_COLUMN] = ",".join(
+                s.pop(f"{k}_{WRITTEN_COLUMN}") for k in ["d", "alpha", "t"]
+            )
+        with self.conn:
+            self.add_measurements(measurements)
+            self.add_springs(complete)
+        return {"springs": len(complete), "measurements": len(measurements)}
+
+    def export_param_csv(self, out_file: str) -> None:
+        """
+        FUNCTION
+        > Regenerate the parameter file read by Autodesk Inventor: the measurements of the hand (in their original order), followed by the d, alpha and thickness of every spring (by ID), in the layout written by save_spring()
+        > Values imported from a parameter file are written as they were (see import_csv()); others as by save_spring() (see _param_value())
+        """
+        rows = []
+        for r in self.conn.execute(
+            "SELECT name, value, unit, written FROM measurements ORDER BY seq"
+        ):
+            if r["written"] is not None:
+                value = r["written"]
+            else:
+                value = "" if r["value"] is None else _param_value(r["value"])
+            rows.append([r["name"], value, r["unit"]])
+        for s in self.conn.execute(
+            f"SELECT id, d, alpha, t, {WRITTEN_COLUMN} FROM springs ORDER BY id"
+        ):
+            id_str = str(s["id"]).zfill(3)
+            if s[WRITTEN_COLUMN] is not None:
+                d, alpha, t = s[WRITTEN_COLUMN].split(",")
+            else:
+                d, alpha, t = _param_value(s["d"]), _param_value(s["alpha"]), s["t"]
+            rows.append([D_PREFIX + id_str, d, "mm"])
+            rows.append([ALPHA_PREFIX + id_str, alpha, "deg"])
+            rows.append([T_PREFIX + id_str, t, "mm"])
+        _write_csv(out_file, rows)
+
+    def export_tracker_csv(self, out_file: str) -> None:
+        """
+        FUNCTION
+        > Regenerate the tracker file: ID, code and batch (or comment) of every spring with a code
+        """
+        rows = [
+            [str(s["id"]).zfill(3), s["code"], s["batch"]]
+            for s in self.conn.execute(
+                "SELECT id, code, batch FROM springs WHERE code IS NOT NULL ORDER BY id"
+            )
+        ]
+        _write_csv(out_file, rows)
+
+
+def _param_value(value: float) -> int | float:
+    """
+    FUNCTION
+    > Value of a parameter as written by save_spring() (and in the measurements of the hand): whole values as integers (e.g. '52' rather than '52.0')
+    """
+    return int(value) if float(value).is_integer() else value
+
+
+def _write_csv(out_file: str, rows: List[Sequence]) -> None:
+    """
+    FUNCTION
+    > Write rows to a CSV (through a temporary file, so that a reader such as Inventor never sees a partial file)
+    """
+    tmp_file = out_file + ".tmp"
+    with open(tmp_file, "w", newline="") as f:
+        csv.writer(f, lineterminator=os.linesep).writerows(rows)
+    os.replace(tmp_file, out_file)
+
+
+if __name__ == "__main__":
+    # Usage examples (from spring_generator):
+    # python -m package.registry springs.db import [PARAMETER CSV] [TRACKER CSV]
+    # python -m package.registry springs.db find --phalange index12 --t 1.6 --batch "Batch C"
+    # python -m package.registry springs.db export [PARAMETER CSV] --tracker [TRACKER CSV]
+    parser = argparse.ArgumentParser(description="Manage the spring registry.")
+    parser.add_argument("db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import a parameter file and its tracker file")
+    imp.add_argument("param_file")
+    imp.add_argument("tracker_file")
+    find = sub.add_parser("find", help="query springs")
+    for column in QUERY_COLUMNS:
+        find.add_argument(
+            f"--{column}", nargs="+", type=float if column in ["t", "alpha"] else str
+        )
+    exp = sub.add_parser(
+        "export", help="regenerate the parameter file (and tracker file)"
+    )
+    exp.add_argument("param_file")
+    exp.add_argument("--tracker")
+    args = parser.parse_args()
+
+    with SpringRegistry(args.db) as registry:
+        match args.command:
+            case "import":
+                counts = registry.import_csv(args.param_file, args.tracker_file)
+                print(
+                    f"{counts['springs']} spring(s) and {counts['measurements']} measurement(s) imported into {args.db}."
+                )
+            case "find":
+                filters = {
+                    c: getattr(args, c)
+                    for c in QUERY_COLUMNS
+                    if getattr(args, c) is not None
+                }
+                for spring in registry.find(**filters):
+                    print(
+                        ", ".join(
+                            f"{k}: {v}" for k, v in spring.items() if v is not None
+                        )
+                    )
+            case "export":
+                registry.export_param_csv(args.param_file)
+                if args.tracker:
+                    registry.export_tracker_csv(args.tracker)
+                print(f"Parameter file regenerated in {args.param_file}.")
@@ -1,22 +1,26 @@
 # T. Atkins, 2024
 # import numpy as np
-import pandas as pd
-from string import digits
-from typing import Sequence
+from contextlib import nullcontext
+from package.spring_code import encode_code
+from package.spring_id import ALPHA_PREFIX, D_PREFIX, T_PREFIX
+from package.spring_writer import SpringWriter
+from typing import List, Sequence
 
 
 def save_spring(
     out_file: str,
     tracker_file: str,
-    param_df: pd.DataFrame,
     phalange_lst: Sequence[str],
     alpha_lst: Sequence[int],
     d_lst: Sequence[int],
     t_lst: Sequence[float],
-    preload: int,
+    preload: int | Sequence[int],
     batch_code: str,
     save_fingers: Sequence[str],
-) -> None:
+    save_mode: str = "manual",
+    writer: SpringWriter | None = None,
+    mode: str = "heuristic",
+) -> List[dict]:
     """
     FUNCTION
     > Save springs generated by other functions in the 'pacakge' directory
@@ -25,63 +29,85 @@ def save_spring(
     > The tracker file stores the parameters of the generated spring in a more human-readable format, allowing for easy lookup when writing test reports etc.
     > NB-1: The parameter file also contains the (fixed) measurements of the user's hand (e.g. range-of-motion (ROM) and pin spacing at max. ROM without preload)
     > NB-2: This process, or 'pipeline', for spring generation is explained in more detail in the report itself
+    > NB-3: The spring IDs are only allocated once the springs are confirmed: the parameter file is locked from then until the springs are saved (but not while waiting for the user), so that concurrent generators cannot hand out the same ID
+    > NB-4: Springs are saved to both files in a single transaction (see SpringWriter); to accumulate the springs of several calls into one transaction, pass an open 'writer'
+    > 'preload' is either the preload of all springs, or one per spring (e.g. for the optimisation mode, see optimise.py)
+    > 'mode' is the mode of the springs in their code (see spring_code.py): "heuristic" for apply_heuristics(), "optimised" for optimise_springs()
+    > 'save_mode' is as in mk_spring_testing(): "manual" asks for confirmation, whereas "yes" and "no" save (or discard) the springs without any prompt
+    > Returns one dictionary per spring (ID, parameters, code and whether it was saved), e.g. for the JSON summary of main(); springs that are not saved have no ID (None)
     """
 
-    ALPHA_PREFIX = "a"
-    D_PREFIX = "d"
-    T_PREFIX = "t"
+    if isinstance(preload, int):
+        preload = [preload] * len(phalange_lst)
 
-    # Generate a unique ID for the new spring by searching for the most recent existing ID in the parameter file
-    tail = param_df.tail(1).iloc[0, 0]
-    numeric_tail = "".join(c for c in tail if c in digits)
-    letter_tail = "".join(i for i in tail if not i.isdigit())
-    if numeric_tail == "" or letter_tail not in [ALPHA_PREFIX, D_PREFIX, T_PREFIX]:
-        id_int = 1
-    else:
-        id_int = int(numeric_tail) + 1
-
-    param_df_out_lst = []
-    tracker_df_out_lst = []
-    for phalange, alpha, d, t in zip(phalange_lst, alpha_lst, d_lst, t_lst):
+    # Specification of every spring of the selected fingers
+    # NB: The spring IDs are only allocated once the springs are confirmed (see below), so that the parameter file is not locked while waiting for the user
+    param_rows_lst = []
+    springs = []
+    for phalange, alpha, d, t, spring_preload in zip(
+        phalange_lst, alpha_lst, d_lst, t_lst, preload
+    ):
         current_finger = "".join(i for i in phalange if not i.isdigit())
         if current_finger in save_fingers:
-            id_str = str(id_int).zfill(3)
-
-            # With regards to the tracking file, generate the spring code (the structure of this code is detailed in the report and details all characteristics of the spring)
-            param_df_out_lst.append(
-                [D_PREFIX + id_str, d, "mm"],
-            )
-            param_df_out_lst.append(
-                [ALPHA_PREFIX + id_str, alpha, "deg"],
+            # With regards to the parameter file, the rows of the spring (prefixed with its ID once allocated)
+            param_rows_lst.append(
+                [[D_PREFIX, d, "mm"], [ALPHA_PREFIX, alpha, "deg"], [T_PREFIX, t, "mm"]]
             )
-            param_df_out_lst.append([T_PREFIX + id_str, t, "mm"])
 
-            # With regards to tracking, generate the spring code
-            code_str = f"T(hP)-{phalange}-{str(alpha).zfill(3)}.{str(int(t*10)).zfill(2)}.{str(preload).zfill(2)}"
-            tracker_df_out_lst.append([id_str, code_str, batch_code])
+            # With regards to tracking, generate the spring code (the structure of this code is detailed in the report and details all characteristics of the spring)
+            code_str = encode_code(phalange, alpha, t, spring_preload, mode=mode)
+            springs.append(
+                {
+                    "id": None,
+                    "phalange": phalange,
+                    "d": int(d),
+                    "alpha": int(alpha),
+                    "t": float(t),
+                    "preload": int(spring_preload),
+                    "code": code_str,
+                    "batch": batch_code,
+                }
+            )
 
             # Debugging/confirmation readout
-            print(f"Specification for spring {id_str}")
-            print(f"d: {d} mm, alpha: {alpha} deg, t: {t} mm (preload: {preload}%)")
+            print(f"Specification for spring {len(springs)} ({phalange})")
+            print(
+                f"d: {d} mm, alpha: {alpha} deg, t: {t} mm (preload: {spring_preload}%)"
+            )
             print(f"Code: {code_str}")
             print("---")
-
-            id_int += 1
         else:
             pass
-    param_df_out = pd.DataFrame(param_df_out_lst)
-    tracker_df_out = pd.DataFrame(tracker_df_out_lst)
 
     # Save spring parameters and spring code (tracking) in the relevant CSVs
-    save = input(
-        f"Are you sure that you want to save the above springs under {batch_code} (y/n)?: "
-    )
-    if save == "y":
-        param_df_out.to_csv(out_file, index=False, header=False, mode="a")
-        tracker_df_out.to_csv(tracker_file, index=False, header=False, mode="a")
-        print("Saved: True")
+    if save_mode == "manual":
+        save = input(
+            f"Are you sure that you want to save the above springs under {batch_code} (y/n)?: "
+        )
+        save_bool = save == "y"
     else:
-        print("Saved: False")
+        save_bool = save_mode == "yes"
+    if save_bool:
+        # Generate a unique ID for every new spring from the most recent existing ID in the parameter file
+        with (
+            nullcontext(writer) if writer else SpringWriter(out_file, tracker_file)
+        ) as w:
+            for spring, param_rows in zip(springs, param_rows_lst):
+                id_str = str(w.next_id).zfill(3)
+                w.add(
+                    [
+                        [prefix + id_str, value, unit]
+                        for prefix, value, unit in param_rows
+                    ],
+                    [id_str, spring["code"], batch_code],
+                )
+                spring["id"] = id_str
+                print(f"Spring {id_str}: {spring['code']}")
+    print(f"Saved: {save_bool}")
+
+    for spring in springs:
+        spring["saved"] = save_bool
+    return springs
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+# T. Atkins, 2024
+import argparse
+import re
+from package.errors import SpringGeneratorError
+from typing import Sequence
+
+# Letters of the shape and mode of a spring in its code (the structure of the code is detailed in the report)
+# NB: Springs of mk_spring_testing() are prototypes ('P') or final springs ('F'); springs saved by save_spring() are 'hP' when generated by apply_heuristics() and 'oP' when generated by optimise_springs()
+SHAPE_CODES = {"triangle": "T", "bell": "B"}
+MODE_CODES = {"prototype": "P", "final": "F", "heuristic": "hP", "optimised": "oP"}
+SHAPE_NAMES = {v: k for k, v in SHAPE_CODES.items()}
+MODE_NAMES = {v: k for k, v in MODE_CODES.items()}
+
+# Spring codes of the tracker file, e.g. 'T(P)-index12-080.16.00' (mk_spring_testing()) or 'T(hP)-index12-080.16.30' (save_spring()): shape, mode, phalange, alpha [deg], thickness [tenths of a mm] and preload [%]
+# NB: The shapes and modes are those of SHAPE_CODES and MODE_CODES only (longest first, e.g. 'hP' before 'P'), so that a code with an unknown mode (e.g. 'hF') is invalid rather than decoded
+CODE_BODY = (
+    rf"(?P<shape>{'|'.join(sorted(SHAPE_CODES.values(), key=len, reverse=True))})"
+    rf"\((?P<mode>{'|'.join(sorted(MODE_CODES.values(), key=len, reverse=True))})\)"
+    r"-(?P<phalange>[a-z]+\d{2})-(?P<alpha>\d{3})\.(?P<t>\d{2})\.(?P<preload>\d{2,3})"
+)
+CODE_PATTERN = re.compile(rf"^{CODE_BODY}$")
+# One code per line (to decode many codes with a single regular expression, see decode_tracker())
+CODE_LINES_PATTERN = re.compile(rf"^{CODE_BODY}$", re.MULTILINE)
+# A whole row of the tracker file ('ID,code,batch'), matched over the entire file at once by decode_tracker() (NB: the groups of CODE_BODY are made non-capturing, so that each row yields only its ID, code and batch)
+TRACKER_PATTERN = re.compile(
+    rf"^[ \t]*(\d+)[ \t]*,[ \t]*({re.sub(r'[(][?]P<[a-z]+>', '(?:', CODE_BODY)})[ \t]*(?:,(.*?))?\r?$",
+    re.MULTILINE,
+)
+# Non-empty lines of a file (to check that every row of the tracker file was decoded)
+LINE_PATTERN = re.compile(r"\S.*$", re.MULTILINE)
+
+
+def encode_code(
+    phalange: str,
+    alpha: int | float,
+    t: float,
+    preload: int,
+    shape: str = "triangle",
+    mode: str = "prototype",
+) -> str:
+    """
+    FUNCTION
+    > Return the code of a spring, e.g. encode_code("index12", 80, 1.6, 0) -> 'T(P)-index12-080.16.00'
+    > 't' is the thickness in mm (written in tenths of a mm), 'preload' in %; 'shape' and 'mode' are keys of SHAPE_CODES and MODE_CODES
+    """
+    if shape not in SHAPE_CODES or mode not in MODE_CODES:
+        raise SpringGeneratorError(f"Unknown spring shape '{shape}' or mode '{mode}'.")
+    # NB: The thickness is rounded (rather than truncated) to tenths of a mm, as e.g. int(2.3 * 10) is 22
+    return f"{SHAPE_CODES[shape]}({MODE_CODES[mode]})-{phalange}-{str(round(alpha)).zfill(3)}.{str(round(t * 10)).zfill(2)}.{str(int(preload)).zfill(2)}"
+
+
+def decode_code(code: str) -> dict:
+    """
+    FUNCTION
+    > Return the parameters of a spring code as a dictionary, e.g. decode_code('T(P)-index12-080.16.00') -> {'shape': 'triangle', 'mode': 'prototype', 'phalange': 'index12', 'finger': 'index', 'alpha': 80, 't': 1.6, 'preload': 0}
+    """
+    m = CODE_PATTERN.match(code.strip())
+    if m is None:
+        raise SpringGeneratorError(f"Invalid spring code '{code}'.")
+    return {
+        "shape": SHAPE_NAMES[m["shape"]],
+        "mode": MODE_NAMES[m["mode"]],
+        "phalange": m["phalange"],
+        "finger": m["phalange"].rstrip("0123456789"),
+        "alpha": int(m["alpha"]),
+        "t": int(m["t"]) / 10,
+        "preload": int(m["preload"]),
+    }
+
+
+def decode_tracker(tracker_file: str, errors: str = "raise"):
+    """
+    FUNCTION
+    > Decode every row of a tracker file into a DataFrame with one typed column per parameter: 'id' (int), 'shape', 'mode', 'phalange', 'finger' (categorical, with the names of decode_code()), 'alpha' [deg], 't' [mm], 'preload' [%] and 'batch' (the batch code or comment, categorical)
+    > The rows are matched with a single regular expression over the entire file and converted column by column in NumPy (each distinct code being decoded only once), rather than decoding the codes row by row, so that tens of thousands of springs can be joined to test results (e.g. on 'id') at once
+    > 'errors' is "raise" (a row that is not a valid 'ID,code,batch' row raises SpringGeneratorError) or "drop" (such rows are skipped)
+    """
+    # NB: NumPy and pandas are imported here rather than at the top of the module, so that encoding a code (e.g. in save_spring()) does not import them
+    import numpy as np
+    import pandas as pd
+
+    if errors not in ["raise", "drop"]:
+        raise SpringGeneratorError(f"Unknown errors mode '{errors}'.")
+    with open(tracker_file, newline="") as f:
+        text = f.read()
+    rows = TRACKER_PATTERN.findall(text)
+    if errors == "raise" and len(rows) != len(LINE_PATTERN.findall(text)):
+        # Only on error: find the first row that could not be decoded for the message
+        bad = next(
+            line
+            for line in text.splitlines()
+            if line.strip() and TRACKER_PATTERN.match(line) is None
+        )
+        raise SpringGeneratorError(f"Invalid tracker row '{bad}' in {tracker_file}.")
+
+    ids, codes, batches = zip(*rows) if rows else ((), (), ())
+    # Each distinct code is decoded once (springs of the same specification share a code), all in one pass of CODE_LINES_PATTERN, and its parameters are broadcast to the rows through the factorised codes
+    rows_idx, uniques = pd.factorize(np.array(codes, dtype=object))
+    shape, mode, phalange, alpha, t, preload = (
+        zip(*CODE_LINES_PATTERN.findall("\n".join(uniques)))
+        if len(uniques)
+        else [()] * 6
+    )
+
+    def _categorical(values: Sequence[str], idx: np.ndarray) -> pd.Categorical:
+        values_idx, categories = pd.factorize(np.array(values, dtype=object))
+        return pd.Categorical.from_codes(values_idx[idx], categories)
+
+    # Batches with commas or quotes are quoted in the CSV (NB: unquoted per batch rather than per row)
+    batch_idx, batch_uniques = pd.factorize(np.array(batches, dtype=object))
+    return pd.DataFrame(
+        {
+            "id": np.array(ids, dtype=str).astype(np.int32),
+            "shape": _categorical([SHAPE_NAMES[s] for s in shape], rows_idx),
+            "mode": _categorical([MODE_NAMES[m] for m in mode], rows_idx),
+            "phalange": _categorical(phalange, rows_idx),
+            "finger": _categorical(
+                [p.rstrip("0123456789") for p in phalange], rows_idx
+            ),
+            "alpha": np.array(alpha, dtype=str).astype(np.int16)[rows_idx],
+            "t": np.array(t, dtype=str).astype(np.int16)[rows_idx] / 10,
+            "preload": np.array(preload, dtype=str).astype(np.int16)[rows_idx],
+            "batch": _categorical(
+                [
+                    b[1:-1].replace('""', '"') if b.startswith('"') else b
+                    for b in batch_uniques
+                ],
+                batch_idx,
+            ),
+        }
+    )
+
+
+if __name__ == "__main__":
+    # Usage example (from spring_generator): python -m package.spring_code [TRACKER CSV] (or a spring code, e.g. 'T(P)-index12-080.16.00')
+    parser = argparse.ArgumentParser(
+        description="Decode a spring code, or a whole tracker file."
+    )
+    parser.add_argument("source", help="spring code or tracker CSV")
+    parser.add_argument("--drop", action="store_true", help="skip invalid rows")
+    args = parser.parse_args()
+
+    if CODE_PATTERN.match(args.source.strip()):
+        print(decode_code(args.source))
+    else:
+        df = decode_tracker(args.source, errors="drop" if args.drop else "raise")
+        print(df.to_string(index=False))
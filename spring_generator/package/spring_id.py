@@ -0,0 +1,97 @@
+# T. Atkins, 2024
+import csv
+import os
+import time
+from contextlib import contextmanager
+from string import digits
+from typing import Iterator
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Prefixes of the spring parameters in the parameter file (e.g. 'd001', 'a001', 't001')
+ALPHA_PREFIX = "a"
+D_PREFIX = "d"
+T_PREFIX = "t"
+
+# The lock is a sidecar file next to the parameter file (e.g. 'params.csv' -> 'params.csv.lock')
+LOCK_SUFFIX = ".lock"
+TAIL_BLOCK = 1024
+
+
+@contextmanager
+def lock_param_file(param_file: str) -> Iterator[None]:
+    """
+    FUNCTION
+    > Hold an exclusive lock on the parameter file for the duration of a 'with' block
+    > Spring IDs are allocated from the last record of the parameter file, so the lock must be held from the moment an ID is allocated until the new springs have been written: otherwise two operators generating springs at once could hand out the same ID
+    > The lock is taken on a sidecar file (see LOCK_SUFFIX) rather than the parameter file itself, so that Autodesk Inventor (or any other reader) is never blocked
+    """
+    with open(param_file + LOCK_SUFFIX, "a+b") as f:
+        if os.name == "nt":
+            # msvcrt only retries for ~10 s before raising, so keep trying until the other generator has finished
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def read_last_record(param_file: str) -> str:
+    """
+    FUNCTION
+    > Return the first field of the last non-empty line of the parameter file (e.g. 't042'), or an empty string if the file is empty
+    > The file is read backwards from its end in small blocks, so the cost does not depend on the number of springs saved in the file
+    """
+    with open(param_file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buf = b""
+        while pos > 0:
+            step = min(TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            # Stop as soon as a complete, non-empty last line is in the buffer
+            stripped = buf.rstrip(b"\r\n")
+            if b"\n" in stripped:
+                break
+    lines = buf.rstrip(b"\r\n").splitlines()
+    if not lines:
+        return ""
+    row = next(csv.reader([lines[-1].decode()]), [""])
+    return row[0] if row else ""
+
+
+def next_spring_id(param_file: str) -> int:
+    """
+    FUNCTION
+    > Return the ID of the next spring to be saved in the parameter file
+    > This is the number of the most recent spring in the file plus one, or 1 if the last record is not a spring (e.g. the file only contains hand measurements)
+    > NB: To avoid two generators handing out the same ID, call this function inside lock_param_file() and keep the lock until the new springs are written
+    """
+    tail = read_last_record(param_file)
+    numeric_tail = "".join(c for c in tail if c in digits)
+    letter_tail = "".join(i for i in tail if not i.isdigit())
+    if numeric_tail == "" or letter_tail not in [ALPHA_PREFIX, D_PREFIX, T_PREFIX]:
+        return 1
+    return int(numeric_tail) + 1
+
+
+if __name__ == "__main__":
+    next_spring_id()
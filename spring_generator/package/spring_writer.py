@@ -0,0 +1,161 @@
+# T. Atkins, 2024
+import csv
+import io
+import json
+import os
+from contextlib import ExitStack
+from package.spring_id import lock_param_file, next_spring_id
+from typing import List, Sequence
+
+# The journal is a sidecar file next to the parameter file (e.g. 'params.csv' -> 'params.csv.journal')
+JOURNAL_SUFFIX = ".journal"
+
+
+def _fsync_write(path: str, data: bytes) -> None:
+    """
+    FUNCTION
+    > Write 'data' to a new file 'path' and flush it to disk
+    """
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _apply_journal(journal_file: str) -> None:
+    """
+    FUNCTION
+    > Apply a committed journal: every file listed in it is cut back to its size before the commit and the new rows are appended again
+    > This makes replaying a journal idempotent, so it does not matter how far a previous (interrupted) commit got
+    """
+    with open(journal_file) as f:
+        entries = json.load(f)["files"]
+    for path, size, data in entries:
+        with open(path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < size:
+                raise OSError(f"{path} is shorter than recorded in {journal_file}.")
+            f.truncate(size)
+            f.seek(size)
+            f.write(data.encode())
+            f.flush()
+            os.fsync(f.fileno())
+    os.remove(journal_file)
+
+
+def recover(param_file: str) -> bool:
+    """
+    FUNCTION
+    > Complete a commit of the parameter and tracker files that was interrupted (e.g. by a crash), if any
+    > Returns whether a journal was found and applied
+    > NB: Must be called with the parameter file locked (SpringWriter does this automatically)
+    """
+    journal_file = param_file + JOURNAL_SUFFIX
+    if not os.path.isfile(journal_file):
+        return False
+    _apply_journal(journal_file)
+    print(f"WARNING: Interrupted save of springs recovered from {journal_file}.")
+    return True
+
+
+class SpringWriter:
+    """
+    CLASS
+    > Accumulate the springs generated during a run in memory and save them to both the parameter and tracker files in one bulk write
+    > Use as a context manager: the parameter file is locked (see lock_param_file()) on entry, and the springs are committed on a normal exit (or discarded if an exception is raised)
+    > A commit first writes all new rows to a journal (see JOURNAL_SUFFIX), which is then applied to both files: if the process dies at any point, the next writer replays (or ignores) the journal, so the two files never disagree
+    > Spring IDs are allocated with 'next_id', which only advances when a spring is added (i.e. a spring that is not saved does not use up an ID)
+    """
+
+    def __init__(self, param_file: str, tracker_file: str) -> None:
+        self.param_file = param_file
+        self.tracker_file = tracker_file
+        self._param_rows = []
+        self._tracker_rows = []
+        self._first_id = None
+        self._stack = ExitStack()
+
+    def __enter__(self) -> "SpringWriter":
+        self._stack.enter_context(lock_param_file(self.param_file))
+        try:
+            recover(self.param_file)
+            self._first_id = next_spring_id(self.param_file)
+        except BaseException:
+            self._stack.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self._stack.close()
+
+    @property
+    def next_id(self) -> int:
+        """
+        FUNCTION
+        > ID of the next spring to be added
+        """
+        if self._first_id is None:
+            raise RuntimeError("SpringWriter must be used as a context manager.")
+        return self._first_id + len(self._tracker_rows)
+
+    @property
+    def springs(self) -> int:
+        """
+        FUNCTION
+        > Number of springs waiting to be committed
+        """
+        return len(self._tracker_rows)
+
+    def add(self, param_rows: Sequence[Sequence], tracker_row: Sequence) -> None:
+        """
+        FUNCTION
+        > Add one spring: its rows of the parameter file (d, alpha and thickness) and its row of the tracker file
+        """
+        self._param_rows.extend(param_rows)
+        self._tracker_rows.append(tracker_row)
+
+    @staticmethod
+    def _to_csv(rows: List[Sequence]) -> str:
+        """
+        FUNCTION
+        > Format rows as CSV text, in the same layout as DataFrame.to_csv(index=False, header=False)
+        """
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator=os.linesep).writerows(rows)
+        return buf.getvalue()
+
+    def commit(self) -> None:
+        """
+        FUNCTION
+        > Save all added springs to the parameter and tracker files at once (see the class description for the journaling)
+        """
+        recover(self.param_file)
+        if not self._tracker_rows:
+            return None
+
+        entries = []
+        for path, rows in [
+            (self.param_file, self._param_rows),
+            (self.tracker_file, self._tracker_rows),
+        ]:
+            size = os.path.getsize(path) if os.path.isfile(path) else 0
+            if size == 0:
+                open(path, "ab").close()
+            # NB: Paths are journaled as absolute paths, so that the journal is replayed on the same files whatever the working directory of the recovering process
+            entries.append([os.path.abspath(path), size, self._to_csv(rows)])
+
+        # Make the journal durable (written to a temporary file first, so that a partial journal is never replayed)
+        journal_file = self.param_file + JOURNAL_SUFFIX
+        tmp_file = journal_file + ".tmp"
+        _fsync_write(tmp_file, json.dumps({"files": entries}).encode())
+        os.replace(tmp_file, journal_file)
+
+        # From this point the springs are committed: if applying the journal fails, it is replayed by the next commit (or writer) instead of being written again
+        self._first_id += len(self._tracker_rows)
+        self._param_rows = []
+        self._tracker_rows = []
+        _apply_journal(journal_file)
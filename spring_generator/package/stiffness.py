@@ -0,0 +1,285 @@
+# T. Atkins, 2024
+import argparse
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+from package.param_store import load_params, param_value
+from package.spring_code import decode_tracker
+from package.spring_id import D_PREFIX
+from pathlib import Path
+from typing import Dict
+
+# Repository root (for the shared 'analysis' package)
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from analysis.loading import load_frames
+
+# T-SF test files (see tsf_rx()): 'test[code]_[NNN].csv', with NNN the ID of the spring tested; codes ending in 'p' are PLA springs, the others PETG (e.g. 'testA_024.csv' and 'testAp_024.csv', as in plotting_standard())
+TEST_PATTERN = re.compile(r"test([A-Za-z]+)_(\d{3})\.csv$")
+MATERIALS = ["petg", "pla"]
+
+# Grid of the surrogate: thickness [mm], alpha [deg], pin spacing d [mm] and compression (fraction of d)
+T_AXIS = np.round(np.arange(0.8, 2.4 + 1e-9, 0.2), 2)
+ALPHA_AXIS = np.arange(40.0, 160.0 + 1e-9, 10.0)
+D_AXIS = np.arange(30.0, 70.0 + 1e-9, 5.0)
+COMP_AXIS = np.round(np.arange(0.0, 0.6 + 1e-9, 0.05), 2)
+# Fit of the surface (in log space, relative to the reference spring of the T-SF tests): power law in t, alpha and d, with a small ridge so that parameters never varied in the data keep an exponent of 0
+REF = {"t": 1.6, "alpha": 80.0, "d": 45.28}
+RIDGE = 1e-3
+# The residuals of the power law are interpolated with Gaussian radial basis functions of this width (in log units, i.e. ~15 % of a parameter), so that the measured springs are reproduced and the surface returns to the power law away from them
+RBF_WIDTH = 0.15
+
+
+def ingest(test_dir: str, tracker_file: str, param_file: str) -> pd.DataFrame:
+    """
+    FUNCTION
+    > Build the dataset of all T-SF compression curves of 'test_dir': one row per record point, with the spring parameters decoded from its code in the tracker file and its pin spacing d from the parameter file
+    > Columns: 'material', 'id', 'test' (test code), 'phalange', 't' [mm], 'alpha' [deg], 'd' [mm], 'preload' [%], 'comp' (fraction of d) and 'load' [N]; indexed by (material, id) so that the curves of a spring are looked up directly
+    > NB: Tests of springs missing from the tracker or parameter file are reported and skipped
+    """
+    tests = []
+    for f in sorted(os.listdir(test_dir)):
+        m = TEST_PATTERN.match(f)
+        if m is not None:
+            tests.append((os.path.join(test_dir, f), m.group(1), m.group(2)))
+
+    # Springs of the tracker file whose code can be decoded, by ID (NB: for a repeated ID, the last row is kept)
+    springs = (
+        decode_tracker(tracker_file, errors="drop")
+        .drop_duplicates("id", keep="last")
+        .set_index("id")
+    )
+    params = load_params(param_file)
+    keep = []
+    for file, code, id_str in tests:
+        d = param_value(params, D_PREFIX + id_str)
+        if int(id_str) not in springs.index or np.isnan(d):
+            print(
+                f"WARNING: Spring {id_str} of {file} not found in the tracker or parameter file."
+            )
+            continue
+        keep.append((file, code, id_str, d))
+
+    dfs = load_frames([k[0] for k in keep], ["load", "comp"])
+    frames = []
+    for (file, code, id_str, d), df in zip(keep, dfs):
+        spring = springs.loc[int(id_str)]
+        frames.append(
+            df.assign(
+                material="pla" if code.endswith("p") else "petg",
+                id=id_str,
+                test=code,
+                phalange=spring["phalange"],
+                t=float(spring["t"]),
+                alpha=float(spring["alpha"]),
+                d=d,
+                preload=int(spring["preload"]),
+            )
+        )
+    columns = [
+        "material",
+        "id",
+        "test",
+        "phalange",
+        "t",
+        "alpha",
+        "d",
+        "preload",
+        "comp",
+        "load",
+    ]
+    if not frames:
+        return pd.DataFrame(columns=columns).set_index(["material", "id"])
+    return (
+        pd.concat(frames, ignore_index=True)[columns]
+        .set_index(["material", "id"])
+        .sort_index()
+    )
+
+
+def _log_coords(t: np.ndarray, alpha: np.ndarray, d: np.ndarray) -> np.ndarray:
+    return np.column_stack(
+        [np.log(t / REF["t"]), np.log(alpha / REF["alpha"]), np.log(d / REF["d"])]
+    )
+
+
+def _fit_level(X: np.ndarray, y: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """
+    FUNCTION
+    > Fit log(load) = c0 + c . X (ridge on c) plus an RBF interpolation of the residuals, and evaluate it at the points 'grid' (log coordinates)
+    """
+    A = np.column_stack([np.ones(X.shape[0]), X])
+    reg = RIDGE * np.diag([0.0, 1.0, 1.0, 1.0])
+    coef = np.linalg.solve(A.T @ A + reg, A.T @ y)
+    resid = y - A @ coef
+
+    def phi(P: np.ndarray, Q: np.ndarray) -> np.ndarray:
+        d2 = ((P[:, None, :] - Q[None, :, :]) ** 2).sum(axis=-1)
+        return np.exp(-d2 / RBF_WIDTH**2)
+
+    w = np.linalg.lstsq(phi(X, X) + 1e-9 * np.eye(X.shape[0]), resid, rcond=None)[0]
+    return coef[0] + grid @ coef[1:] + phi(grid, X) @ w
+
+
+def fit_table(dataset: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    FUNCTION
+    > Fit the load-at-compression surface of every material over (t, alpha, d) (see REF, RIDGE and RBF_WIDTH), at every compression of COMP_AXIS, and tabulate it on the grid of the axes above
+    > Every curve is first interpolated to the compressions of COMP_AXIS (from 0 load at 0 compression; compressions beyond its last record point are not extrapolated)
+    > Returns the arrays of the surrogate: the axes, 'materials', 'load' (material, t, alpha, d, comp) [N] (NaN for materials without data) and 'n_curves' (number of curves fitted, per material)
+    """
+    grid = np.stack(np.meshgrid(T_AXIS, ALPHA_AXIS, D_AXIS, indexing="ij"), -1).reshape(
+        -1, 3
+    )
+    grid_log = _log_coords(grid[:, 0], grid[:, 1], grid[:, 2])
+    shape = (T_AXIS.shape[0], ALPHA_AXIS.shape[0], D_AXIS.shape[0])
+    load = np.full((len(MATERIALS),) + shape + (COMP_AXIS.shape[0],), np.nan)
+    load[..., 0] = 0.0
+    n_curves = np.zeros(len(MATERIALS), dtype=int)
+
+    for i, material in enumerate(MATERIALS):
+        if material not in dataset.index.get_level_values(0):
+            continue
+        # One curve per test file (a spring may be tested under several test codes)
+        curves = dataset.loc[material].groupby([pd.Grouper(level="id"), "test"])
+        params = curves[["t", "alpha", "d"]].first().to_numpy(dtype=float)
+        n_curves[i] = params.shape[0]
+        levels = np.full((params.shape[0], COMP_AXIS.shape[0]), np.nan)
+        for j, (_, curve) in enumerate(curves):
+            curve = curve.sort_values("comp")
+            comp = np.concatenate([[0.0], curve["comp"].to_numpy()])
+            F = np.concatenate([[0.0], curve["load"].to_numpy()])
+            levels[j] = np.where(
+                COMP_AXIS <= comp[-1], np.interp(COMP_AXIS, comp, F), np.nan
+            )
+
+        X = _log_coords(params[:, 0], params[:, 1], params[:, 2])
+        for k in range(1, COMP_AXIS.shape[0]):
+            ok = levels[:, k] > 0
+            if ok.any():
+                fit = _fit_level(X[ok], np.log(levels[ok, k]), grid_log)
+                load[i, ..., k] = np.exp(fit).reshape(shape)
+
+    return {
+        "t": T_AXIS,
+        "alpha": ALPHA_AXIS,
+        "d": D_AXIS,
+        "comp": COMP_AXIS,
+        "materials": np.array(MATERIALS),
+        "load": load.astype(np.float32),
+        "n_curves": n_curves,
+    }
+
+
+def save_table(table: Dict[str, np.ndarray], file: str) -> None:
+    """
+    FUNCTION
+    > Save the surrogate as a compressed .npz (no pickled objects, so that it can be loaded safely)
+    """
+    np.savez_compressed(file, **table)
+
+
+class StiffnessTable:
+    """
+    CLASS
+    > Surrogate of the load of a spring at a given compression, as a function of its thickness, alpha, pin spacing d and material, loaded from the .npz of save_table()
+    > load() interpolates the table multilinearly: every query only reads the 16 grid points around it (regular axes, so their indices are computed directly rather than searched), and is vectorised over arrays of queries
+    > NB: Queries outside the grid are clamped to its edges
+    """
+
+    def __init__(self, file: str) -> None:
+        with np.load(file, allow_pickle=False) as data:
+            self.axes = [data[k].astype(float) for k in ["t", "alpha", "d", "comp"]]
+            self.materials = data["materials"].tolist()
+            self.table = np.ascontiguousarray(data["load"], dtype=float)
+            self.n_curves = data["n_curves"]
+        self._origin = np.array([a[0] for a in self.axes])
+        self._step = np.array([a[1] - a[0] for a in self.axes])
+        self._size = np.array([a.shape[0] for a in self.axes])
+        self._strides = np.array(self.table.strides[1:]) // self.table.itemsize
+
+    def load(
+        self,
+        t: np.ndarray,
+        alpha: np.ndarray,
+        d: np.ndarray,
+        comp: np.ndarray,
+        material: str = "petg",
+    ) -> np.ndarray:
+        """
+        FUNCTION
+        > Return the load [N] of springs of thickness 't' [mm], angle 'alpha' [deg] and pin spacing 'd' [mm], at the compressions 'comp' (fraction of d), for one material (all broadcast against each other)
+        > Raises ValueError for a material without any fitted curve (whose table is all NaN)
+        """
+        if material not in self.materials:
+            raise ValueError(
+                f"Material '{material}' not recognised: must be one of {self.materials}."
+            )
+        if self.n_curves[self.materials.index(material)] == 0:
+            raise ValueError(
+                f"The surrogate has no compression curves of {material} (only of {[m for m, n in zip(self.materials, self.n_curves) if n > 0]})."
+            )
+        table = self.table[self.materials.index(material)].ravel()
+        x = np.stack(
+            np.broadcast_arrays(
+                *(np.asarray(v, dtype=float) for v in (t, alpha, d, comp))
+            ),
+            -1,
+        )
+        u = np.clip((x - self._origin) / self._step, 0, self._size - 1)
+        i0 = np.minimum(np.floor(u).astype(int), self._size - 2)
+        f = u - i0
+
+        # Flat index of the lower corner, and of the 16 corners relative to it
+        base = (i0 * self._strides).sum(axis=-1)
+        out = np.zeros(x.shape[:-1])
+        for corner in range(16):
+            bits = [(corner >> k) & 1 for k in range(4)]
+            w = np.prod(
+                [f[..., k] if b else 1 - f[..., k] for k, b in enumerate(bits)], axis=0
+            )
+            out += w * table[base + int(np.dot(bits, self._strides))]
+        return out
+
+
+if __name__ == "__main__":
+    # Usage examples (from spring_generator):
+    # python -m package.stiffness build [TEST DIRECTORY] [TRACKER CSV] [PARAMETER CSV] --out stiffness.npz --dataset tsf_dataset.csv
+    # python -m package.stiffness predict stiffness.npz --t 1.6 --alpha 80 --d 45 --comp 0.5 --material pla
+    parser = argparse.ArgumentParser(
+        description="Build the spring stiffness surrogate from the T-SF tests, or predict the load of a spring with it."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("test_dir")
+    build.add_argument("tracker_file")
+    build.add_argument("param_file")
+    build.add_argument("--out", required=True)
+    build.add_argument("--dataset", help="CSV to write the dataset to")
+    predict = sub.add_parser("predict")
+    predict.add_argument("table")
+    predict.add_argument("--t", type=float, required=True)
+    predict.add_argument("--alpha", type=float, required=True)
+    predict.add_argument("--d", type=float, required=True)
+    predict.add_argument(
+        "--comp", type=float, nargs="+", default=[0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+    )
+    predict.add_argument("--material", choices=MATERIALS, default="petg")
+    args = parser.parse_args()
+
+    match args.command:
+        case "build":
+            dataset = ingest(args.test_dir, args.tracker_file, args.param_file)
+            if args.dataset:
+                dataset.to_csv(args.dataset)
+            table = fit_table(dataset)
+            save_table(table, args.out)
+            print(
+                f"Surrogate of {dict(zip(MATERIALS, table['n_curves'].tolist()))} compression curve(s) stored in {args.out}."
+            )
+        case "predict":
+            surrogate = StiffnessTable(args.table)
+            loads = surrogate.load(args.t, args.alpha, args.d, args.comp, args.material)
+            for comp, load in zip(args.comp, loads):
+                print(f"{100 * comp:.0f}% compression: {load:.2f} N")
@@ -1,66 +1,90 @@
 # T. Atkins, 2024
-from package.mk_spring_testing import mk_spring_testing
+from package.errors import SpringGenerationAborted, SpringGeneratorError
+from package.mk_spring_testing import PARAM_FILE, TRACKER_FILE, mk_spring_testing
+from package.spring_writer import SpringWriter
+from typing import List
 
 
-def tests(run: str) -> None:
+def tests(
+    run: str,
+    save_mode: str = "manual",
+    param_file: str | None = None,
+    tracker_file: str | None = None,
+) -> List[dict]:
     """
     FUNCTION
     > Similarly to main(), this is just a top-level runner that calls mk_spring_testing in a variety of parameter configurations for faster spring generation
     > NB-1: The contents of this function do not reflect the entire use history of this function throughout ALL testing, but rather examples/snapshots of its use
     > NB-2: See further details in the comments of the functions of the 'package' directory
+    > 'save_mode' is as in mk_spring_testing(): "manual" asks for confirmation once for the whole run, whereas "yes" and "no" save (or discard) every spring without any prompt
+    > All springs of a run are saved together in one bulk write at the end of the run (see SpringWriter)
+    > Returns the generated springs (see mk_spring_testing())
     """
     # Conclusions (for index12)
     ALPHA_CONCL = 80
     PRELOAD_CONCL = 0
     THICKNESS_CONCL = 16
 
-    check = input(f"Are you sure you want to proceed with test run '{run}' (y/n): ")
-    print("---")
+    if save_mode == "manual":
+        check = input(f"Are you sure you want to proceed with test run '{run}' (y/n): ")
+        print("---")
+        if check != "y":
+            raise SpringGenerationAborted("Spring generation prevented.")
+        save_mode = "yes"
 
-    if check == "y":
+    if param_file is None:
+        param_file = PARAM_FILE
+    if tracker_file is None:
+        tracker_file = TRACKER_FILE
+
+    springs = []
+    with SpringWriter(param_file, tracker_file) as writer:
         match run:
             case "alpha":
                 for alpha in [50, 60, 70, 80, 90]:
-                    mk_spring_testing(
+                    spring = mk_spring_testing(
                         2,
                         "12",
                         alpha,
                         16,
                         0,
-                        save_mode="yes",
+                        save_mode=save_mode,
                         comment="Alpha variation with increased thickness",
+                        writer=writer,
                     )
-                return None
+                    springs.append(spring)
+                return springs
             case "preload":
                 for preload in [30, 40, 50]:
-                    mk_spring_testing(
+                    spring = mk_spring_testing(
                         2,
                         "12",
                         ALPHA_CONCL,
                         # ALPHA_CONCL * (1 + preload / 100),
                         THICKNESS_CONCL,
                         preload,
-                        save_mode="yes",
+                        save_mode=save_mode,
                         comment="Preload variation (alpha NOT varied in proportion)",
+                        writer=writer,
                     )
-                return None
+                    springs.append(spring)
+                return springs
             case "thickness":
                 for thickness in [8, 12, 16, 20]:
-                    mk_spring_testing(
+                    spring = mk_spring_testing(
                         2,
                         "12",
                         ALPHA_CONCL,
                         thickness,
                         PRELOAD_CONCL,
-                        save_mode="yes",
+                        save_mode=save_mode,
                         comment="Preload variation",
+                        writer=writer,
                     )
-                return None
+                    springs.append(spring)
+                return springs
             case _:
-                raise Exception("Unknown input.")
-
-    else:
-        exit("WARNING: Spring generation prevented.")
+                raise SpringGeneratorError("Unknown input.")
 
 
 if __name__ == "__main__":
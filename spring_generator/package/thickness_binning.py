@@ -34,5 +34,27 @@ def thickness_binning(data: list, outcome: Sequence[float]) -> Sequence[float]:
     return thickness_out
 
 
+def thickness_binning_batch(data: np.ndarray, outcome: Sequence[float]) -> np.ndarray:
+    """
+    FUNCTION
+    > Vectorised equivalent of thickness_binning() for many hands at once
+    > 'data' is an (N, M) array with one row per hand, and each row is binned with respect to its own mean and standard deviation (exactly as thickness_binning() does for a single hand)
+    > Returns an (N, M) array of thicknesses
+    """
+    data = np.asarray(data, dtype=float)
+    mu = data.mean(axis=1, keepdims=True)
+    std = data.std(axis=1, keepdims=True)
+
+    # Generate 3 bins per hand, with one larger central bin to capture most cases
+    bins = np.concatenate([mu - 2 * std, mu - std, mu + std, mu + 2 * std], axis=1)
+
+    # Compute bin assignments (for increasing bins, this is equivalent to np.digitize() applied row by row)
+    assignments = (data[:, :, None] >= bins[:, None, :]).sum(axis=2)
+    # Assign outliers (either above or below the bin extremities) to the nearest bin
+    assignments = np.clip(assignments, 1, bins.shape[1] - 1)
+
+    return np.asarray(outcome)[assignments - 1]
+
+
 if __name__ == "__main__":
     thickness_binning()
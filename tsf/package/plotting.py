@@ -1,41 +1,66 @@
 # T. Atkins, 2024
+import os
+import sys
 import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
-from typing import Sequence, Tuple
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
 
-plt.rc("text", usetex=True)
-font_properties = {"family": "serif"}
-# font_properties = {"family": "sans-serif", "sans-serif": ["Helvetica"]}
-plt.rc("font", **font_properties)
+# Repository root (for the shared 'analysis' package)
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from analysis.loading import load_frames
+from analysis.style import apply_profile, savefig
+
+# Render profile: 'draft' (mathtext, fast) unless PLOT_PROFILE=publication (usetex), see analysis/style.py
+apply_profile(family="serif")
+# apply_profile(family="sans-serif")
+
+
+def _stdfiles(
+    loc: str, test_codes: Sequence[str], test_nums: Sequence[int]
+) -> List[str]:
+    """
+    FUNCTION
+    > Return the paths of the CSVs of the tests 'test_nums' of every test code of 'test_codes'
+    """
+    return [
+        os.path.join(loc, f"test{code}_{str(n).zfill(3)}.csv")
+        for code in test_codes
+        for n in test_nums
+    ]
+
+
+def standard_files(test_code: str, loc: str) -> List[str]:
+    """
+    FUNCTION
+    > Return the paths of the CSVs read by plotting_standard() for 'test_code' (e.g. so that a figure is only re-rendered when they change, see analysis/render.py)
+    """
+    _, _, TEST_NUMS = _stdsetup(test_code, "std")
+    return _stdfiles(loc, [test_code, f"{test_code}p"], TEST_NUMS)
 
 
 def _stdimport(
     loc: str,
-    test_code: str,
+    test_codes: Sequence[str],
     test_nums: Sequence[int],
-) -> dict:
+) -> Dict[str, dict]:
     """
     FUNCTION
-    > Import the requisite data for use in plotting_standard()
+    > Import the requisite data for use in plotting_standard(), i.e. the tests 'test_nums' of every test code of 'test_codes' (e.g. PETG and PLA)
+    > All files are read in parallel, and cached (see analysis.loading), so regenerating figures does not parse the CSVs again
     """
     # Setup
     LOAD_STR = "load"
     COMP_STR = "comp"
-    df_dct = {}
-
-    # Import test data
-    for n in test_nums:
-        file = f"{loc}\\\\test{test_code}_{str(n).zfill(3)}.csv"
-        df = pd.read_csv(
-            file,
-            names=[LOAD_STR, COMP_STR],
-            usecols=[0, 1],
-            dtype={LOAD_STR: float, COMP_STR: float},
-        )
-        # Convert load from kilograms to Newtons
-        df[LOAD_STR] = df[LOAD_STR].apply(lambda x: x * 9.81)
-        df_dct[n] = df
+    keys = [(code, n) for code in test_codes for n in test_nums]
+    files = [os.path.join(loc, f"test{code}_{str(n).zfill(3)}.csv") for code, n in keys]
+
+    # Import test data (NB: load is converted from kilograms to Newtons)
+    dfs = load_frames(files, [LOAD_STR, COMP_STR], to_newtons=[LOAD_STR])
+    df_dct = {code: {} for code in test_codes}
+    for (code, n), df in zip(keys, dfs):
+        df_dct[code][n] = df
 
     return df_dct
 
@@ -157,18 +182,28 @@ def _getpct(bar_pre: plt.bar, bar_post: plt.bar) -> None:
     return None
 
 
-def plotting_standard(test_code: str, save: bool = False) -> None:
+def plotting_standard(
+    test_code: str,
+    save: bool = False,
+    loc: str | None = None,
+    save_dir: str | None = None,
+) -> None:
     """
     FUNCTION
     > Plot load against percentage (wrt original length) compression given static compressive test data
+    > 'loc' (optional) overrides the directory of the input data
+    > If 'save_dir' is given, the figure is saved there (only) and closed instead of being shown, e.g. for batch rendering (see analysis/render.py)
     """
     # Setup
     LOC = "[INSERT PATH TO DIRECTORY OF INPUT DATA (LOADS) HERE]"
+    if loc is not None:
+        LOC = loc
     TITLE, GROUPS, TEST_NUMS = _stdsetup(test_code, "std")
 
     # Data import
-    dfs_petg = _stdimport(LOC, test_code, TEST_NUMS)
-    dfs_pla = _stdimport(LOC, f"{test_code}p", TEST_NUMS)
+    dfs = _stdimport(LOC, [test_code, f"{test_code}p"], TEST_NUMS)
+    dfs_petg = dfs[test_code]
+    dfs_pla = dfs[f"{test_code}p"]
 
     # Plot
     PETG_FMTS = [".k-", ".b-", ".r-"]
@@ -186,13 +221,18 @@ def plotting_standard(test_code: str, save: bool = False) -> None:
     # plt.title(TITLE)
     # plt.show()
 
-    if save:
+    FNAME = f"std{test_code}"
+    FTYPE = "pdf"
+    if save_dir is not None:
+        savefig(
+            plt.gcf(), os.path.join(save_dir, f"{FNAME}.{FTYPE}"), bbox_inches="tight"
+        )
+        plt.close()
+    elif save:
         SAVE_LOC1 = "[INSERT PATH TO A SAVE DIRECTORY HERE]"
         SAVE_LOC2 = "[INSERT PATH TO ANOTHER SAVE DIRECTORY HERE]"
-        FNAME = f"std{test_code}"
-        FTYPE = "pdf"
-        plt.savefig(f"{SAVE_LOC1}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
-        plt.savefig(f"{SAVE_LOC2}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
+        savefig(plt.gcf(), f"{SAVE_LOC1}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
+        savefig(plt.gcf(), f"{SAVE_LOC2}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
         print(f"Figure {FNAME}.{FTYPE} saved.")
     else:
         plt.show()
@@ -200,21 +240,37 @@ def plotting_standard(test_code: str, save: bool = False) -> None:
     return None
 
 
-def plotting_fatigue(mode: str, test_code: str, save: bool = False) -> None:
+def plotting_fatigue(
+    mode: str,
+    test_code: str,
+    save: bool = False,
+    file: str | None = None,
+    save_dir: str | None = None,
+) -> None:
     """
     FUNCTION
     > Plot an overlayed bar chart to compare the load or pin spacings measured on PETG and PLA springs before and after 10 complete compression cycles
-    > With regards to the load, what is measured is the load at 50% compression
+    > With regards to the load, what is measured is the load at 50% compression (or, for a folder of cycle streams, the peak load of the cycles, see analysis/fatigue.py)
     > Hatching of the bars indicates values after 10 cycles
     > Percentage change is displayed above the bars
     > 'mode' indicates whether it is loads or pin spacings that are being compared
+    > 'file' (optional) overrides the path of the input data: either the summary table (CSV), or a folder of cycle streams, which is then analysed and summarised on the fly (see analysis/fatigue.py)
+    > If 'save_dir' is given, the figure is saved there (only) and closed instead of being shown, e.g. for batch rendering (see analysis/render.py)
     """
     # Setup
     TITLE, GROUPS, TEST_NUMS = _stdsetup(test_code, "ftg")
     FILE, YLABEL = _ftgsetup(mode)
+    if file is not None:
+        FILE = file
 
     # Data import
-    df = pd.read_csv(FILE)
+    if os.path.isdir(FILE):
+        from analysis.fatigue import SUMMARY_LABELS, summary_table
+
+        df = summary_table(FILE, mode)
+        YLABEL = SUMMARY_LABELS[mode]
+    else:
+        df = pd.read_csv(FILE)
     petg_pre = df["petg_pre"].loc[df["id"].isin(TEST_NUMS)].tolist()
     petg_post = df["petg_post"].loc[df["id"].isin(TEST_NUMS)].tolist()
     pla_pre = df["pla_pre"].loc[df["id"].isin(TEST_NUMS)].tolist()
@@ -278,13 +334,16 @@ def plotting_fatigue(mode: str, test_code: str, save: bool = False) -> None:
     # plt.show()
 
     # Save plot
-    if save:
+    FNAME = f"ftg{mode}{test_code}"
+    FTYPE = "pdf"
+    if save_dir is not None:
+        savefig(fig, os.path.join(save_dir, f"{FNAME}.{FTYPE}"), bbox_inches="tight")
+        plt.close(fig)
+    elif save:
         SAVE_LOC1 = r"C:\\Users\\thiba\\OneDrive - University College London\\COMP0132 - MSCPROJ\\code\\tsf\\figures\\fatigue"
         SAVE_LOC2 = r"C:\\Users\\thiba\\OneDrive - University College London\\COMP0132 - MSCPROJ\\Deliverables\\(0132) MSc Report\\figures"
-        FNAME = f"ftg{mode}{test_code}"
-        FTYPE = "pdf"
-        fig.savefig(f"{SAVE_LOC1}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
-        fig.savefig(f"{SAVE_LOC2}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
+        savefig(fig, f"{SAVE_LOC1}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
+        savefig(fig, f"{SAVE_LOC2}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
         print(f"Figure {FNAME}.{FTYPE} saved.")
     else:
         plt.show()
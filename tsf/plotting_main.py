@@ -1,6 +1,5 @@
 # T. Atkins, 2024
 import sys
-from package.plotting import plotting_standard, plotting_fatigue
 
 
 def plotting_main(mode: str, save: bool = False):
@@ -9,6 +8,14 @@ def plotting_main(mode: str, save: bool = False):
     > Run different plotting functions (located in the 'package' directory) based on user CLI input
     """
     mode = mode.upper()
+    if mode not in ["STD", "F-LOAD", "F-LEN"]:
+        exit(
+            f"ERROR: Plotting mode '{mode}' not recognised: must be 'STD', 'F-LOAD' or 'F-LEN' (not case-sensitive)."
+        )
+
+    # NB: Imported here rather than at the top, so that command line errors are reported without loading pandas and matplotlib (see bench_startup.py)
+    from package.plotting import plotting_standard, plotting_fatigue
+
     if mode == "STD":
         TEST_CODE = input("Enter test code: ").capitalize()
         plotting_standard(test_code=TEST_CODE, save=save)
@@ -18,14 +25,11 @@ def plotting_main(mode: str, save: bool = False):
     elif mode == "F-LEN":
         TEST_CODE = input("Enter test code: ").capitalize()
         plotting_fatigue(mode="len", test_code=TEST_CODE, save=save)
-    else:
-        exit(
-            f"ERROR: Plotting mode '{mode}' not recognised: must be 'STD', 'F-LOAD' or 'F-LEN' (not case-sensitive)."
-        )
 
 
 if __name__ == "__main__":
     # The below allows for this function to be run from the command line with: 'python plotting_main.py [mode] [save]' ([save] is optional, default is False)
+    # Figures are drafted with mathtext by default; prefix the command with 'PLOT_PROFILE=publication' to typeset them with LaTeX as in the report (see analysis/style.py)
     try:
         MODE = str(sys.argv[1])
     except:
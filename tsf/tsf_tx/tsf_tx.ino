@@ -4,6 +4,18 @@
 #define REC_PIN 4 // pressing this button indicates to the Python script that it should record the load cell readings
 #define STOP_PIN 9 // pressing this button saves test data as a CSV and stops execution on the Python side.
 
+// Wire protocol: 0 sends text lines (default), 1 sends framed binary packets (see acquisition/protocol.py; run the Python side with protocol="binary")
+#define BINARY_PROTOCOL 0
+#if BINARY_PROTOCOL
+#define BAUD 115200 // a frame (14 bytes) is longer than a text line: 9600 baud cannot keep up with the HX711 at 80 Hz
+#else
+#define BAUD 9600
+#endif
+#define FLAG_RECORD 0x01
+#define FLAG_STOP 0x02
+#define FLAG_CONFIG 0x80
+#define CONFIG_PERIOD 256 // the calibration factor is resent every CONFIG_PERIOD frames
+
 // Pins for LC-A (used for T-TF)
 // #define DOUT 3
 // #define CLK 2
@@ -13,12 +25,39 @@
 #define CLK  6
 
 HX711 scale;
+uint16_t seq = 0;
 
 // float calibration_factor = -212100;  // for LC-A
 float calibration_factor = 210000; // for LC-B
 
+// Send one frame: | 0xA5 0x5A | seq (u16) | micros (u32) | raw (i32) | flags (u8) | checksum (u8) |, little-endian (as stored in the memory of the AVR)
+void send_frame(int32_t raw, uint8_t flags) {
+  uint8_t frame[14];
+  uint32_t t = micros();
+  frame[0] = 0xA5;
+  frame[1] = 0x5A;
+  memcpy(frame + 2, &seq, 2);
+  memcpy(frame + 4, &t, 4);
+  memcpy(frame + 8, &raw, 4);
+  frame[12] = flags;
+  uint8_t sum = 0;
+  for (int i = 2; i < 13; i++) {
+    sum += frame[i];
+  }
+  frame[13] = sum;
+  Serial.write(frame, 14);
+  seq++;
+}
+
+// Send the calibration factor (float bits), so that the Python side can convert raw counts to kg
+void send_config() {
+  int32_t bits;
+  memcpy(&bits, &calibration_factor, 4);
+  send_frame(bits, FLAG_CONFIG);
+}
+
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(BAUD);
 
   // Setup command pins
   pinMode(REC_PIN, INPUT_PULLUP);
@@ -29,11 +68,31 @@ void setup() {
   scale.set_scale();
   scale.tare();  // reset the scale to 0
   scale.set_gain(128);
+
+#if BINARY_PROTOCOL
+  send_config();
+#endif
 }
 
 void loop() {
   scale.set_scale(calibration_factor);
 
+#if BINARY_PROTOCOL
+  if (seq % CONFIG_PERIOD == 0) {
+    send_config();
+  }
+  if (digitalRead(REC_PIN) == LOW && digitalRead(STOP_PIN) == HIGH) { // RECORD
+    send_frame(0, FLAG_RECORD);
+    delay(2000);
+  } else if (digitalRead(REC_PIN) == HIGH && digitalRead(STOP_PIN) == LOW) { // STOP
+    send_frame(0, FLAG_STOP);
+    delay(2000);
+  } else {
+    send_frame((int32_t) scale.get_value(), 0); // tared raw count: load [kg] = raw / calibration_factor
+  }
+  return;
+#endif
+
   if (digitalRead(REC_PIN) == LOW && digitalRead(STOP_PIN) == HIGH) { // RECORD
     Serial.println(1000); // this is the 'RECORD' code: load measured will not approach 1000 kg, so this is a code (saves in complexity versus sensing both numerical and string data over serial to Python and parsing it)
     delay(2000);
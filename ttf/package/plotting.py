@@ -1,43 +1,57 @@
 # T. Atkins, 2024
+import os
+import sys
 import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
+from pathlib import Path
+from typing import Dict, List, Sequence
 
-plt.rc("text", usetex=True)
-font_properties = {"family": "serif"}
-plt.rc("font", **font_properties)
+# Repository root (for the shared 'analysis' package)
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from analysis.loading import load_frames
+from analysis.style import apply_profile, savefig
+
+# Render profile: 'draft' (mathtext, fast) unless PLOT_PROFILE=publication (usetex), see analysis/style.py
+apply_profile(family="serif")
+
+
+MODES = ["LOW", "MID", "HIGH", "VHIGH"]
+
+
+def ttf_files(loc: str, modes: Sequence[str] = MODES) -> List[str]:
+    """
+    FUNCTION
+    > Return the paths of the CSVs of the tests of every mode of 'modes' (e.g. so that a figure is only re-rendered when they change, see analysis/render.py)
+    """
+    return [os.path.join(loc, f"ttf{mode.upper()}.csv") for mode in modes]
 
 
 def _import(
     loc: str,
-    mode: str,
-) -> pd.DataFrame:
+    modes: Sequence[str],
+) -> Dict[str, pd.DataFrame]:
     """
     FUNCTION
-    > Import the requisite data for use in plotting()
+    > Import the requisite data for use in plotting(), i.e. the tests of every mode of 'modes'
+    > All files are read in parallel, and cached (see analysis.loading), so regenerating figures does not parse the CSVs again
     """
     # Input checks
-    mode = mode.upper()
-    if mode not in ["LOW", "MID", "HIGH", "VHIGH"]:
-        exit(
-            f"ERROR: Test mode '{mode}' not recognised: must be 'LOW', 'MID', 'HIGH' or 'VHIGH' (not case sensitive)."
-        )
+    modes = [mode.upper() for mode in modes]
+    for mode in modes:
+        if mode not in MODES:
+            exit(
+                f"ERROR: Test mode '{mode}' not recognised: must be 'LOW', 'MID', 'HIGH' or 'VHIGH' (not case sensitive)."
+            )
 
     # Setup
     LOAD_STR = "load"
 
-    # Import test data
-    file = f"{loc}\\\\ttf{mode}.csv"
-    df = pd.read_csv(
-        file,
-        names=[LOAD_STR],
-        usecols=[0],
-        dtype={LOAD_STR: float},
-    )
-    # Convert load from kilograms to Newtons
-    df[LOAD_STR] = df[LOAD_STR].apply(lambda x: x * 9.81)
+    # Import test data (NB: load is converted from kilograms to Newtons)
+    files = ttf_files(loc, modes)
+    dfs = load_frames(files, [LOAD_STR], to_newtons=[LOAD_STR])
 
-    return df
+    return dict(zip(modes, dfs))
 
 
 def _handlenodata(data: list) -> list:
@@ -76,26 +90,26 @@ def _gettxt(bars: plt.bar) -> None:
     return None
 
 
-def plotting(save: bool = False) -> None:
+def plotting(
+    save: bool = False, loc: str | None = None, save_dir: str | None = None
+) -> None:
     """
     FUNCTION
     > Plot pinch force load for each finger in a bar chart, comparing force for the 'LOW', 'MID' and 'HIGH' T-TF rig spacings
+    > 'loc' (optional) overrides the directory of the input data
+    > If 'save_dir' is given, the figure is saved there (only) and closed instead of being shown, e.g. for batch rendering (see analysis/render.py)
     """
     # Setup
     LOC = "[INSERT PATH TO DIRECTORY OF INPUT DATA HERE]"
+    if loc is not None:
+        LOC = loc
 
     # Data import
-    df_low = _import(LOC, "LOW")
-    low_vals = _handlenodata(df_low["load"].to_list())
-
-    df_mid = _import(LOC, "MID")
-    mid_vals = _handlenodata(df_mid["load"].to_list())
-
-    df_high = _import(LOC, "HIGH")
-    high_vals = _handlenodata(df_high["load"].to_list())
-
-    df_vhigh = _import(LOC, "VHIGH")
-    vhigh_vals = _handlenodata(df_vhigh["load"].to_list())
+    dfs = _import(LOC, MODES)
+    low_vals = _handlenodata(dfs["LOW"]["load"].to_list())
+    mid_vals = _handlenodata(dfs["MID"]["load"].to_list())
+    high_vals = _handlenodata(dfs["HIGH"]["load"].to_list())
+    vhigh_vals = _handlenodata(dfs["VHIGH"]["load"].to_list())
 
     # Bar chart setup
     n = len(low_vals)
@@ -151,13 +165,16 @@ def plotting(save: bool = False) -> None:
     ax.set_box_aspect(1)  # square aspect ratio
 
     # Save plot
-    if save:
+    FNAME = f"ttf"
+    FTYPE = "pdf"
+    if save_dir is not None:
+        savefig(fig, os.path.join(save_dir, f"{FNAME}.{FTYPE}"), bbox_inches="tight")
+        plt.close(fig)
+    elif save:
         SAVE_LOC1 = "[INSERT PATH TO A SAVE DIRECTORY HERE]"
         SAVE_LOC2 = "[INSERT PATH TO ANOTHER SAVE DIRECTORY HERE]"
-        FNAME = f"ttf"
-        FTYPE = "pdf"
-        fig.savefig(f"{SAVE_LOC1}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
-        fig.savefig(f"{SAVE_LOC2}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
+        savefig(fig, f"{SAVE_LOC1}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
+        savefig(fig, f"{SAVE_LOC2}\\\\{FNAME}.{FTYPE}", bbox_inches="tight")
         print(f"Figure {FNAME}.{FTYPE} saved.")
     else:
         plt.show()
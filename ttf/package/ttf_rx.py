@@ -2,26 +2,55 @@
 # NOTE: Close Arduino IDE Serial Monitor and any other applications communicating over COM ports before running
 
 import serial  # WARNING: refers to a package installed with 'pip install pyserial', NOT 'pip install serial'
-import numpy as np
+import sys
 from os import listdir
 from os.path import isfile, join
+from pathlib import Path
 
+# Repository root (for the shared 'acquisition' package)
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from acquisition.dsp import default_pipeline
+from acquisition.calibration import load_profile
+from acquisition.reader import acquire
+from acquisition.recorders import finger_recorder
+from acquisition.stream import Session
 
-def ttf_rx(mode: str):
+
+def ttf_rx(
+    mode: str,
+    raw: str | None = "npy",
+    port: str = "COM3",
+    rate: int = 9600,
+    protocol: str = "text",
+    live: bool = False,
+    dsp: bool = False,
+    cell: str | None = None,
+):
     """
     FUNCTION
     > Read data from sent over serial sent by an Arduino, in this case readouts from a load cell
     > Store retrieved data in a CSV upon receiving the code '1000'
     > Terminate test upon receiving the code '2000'
     > 'mode' indicates the spacing of the T-TF rig
+    > Every record point is written to the CSV as soon as it is taken, and (if 'raw') every load reading is also streamed to 'ttf[mode]_raw.[raw]' with its timestamp, so that no data is lost if the test is interrupted
+    > 'raw' is either 'npy' (compact binary log that can be opened as a memory map with acquisition.stream.load_raw()), 'csv' or None (no raw log)
+    > 'port' and 'rate' are those of the Arduino ('rate' must match the value in the Arduino code); to run several rigs from one process, see acquisition/service.py
+    > 'protocol' is that of the Arduino code: 'text' (default) or 'binary' (framed packets, when BINARY_PROTOCOL is set to 1 in the sketch; see acquisition/protocol.py)
+    > 'live' opens a live view of the force over the last seconds of the test while it runs (see acquisition/live.py)
+    > 'dsp' passes the readings through a signal processing stage (spike rejection, low-pass filter, drift compensation and plateau detection, see acquisition/dsp.py), so that every record point is the mean of the settled load rather than a single reading (the raw log still holds the readings as received)
+    > 'cell' (optional) is the name of the load cell, whose host-side calibration profile (see acquisition/calibration.py) is applied to every reading, in place of the calibration factor of the sketch alone
     """
     # Data storage setup
     FOLDER = "output/"
     mode = mode.upper()
     FNAME = f"ttf{mode}.csv"
     FFULL = FOLDER + FNAME
+    RAW_FNAME = f"ttf{mode}_raw"
+    RAW_FULL = FOLDER + RAW_FNAME
     files_lst = [f for f in listdir(FOLDER) if isfile(join(FOLDER, f))]
-    if FNAME in files_lst:  # overwrite protection
+    # NB: the raw log (if any) is protected as well as the summary CSV
+    outputs = [FNAME] + ([f"{RAW_FNAME}.{raw}"] if raw else [])
+    if any(f in files_lst for f in outputs):  # overwrite protection
         print("WARNING: Current output file name matches existing file.")
         proceed = input(
             "Type 'c' to continue and overwrite, or any other key to halt: "
@@ -30,38 +59,51 @@ def ttf_rx(mode: str):
             print("Execution halted to avoid overwrite.")
             exit()
 
-    store = np.zeros((50, 1))
-    idx = 0
+    if raw not in ["npy", "csv", None]:
+        exit(
+            f"ERROR: Raw log format '{raw}' not recognised: must be 'npy', 'csv' or None."
+        )
+
+    try:
+        calibration = load_profile(cell) if cell is not None else None
+    except ValueError as e:
+        exit(f"ERROR: {e}")
 
     # Communication with Arduino over serial
-    port = "COM3"  # change as needed
-    rate = 9600  # ensure this matches the value in the Arduino code
     arduino = serial.Serial(port=port, baudrate=rate, timeout=0.1)
-    readout_prev = 0.0
 
-    while True:
-        try:
-            data = arduino.readline().decode().strip()
-        except:
-            raise Exception("Issue with serial communication, re-run program.")
+    record = finger_recorder()
 
-        if data:
-            readout = float(data)
-            print(f"Raw: {readout}")
-            if readout == 1000:
-                # Record data point
-                store[idx] = abs(readout_prev)
-                print(f"Stored {readout_prev} kg for finger {idx+2}.")
-                idx += 1
-            elif readout == 2000:
-                # Save to CSV
-                store = store[~np.all(store == 0, axis=1)]  # remove trailing zeros
-                np.savetxt(FFULL, store, delimiter=",")
-                print(f"Test data stored in {FFULL}. Terminating test.")
-                break
-            else:
-                pass
-            readout_prev = readout  # this ensures that the codes ('1000' and '2000') are not stored as load data
+    session = Session(
+        FFULL,
+        record,
+        raw_file=f"{RAW_FULL}.{raw}" if raw else None,
+        dsp=default_pipeline() if dsp else None,
+    )
+    view = None
+    if live:
+        # NB: imported here, so that matplotlib is only loaded for a live view
+        from acquisition.live import LivePlot
+
+        view = LivePlot(FNAME)
+    try:
+        # A dedicated thread drains the serial port, while readings are parsed in batches and the status is printed at most once per second
+        stats = acquire(
+            arduino,
+            session.feed_many,
+            protocol=protocol,
+            live=view,
+            calibration=calibration,
+        )
+        print(f"Test data stored in {FFULL}. Terminating test.")
+        print(
+            f"{stats.samples} samples received, {stats.dropped_lines} line(s) dropped, {stats.gaps} gap(s)."
+        )
+    finally:
+        session.close()
+        arduino.close()
+        if view is not None:
+            view.close()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,5 @@
 # T. Atkins, 2024
 import sys
-from package.plotting import plotting
 
 
 def plotting_main(save: bool = False) -> None:
@@ -8,11 +7,15 @@ def plotting_main(save: bool = False) -> None:
     FUNCTION
     > Run plotting functions (located in the 'package' directory) based on user CLI input
     """
+    # NB: Imported here rather than at the top, so that pandas and matplotlib are only loaded once the command line has been read
+    from package.plotting import plotting
+
     plotting(save)
 
 
 if __name__ == "__main__":
     # The below allows for this function to be run from the command line with: 'python plotting_main.py [save]' ([save] is optional, default is False)
+    # Figures are drafted with mathtext by default; prefix the command with 'PLOT_PROFILE=publication' to typeset them with LaTeX as in the report (see analysis/style.py)
     try:
         SAVE = str(sys.argv[1])
         if SAVE == "y":